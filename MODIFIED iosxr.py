@@ -67,6 +67,86 @@ options:
     - name: ANSIBLE_IOSXR_COMMIT_COMMENT
     vars:
     - name: ansible_iosxr_commit_comment
+  capability_cache_dir:
+    type: path
+    description:
+    - Directory used to persist, per host, which commit forms (comment,
+      label, show-error, confirmed, replace), C(configure exclusive) and admin
+      mode the device accepted or rejected.
+    - C(commit), C(configure) and C(get_device_operations) use it to send a
+      supported command on the first try instead of failing and retrying.
+    - The profile is discarded when the C(network_os_version) reported by the
+      device changes. When not set, it is only kept for the lifetime of the
+      connection.
+    env:
+    - name: ANSIBLE_IOSXR_CAPABILITY_CACHE_DIR
+    vars:
+    - name: ansible_iosxr_capability_cache_dir
+  cli_mode_tracking:
+    type: boolean
+    default: false
+    description:
+    - Track the CLI mode (exec, config, config-exclusive, admin, admin-config)
+      from the commands the plugin sends, and use it in C(configure),
+      C(abort), C(set_cli_prompt_context) and batched sends instead of asking
+      the connection for the current prompt before every operation. The
+      prompts the commands return are not looked at.
+    - The mode is read from the prompt again after any command fails, and
+      after any command whose effect on the mode is not known, such as
+      C(exit), C(end) or an abbreviation of a mode changing command.
+    env:
+    - name: ANSIBLE_IOSXR_CLI_MODE_TRACKING
+    vars:
+    - name: ansible_iosxr_cli_mode_tracking
+  config_backend:
+    type: str
+    default: cli
+    choices:
+    - cli
+    - netconf
+    description:
+    - Transport of C(get_config), C(edit_config), C(commit) and
+      C(discard_changes).
+    - With C(netconf) the candidate is loaded with a single NETCONF
+      C(edit-config) to the candidate datastore and committed with a single
+      C(commit) RPC, through C(netconf_backend.py), instead of being sent to
+      the CLI line by line. Show commands and the other operations keep
+      using the CLI session.
+    - Requires C(netconf-yang agent ssh) on the device, see C(netconf_port).
+    env:
+    - name: ANSIBLE_IOSXR_CONFIG_BACKEND
+    vars:
+    - name: ansible_iosxr_config_backend
+  config_bulk_send:
+    type: boolean
+    default: false
+    description:
+    - Send the configuration lines passed to C(edit_config) to the device in a
+      single write instead of waiting for the prompt after every line.
+    - The reply is split back per line, so the response and any device error
+      are still reported for the line that caused it.
+    - Lines that expect an interactive prompt are always sent one at a time.
+    env:
+    - name: ANSIBLE_IOSXR_CONFIG_BULK_SEND
+    vars:
+    - name: ansible_iosxr_config_bulk_send
+  config_delta_push:
+    type: boolean
+    default: false
+    description:
+    - Compare the lines passed to C(edit_config) with the running config of
+      the device and only send the ones that would change it. When nothing
+      is left the device is not put in configuration mode and no commit is
+      made.
+    - The parsed running config is kept for the lifetime of the connection
+      and fetched again only when C(show configuration commit list 1)
+      reports a new commit.
+    - Lines whose effect cannot be resolved against the running config are
+      always sent. Not used for replace or admin mode edits.
+    env:
+    - name: ANSIBLE_IOSXR_CONFIG_DELTA_PUSH
+    vars:
+    - name: ansible_iosxr_config_delta_push
   config_commands:
     description:
     - Specifies a list of commands that can make configuration changes
@@ -88,6 +168,165 @@ options:
     - name: ANSIBLE_IOSXR_CONFIG_MODE_EXCLUSIVE
     vars:
     - name: ansible_iosxr_config_mode_exclusive
+  config_store_dir:
+    type: path
+    description:
+    - Directory of the config history store written by C(config_store.py).
+    - Required to restore a stored version with C(restore(version=...)).
+    env:
+    - name: ANSIBLE_IOSXR_CONFIG_STORE_DIR
+    vars:
+    - name: ansible_iosxr_config_store_dir
+  device_info_cache_dir:
+    type: path
+    description:
+    - Directory used to persist the facts collected by C(get_device_info),
+      one JSON file per host.
+    - A cached entry is reused as long as the last commit ID reported by
+      C(show configuration commit list 1), or the C(Last configuration change)
+      stamp when no commit is listed, is unchanged on the device.
+    - When not set, facts are only cached for the lifetime of the connection.
+    env:
+    - name: ANSIBLE_IOSXR_DEVICE_INFO_CACHE_DIR
+    vars:
+    - name: ansible_iosxr_device_info_cache_dir
+  metrics_file:
+    type: path
+    description:
+    - Append a JSON line to this file for every call of a cliconf method,
+      with its latency and the commands it sent, their latency and the bytes
+      sent and received. C(cliconf_metrics.py) aggregates the file into
+      per-host counters and latency histograms, as JSON lines or Prometheus
+      text.
+    - When not set, the plugin is not instrumented at all.
+    env:
+    - name: ANSIBLE_IOSXR_METRICS_FILE
+    vars:
+    - name: ansible_iosxr_metrics_file
+  netconf_port:
+    type: int
+    default: 830
+    description:
+    - Port of the NETCONF agent used when C(config_backend) is C(netconf).
+    env:
+    - name: ANSIBLE_IOSXR_NETCONF_PORT
+    vars:
+    - name: ansible_iosxr_netconf_port
+  netconf_transport:
+    type: str
+    default: ssh
+    choices:
+    - ssh
+    - tcp
+    description:
+    - Transport of the NETCONF session, the C(netconf) SSH subsystem, or plain
+      TCP for local stand-in agents such as the one of C(xr_emulator.py).
+    env:
+    - name: ANSIBLE_IOSXR_NETCONF_TRANSPORT
+    vars:
+    - name: ansible_iosxr_netconf_transport
+  output_spool_threshold:
+    type: int
+    description:
+    - Size in bytes past which C(run_commands) returns the reply of a command
+      as a C(SpooledOutput) of C(output_spool.py) instead of text. C(get)
+      does not use it, direct callers pass C(spool_threshold) instead. The reply
+      is moved to an unnamed temporary file once it grows past the threshold
+      and read back through mmap, as an iterator of lines (C(lines())) or of
+      records (C(records())), so the memory used per command stays around
+      the threshold.
+    - Read-only commands are written to the spool as they are received when
+      the connection supports it (C(cli_session.py), the emulator), other
+      replies are spooled once received. Smaller replies are returned as
+      text, as without the option.
+    - With C(parse_output), C(records()) of a spooled C(run_commands) reply
+      yields the parsed records of the commands known to the plugin.
+    - Meant for the lab scripts calling the Cliconf directly, a spooled reply
+      cannot be returned to an Ansible module.
+    env:
+    - name: ANSIBLE_IOSXR_OUTPUT_SPOOL_THRESHOLD
+    vars:
+    - name: ansible_iosxr_output_spool_threshold
+  parse_output:
+    type: boolean
+    default: false
+    description:
+    - Return the output of the show commands known to the plugin as a list of
+      records (or a single record for C(show version)) instead of text.
+    - Parsers are registered for C(show lldp neighbors), C(show version),
+      C(show inventory) and C(show ipv4 interface brief), including their
+      abbreviated forms; other commands are returned unchanged.
+    env:
+    - name: ANSIBLE_IOSXR_PARSE_OUTPUT
+    vars:
+    - name: ansible_iosxr_parse_output
+  session_pool_socket:
+    type: path
+    description:
+    - Unix socket of a running C(session_pool.py serve) broker.
+    - When set, the plugin leases a warm, already authenticated session to the
+      device from the broker instead of opening its own SSH session.
+    env:
+    - name: ANSIBLE_IOSXR_SESSION_POOL_SOCKET
+    vars:
+    - name: ansible_iosxr_session_pool_socket
+  run_commands_pipeline:
+    type: boolean
+    default: false
+    description:
+    - Send consecutive commands given to C(run_commands) in a single write and
+      split the combined reply back into one response per command, instead of
+      waiting for the prompt after each command.
+    - Intended for show commands, all commands of a batch are executed even
+      when one of them fails; with C(check_rc) the first failing command
+      still raises.
+    env:
+    - name: ANSIBLE_IOSXR_RUN_COMMANDS_PIPELINE
+    vars:
+    - name: ansible_iosxr_run_commands_pipeline
+  transcript_dir:
+    type: path
+    description:
+    - Directory of the per-host transcript files, C(<host>.transcript.jsonl),
+      used by C(transcript_mode).
+    env:
+    - name: ANSIBLE_IOSXR_TRANSCRIPT_DIR
+    vars:
+    - name: ansible_iosxr_transcript_dir
+  transcript_mode:
+    type: str
+    choices:
+    - record
+    - replay
+    description:
+    - With C(record), every command sent to the device is appended to the
+      transcript of the host with its response, error and resulting prompt.
+      Read commands already recorded with the same response are not written
+      again.
+    - With C(replay), the device is not contacted at all. Read commands
+      (C(show), C(terminal), C(dir), C(more)) are answered from the
+      transcript, from their latest recording, and any other command is
+      handled according to C(transcript_writes).
+    - Has no effect unless C(transcript_dir) is set.
+    env:
+    - name: ANSIBLE_IOSXR_TRANSCRIPT_MODE
+    vars:
+    - name: ansible_iosxr_transcript_mode
+  transcript_writes:
+    type: str
+    default: refuse
+    choices:
+    - refuse
+    - verify
+    description:
+    - How C(replay) handles commands that change the device, C(refuse) fails
+      them, C(verify) checks that they come in the order, and with the
+      prompts and answers, of the recorded session and returns the recorded
+      response, so a recorded configuration run can be replayed.
+    env:
+    - name: ANSIBLE_IOSXR_TRANSCRIPT_WRITES
+    vars:
+    - name: ansible_iosxr_transcript_writes
 """
 
 EXAMPLES = """
@@ -189,14 +428,25 @@ EXAMPLES = """
           - commit
 """
 
+import codecs
+import hashlib
 import json
+import os
 import re
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
 
 from ansible.errors import AnsibleConnectionFailure
-from ansible.module_utils._text import to_text
+from ansible.module_utils._text import to_bytes, to_text
 from ansible.module_utils.common._collections_compat import Mapping
 from ansible.module_utils.connection import ConnectionError
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.config import (
+    DEFAULT_COMMENT_TOKENS,
+    DEFAULT_IGNORE_LINES_RE,
+    ConfigLine,
     NetworkConfig,
     dumps,
 )
@@ -204,16 +454,1380 @@ from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.u
 from ansible_collections.ansible.netcommon.plugins.plugin_utils.cliconf_base import CliconfBase
 
 from ansible_collections.cisco.iosxr.plugins.module_utils.network.iosxr.iosxr import (
-    mask_config_blocks_from_diff,
+    CONFIG_BLOCKS_FORCED_IN_DIFF,
+    CONFIG_MISPLACED_CHILDREN,
     sanitize_config,
 )
 
 
+try:
+    from config_store import ConfigStore
+
+    HAS_CONFIG_STORE = True
+except ImportError:
+    HAS_CONFIG_STORE = False
+
+try:
+    from netconf_backend import NetconfBackend
+    from netconf_backend import connect as connect_netconf
+
+    HAS_NETCONF_BACKEND = True
+except ImportError:
+    HAS_NETCONF_BACKEND = False
+
+try:
+    from output_spool import SpooledOutput
+
+    HAS_OUTPUT_SPOOL = True
+except ImportError:
+    HAS_OUTPUT_SPOOL = False
+
+try:
+    from session_pool import PooledConnection
+
+    HAS_SESSION_POOL = True
+except ImportError:
+    HAS_SESSION_POOL = False
+
+
+# Inventory reported for XRd containers, which do not implement `show inventory`
+XRD_INVENTORY_FALLBACK = (
+    'NAME: "0/RP0", DESCR: "Cisco IOS-XRv 9000 Centralized Route Processor"\n'
+    "PID: R-IOSXRV9000-RP-C , VID: V01, SN: 123456789AB\n\n"
+    'NAME: "Rack 0", DESCR: "Cisco IOS-XRv 9000 Centralized Virtual Router"\n'
+    "PID: R-IOSXRV9000-CC   , VID: V01, SN: BA987654321"
+)
+
+MODEL_SEARCH_RE = [
+    re.compile(r"^[Cc]isco (.+) \(\) processor", re.M),
+    re.compile(r"^[Cc]isco ([A-Z0-9\-]+) processor", re.M),
+    re.compile(r"^[Cc]isco (.+) \(revision", re.M),
+    re.compile(r"^[Cc]isco (\S+ \S+).+bytes of .*memory", re.M),
+]
+
+# keywords of the commit command whose support is learned per device
+COMMIT_FORMS = ["replace", "confirmed", "label", "comment", "show-error"]
+
+CONFIG_MODES = ("config", "config-exclusive", "admin-config")
+
+PROMPT_MODE_RE = re.compile(r"(?:\([^\)]+\)){0,3}[>#]\s*$")
+COMMIT_ID_RE = re.compile(r"^\s*1\s+(\d+)\s", re.M)
+LAST_CHANGE_RE = re.compile(r"Last configuration change at (.+?)\s*$", re.M)
+
+
+def parse_device_info(version, inventory, hostname):
+    """Builds the device_info facts from the output of `show version`,
+    `show inventory` and `show running-config hostname`.
+    """
+    device_info = dict()
+    device_info["network_os"] = "iosxr"
+
+    match = re.search(r"Version (\S+)$", version, re.M)
+    if match:
+        device_info["network_os_version"] = match.group(1)
+    else:
+        match = re.search(r"Version (\S+ \S+)$", version, re.M)
+        if match:
+            device_info["network_os_version"] = match.group(1)
+
+    match = re.search(r'image file is "(.+)"', version)
+    if match:
+        device_info["network_os_image"] = match.group(1)
+
+    for regex in MODEL_SEARCH_RE:
+        match = regex.search(version)
+        if match:
+            device_info["network_os_model"] = match.group(1)
+            break
+    else:
+        match = re.search(r"DESCR: \"[Cc]isco (\S+ \S+)", inventory, re.M)
+        if match:
+            device_info["network_os_model"] = match.group(1)
+
+    match = re.search(r"SN: (\S+)\n\nNAME:", inventory, re.M)
+    if match:
+        device_info["network_os_serialnum"] = match.group(1)
+
+    match = re.search(r"hostname\s(\S+)$", hostname, re.M)
+    if match:
+        device_info["network_os_hostname"] = match.group(1)
+
+    return device_info
+
+
+def commit_keywords(command):
+    """Returns (column, keyword) of the COMMIT_FORMS keywords of a commit
+    command. The word after `label` and the rest of the line after
+    `comment` are values, even when they read as a keyword.
+    """
+    tokens = []
+    position = 0
+    value = False
+    for word in command.split():
+        position = command.index(word, position)
+        if value:
+            value = False
+        elif word in COMMIT_FORMS:
+            tokens.append((position, word))
+            if word == "comment":
+                break
+            value = word == "label"
+        position += len(word)
+    return tokens
+
+
+def rejected_keyword(command, output, keywords, prompt=""):
+    """Returns the last of ``keywords``, (column, keyword) tuples of
+    ``command``, at or before the '^' marker the CLI prints under the
+    rejected part of ``command``.
+
+    The marker column counts from the start of the terminal line, so the
+    prompt is subtracted unless the echoed command is found with it.
+    """
+    if "Invalid input detected" not in output:
+        return None
+    offset = len(prompt)
+    for line in output.splitlines():
+        if line.strip() == "^":
+            column = line.index("^") - offset
+            break
+        if line.rstrip().endswith(command) and len(line.rstrip()) > len(command):
+            offset = len(line.rstrip()) - len(command)
+    else:
+        return None
+    rejected = None
+    for position, word in keywords:
+        if position > column:
+            break
+        rejected = word
+    return rejected
+
+
+def cli_mode_from_prompt(prompt):
+    """Returns the CLI mode a prompt shows; configure exclusive cannot be
+    told from configure terminal by the prompt and is reported as config.
+    """
+    prompt = prompt.strip()
+    if prompt.endswith("(admin)#"):
+        return "admin"
+    if prompt.endswith(")#"):
+        return "admin-config" if "admin-" in prompt else "config"
+    return "exec"
+
+
+# commands that may change the CLI mode, in any abbreviation
+MODE_KEYWORDS = ("abort", "admin", "bash", "configure", "end", "exit", "run")
+
+
+def next_cli_mode(mode, command):
+    """Returns the CLI mode after ``command`` (lines joined by carriage
+    returns) was accepted in ``mode``, or None when it cannot be known
+    without looking at the prompt.
+    """
+    for line in command.split("\r"):
+        line = line.strip()
+        word = line.split()[0] if line else ""
+        if mode in CONFIG_MODES:
+            if line == "abort":
+                mode = "admin" if mode == "admin-config" else "exec"
+            elif line in ("end", "exit"):
+                # exit only leaves a sub-mode, unless at the top level
+                return None
+            elif len(word) > 1 and any(keyword.startswith(word) for keyword in ("abort", "end", "exit")):
+                return None
+        elif line in ("configure", "configure terminal", "conf t"):
+            mode = "admin-config" if mode == "admin" else "config"
+        elif line == "configure exclusive":
+            mode = "config-exclusive"
+        elif line == "admin":
+            mode = "admin"
+        elif line in ("end", "exit"):
+            if mode != "admin":
+                return None
+            mode = "exec"
+        elif word and any(keyword.startswith(word) for keyword in MODE_KEYWORDS):
+            return None
+    return mode
+
+
+def group_plain_commands(commands):
+    """Splits send_command keyword dicts into runs that can be sent as one
+    batch. Yields (True, [cmd, ...]) for two or more consecutive commands that
+    only carry a command string and (False, [cmd]) for any other command.
+    """
+    batch = []
+    for cmd in commands:
+        if set(cmd) == set(["command"]):
+            batch.append(cmd)
+            continue
+        for group in _flush_plain_commands(batch):
+            yield group
+        batch = []
+        yield False, [cmd]
+    for group in _flush_plain_commands(batch):
+        yield group
+
+
+def _flush_plain_commands(batch):
+    if len(batch) > 1:
+        yield True, batch
+    elif batch:
+        yield False, batch
+
+
+def config_change_marker(commit_list, running=""):
+    """Returns the last commit ID from `show configuration commit list 1`,
+    falling back to the `Last configuration change` stamp found in ``running``.
+    """
+    match = COMMIT_ID_RE.search(commit_list)
+    if match:
+        return "commit:%s" % match.group(1)
+    match = LAST_CHANGE_RE.search(running)
+    if match:
+        return "changed:%s" % match.group(1)
+    return None
+
+
+def frame_batch_reply(reply, commands, prompt_base):
+    """Splits the combined reply to a batch of ``commands`` into one output
+    per command, using the prompt and command echo that precede each of them.
+
+    Returns None while the final prompt of the batch has not been received.
+    """
+    prompt_re = re.compile(r"^%s(?:\([^\)]+\)){0,3}[>#] ?" % re.escape(prompt_base))
+    outputs = [[] for _ in commands]
+    index = 0
+    prompts = 0
+    echo_pending = True
+
+    for line in reply.splitlines():
+        match = prompt_re.match(line)
+        if match:
+            prompts += 1
+            line = line[match.end() :]
+            echo_pending = index + 1 < len(commands)
+            if echo_pending:
+                index += 1
+            if not line.strip():
+                continue
+        if echo_pending and line.strip() == commands[index]:
+            echo_pending = False
+            continue
+        echo_pending = False
+        outputs[index].append(line)
+
+    if prompts < len(commands):
+        return None
+    return ["\n".join(lines).strip() for lines in outputs]
+
+
+LLDP_NEIGHBOR_RE = re.compile(r"^(\S+)?\s+(\S+)\s+(\d+)\s+(\S+)\s+(\S+)\s*$")
+INVENTORY_NAME_RE = re.compile(r'^NAME: "([^"]*)",\s*DESCR: "([^"]*)"')
+INVENTORY_PID_RE = re.compile(r"^PID: ([^,]*?)\s*, VID: ([^,]*?)\s*, SN: (\S*)")
+INTERFACE_BRIEF_RE = re.compile(r"^(\S+)\s+(\S+)\s+(\S+)\s+(\S+)(?:\s+(\S+))?\s*$")
+ROUTE_RE = re.compile(r"^(\S+(?: \S+)?)\s+([0-9a-fA-F.:]+/\d+)\s+(.*?)\s*$")
+ROUTE_PATH_RE = re.compile(
+    r"^(?:\[(\d+)/(\d+)\] via (\S+?)|is directly connected)(?:, (\S+?))?(?:, (\S+?))?\s*$",
+)
+VERSION_FIELD_RE = {
+    "version": re.compile(r"Version\s+(\S+)", re.M),
+    "built_on": re.compile(r"^\s*Built On\s*:\s*(.+?)\s*$", re.M),
+    "label": re.compile(r"^\s*Label\s*:\s*(.+?)\s*$", re.M),
+    "model": re.compile(r"^[Cc]isco (.+?) (?:processor|\(revision|\(\))", re.M),
+    # XR 7 and later print `System uptime is`, without the hostname
+    "hostname": re.compile(r"^(?:System|(\S+)) uptime is (.+?)\s*$", re.M),
+}
+
+
+def output_lines(output):
+    """Returns the lines of ``output``, text or an iterable of lines such as
+    a SpooledOutput.
+    """
+    return output.splitlines() if isinstance(output, str) else output
+
+
+def parse_lldp_neighbors(output):
+    neighbors = []
+    device_id = None
+    in_table = False
+    for line in output_lines(output):
+        if line.startswith("Device ID"):
+            in_table = True
+            continue
+        if not in_table or not line.strip():
+            continue
+        if line.startswith("Total entries"):
+            break
+        match = LLDP_NEIGHBOR_RE.match(line)
+        if not match:
+            # device IDs too long for the column are printed on their own line
+            device_id = line.strip()
+            continue
+        neighbors.append(
+            {
+                "device_id": match.group(1) or device_id,
+                "local_interface": match.group(2),
+                "hold_time": int(match.group(3)),
+                "capability": match.group(4),
+                "port_id": match.group(5),
+            },
+        )
+        device_id = None
+    return neighbors
+
+
+def parse_version(output):
+    if not isinstance(output, str):
+        output = "\n".join(output)
+    version = {}
+    for key, regex in VERSION_FIELD_RE.items():
+        match = regex.search(output)
+        if match and match.group(1):
+            version[key] = match.group(1)
+    match = VERSION_FIELD_RE["hostname"].search(output)
+    if match:
+        version["uptime"] = match.group(2)
+    return version
+
+
+def parse_inventory(output):
+    inventory = []
+    for line in output_lines(output):
+        match = INVENTORY_NAME_RE.match(line)
+        if match:
+            inventory.append({"name": match.group(1), "descr": match.group(2)})
+            continue
+        match = INVENTORY_PID_RE.match(line)
+        if match and inventory:
+            inventory[-1].update(pid=match.group(1), vid=match.group(2), sn=match.group(3))
+    return inventory
+
+
+def parse_interface_brief(output):
+    interfaces = []
+    in_table = False
+    for line in output_lines(output):
+        if line.startswith("Interface"):
+            in_table = True
+            continue
+        match = INTERFACE_BRIEF_RE.match(line) if in_table else None
+        if match:
+            interfaces.append(
+                {
+                    "interface": match.group(1),
+                    "ip_address": match.group(2),
+                    "status": match.group(3),
+                    "protocol": match.group(4),
+                    "vrf": match.group(5),
+                },
+            )
+    return interfaces
+
+
+def iter_routes(lines):
+    """Yields a record per path of ``show route`` lines; the extra paths of
+    a multipath route are printed on their own lines below it.
+    """
+    route = None
+    for line in lines:
+        match = ROUTE_RE.match(line) if line[:1].strip() else None
+        if match:
+            route = {"code": match.group(1), "prefix": match.group(2)}
+            rest = match.group(3)
+        elif route is not None and line[:1] == " ":
+            rest = line.strip()
+        else:
+            route = None
+            continue
+        match = ROUTE_PATH_RE.match(rest)
+        if not match:
+            continue
+        distance, metric = match.group(1), match.group(2)
+        record = dict(route)
+        record.update(
+            distance=int(distance) if distance else 0,
+            metric=int(metric) if metric else 0,
+            next_hop=match.group(3),
+            age=match.group(4),
+            interface=match.group(5),
+        )
+        yield record
+
+
+def parse_route(output):
+    return list(iter_routes(output_lines(output)))
+
+
+def command_regex(*words):
+    """Compiles a regex matching the command made of ``words``, each of which
+    may be abbreviated down to two characters. A word may list alternatives
+    separated by ``|``.
+    """
+
+    def abbreviated(word):
+        optional = "".join("(?:%s" % re.escape(char) for char in word[2:])
+        return re.escape(word[:2]) + optional + ")?" * (len(word) - 2)
+
+    return re.compile(
+        r"^%s$"
+        % r"\s+".join(
+            "(?:%s)" % "|".join(abbreviated(alt) for alt in word.split("|")) for word in words
+        ),
+    )
+
+
+OUTPUT_PARSERS = [
+    (command_regex("show", "lldp", "neighbors"), parse_lldp_neighbors),
+    (command_regex("show", "version"), parse_version),
+    (command_regex("show", "inventory"), parse_inventory),
+    (command_regex("show", "ip|ipv4", "interface", "brief"), parse_interface_brief),
+    (command_regex("show", "route"), parse_route),
+]
+# parsers with a generator over lines, for outputs too large for a list
+RECORD_ITERATORS = {parse_route: iter_routes}
+
+PARSED_OUTPUT_CACHE_SIZE = 256
+_parsed_output_cache = OrderedDict()
+# guards the module-level caches, shared by the worker threads of fleet_exec
+_cache_lock = threading.Lock()
+
+
+def _cache_get(cache, key):
+    with _cache_lock:
+        value = cache.pop(key, None)
+        if value is not None:
+            cache[key] = value
+        return value
+
+
+def _cache_put(cache, key, value, size):
+    with _cache_lock:
+        cache.pop(key, None)
+        while len(cache) >= size:
+            cache.popitem(last=False)
+        cache[key] = value
+
+
+def find_output_parser(command):
+    command = " ".join(command.split()).lower()
+    for regex, parser in OUTPUT_PARSERS:
+        if regex.match(command):
+            return parser
+    return None
+
+
+def copy_records(parsed):
+    """Copies parsed output: a record or a list of records, all flat."""
+    if isinstance(parsed, dict):
+        return dict(parsed)
+    return [dict(record) for record in parsed]
+
+
+def parse_command_output(command, output):
+    """Returns the records parsed from the ``output`` of ``command``, or None
+    when no parser is registered for it. Results are memoized by output hash;
+    every caller gets its own copy, free to modify.
+    """
+    parser = find_output_parser(command)
+    if parser is None:
+        return None
+    key = (parser.__name__, hashlib.sha1(to_bytes(output, errors="surrogate_or_strict")).digest())
+    parsed = _cache_get(_parsed_output_cache, key)
+    if parsed is None:
+        parsed = parser(output)
+        _cache_put(_parsed_output_cache, key, parsed, PARSED_OUTPUT_CACHE_SIZE)
+    return copy_records(parsed)
+
+
+CONFIG_CHUNK_SIZE = 1 << 16
+
+CONFIG_ENTRY_RE = re.compile(r"([{};])")
+
+
+def iter_config_chunks(source, chunk_size=CONFIG_CHUNK_SIZE):
+    """Yields the text of ``source`` in chunks of at most ``chunk_size``
+    characters. ``source`` is a string, a file object or an iterable of
+    chunks; bytes are decoded as utf-8 with surrogateescape.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = [source]
+    elif isinstance(source, str):
+        for offset in range(0, len(source), chunk_size):
+            yield source[offset : offset + chunk_size]
+        return
+    elif hasattr(source, "read"):
+        source = iter(lambda read=source.read: read(chunk_size), source.read(0))
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="surrogateescape")
+    for chunk in source:
+        if isinstance(chunk, (bytes, bytearray)):
+            chunk = decoder.decode(chunk)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_config_lines(chunks):
+    """Yields the lines of the text in ``chunks``, the same as
+    ``"".join(chunks).split("\n")`` without joining them.
+    """
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    yield pending
+
+
+def sanitize_config_lines(lines):
+    """Streaming sanitize_config: moves the misplaced end-* lines under
+    their block, line by line.
+    """
+    for line in lines:
+        for regex in CONFIG_MISPLACED_CHILDREN:
+            match = regex.search(line)
+            if match and match.group(0):
+                line = "  " + match.group(0)
+        yield line
+
+
+def forced_block_ranges(candidate_lines):
+    """Returns the (start, end) line ranges of the RPL blocks of the
+    candidate, in the order mask_config_blocks_from_diff masks them.
+    """
+    ranges = []
+    for regex in CONFIG_BLOCKS_FORCED_IN_DIFF:
+        found = []
+        start_index = None
+        for index, line in enumerate(candidate_lines):
+            startre = regex["start"].search(line)
+            if startre and startre.group(0):
+                start_index = index
+            else:
+                endre = regex["end"].search(line)
+                # the upstream check skips a block starting on the first line
+                if endre and endre.group(0) and start_index:
+                    if all(start_index != prev_start for prev_start, _prev_end in found):
+                        found.append((start_index, index))
+        ranges.extend(found)
+    return ranges
+
+
+def _mask_blocks(conf_lines, candidate_lines, ranges, force_diff_prefix):
+    """mask_config_blocks_from_diff on a list of lines, in place. Returns the
+    ranges whose start line was found.
+    """
+    placed = []
+    for start, end in ranges:
+        if candidate_lines[start] not in conf_lines:
+            continue
+        placed.append((start, end))
+        run_conf_start_index = conf_lines.index(candidate_lines[start])
+        diff = False
+        for i in range(start, end + 1):
+            if conf_lines[run_conf_start_index] == candidate_lines[i]:
+                run_conf_start_index += 1
+            else:
+                diff = True
+                break
+        if diff:
+            run_conf_start_index = conf_lines.index(candidate_lines[start])
+            for i in range(start, end + 1):
+                conf_lines[run_conf_start_index] += force_diff_prefix
+                run_conf_start_index += 1
+    return placed
+
+
+def mask_config_lines(lines, candidate, force_diff_prefix):
+    """Streaming mask_config_blocks_from_diff.
+
+    Only the lines from an occurrence of a candidate block start line up to
+    the length of the longest block after it can be masked, so only those
+    runs of lines are buffered and masked together, in the upstream order;
+    every other line is passed through as it comes.
+    """
+    candidate_lines = candidate.split("\n")
+    pending = forced_block_ranges(candidate_lines)
+    if not pending:
+        for line in lines:
+            yield line
+        return
+
+    longest = max(end - start + 1 for start, end in pending)
+    # a masked line ends with the prefix, a start line with it would match
+    # the line it was masked from
+    triggers = set()
+    for start, _end in pending:
+        text = candidate_lines[start]
+        triggers.add(text)
+        while force_diff_prefix and text.endswith(force_diff_prefix):
+            text = text[: -len(force_diff_prefix)]
+            triggers.add(text)
+
+    window = []
+    until = 0
+    for line in lines:
+        if not pending:
+            yield line
+            continue
+        if line in triggers:
+            until = max(until, len(window) + longest)
+        if not window and not until:
+            yield line
+            continue
+        window.append(line)
+        if len(window) >= until:
+            placed = _mask_blocks(window, candidate_lines, pending, force_diff_prefix)
+            pending = [block for block in pending if block not in placed]
+            for masked in window:
+                yield masked
+            window, until = [], 0
+    if window:
+        _mask_blocks(window, candidate_lines, pending, force_diff_prefix)
+        for masked in window:
+            yield masked
+
+
+def parse_config_lines(lines, comment_tokens=None):
+    """NetworkConfig.parse over an iterable of lines; returns the ConfigLine
+    list without holding the text. ignore_line and the indent regexes are
+    inlined, with the same results.
+    """
+    tokens = tuple(comment_tokens or DEFAULT_COMMENT_TOKENS)
+    ignore_res = list(DEFAULT_IGNORE_LINES_RE)
+    ancestors = []
+    config = []
+    indents = [0]
+
+    for line in lines:
+        text = CONFIG_ENTRY_RE.sub("", line).strip()
+        if not text or text.startswith(tokens):
+            continue
+        for regex in ignore_res:
+            if regex.match(text):
+                break
+        else:
+            cfg = ConfigLine(line)
+
+            if not line[0].isspace():
+                ancestors = [cfg]
+                indents = [0]
+            else:
+                line_indent = len(line) - len(line.lstrip())
+                if line_indent < indents[-1]:
+                    while indents[-1] > line_indent:
+                        indents.pop()
+                if line_indent > indents[-1]:
+                    indents.append(line_indent)
+
+                curlevel = len(indents) - 1
+                cfg._parents = ancestors[:curlevel]
+                if curlevel > len(ancestors):
+                    config.append(cfg)
+                    continue
+                del ancestors[curlevel:]
+                ancestors.append(cfg)
+                ancestors[curlevel - 1].add_child(cfg)
+
+            config.append(cfg)
+    return config
+
+
+class ParsedConfig(object):
+    """Running configuration parsed like NetworkConfig, along with the
+    indexes config_difference needs to avoid scanning the item list per
+    lookup. ``contents`` is a string or an iterable of lines.
+    """
+
+    def __init__(self, contents, ignore_lines=None):
+        # registers the ignore_lines regexes the way NetworkConfig does
+        NetworkConfig(indent=1, ignore_lines=ignore_lines)
+        if isinstance(contents, str):
+            contents = iter_config_lines([contents])
+        self.items = parse_config_lines(contents, comment_tokens=["!"])
+        self.lines = set()
+        self.objects = {}
+        self._keywords = None
+        for item in self.items:
+            self.lines.add(item.line)
+            self.objects.setdefault(tuple(item.parents) + (item.text,), item)
+
+    @property
+    def keywords(self):
+        """(parents, first word) of every line, built on first use."""
+        if self._keywords is None:
+            self._keywords = set((key[:-1], key[-1].split()[0]) for key in self.objects)
+        return self._keywords
+
+    def get_block(self, path):
+        obj = self.objects.get(tuple(path))
+        return expand_block(obj) if obj else []
+
+
+RUNNING_CONFIG_CACHE_SIZE = 8
+_running_config_cache = OrderedDict()
+
+
+def _hashed_chunks(chunks, digest):
+    for chunk in chunks:
+        digest.update(to_bytes(chunk, errors="surrogate_or_strict"))
+        yield chunk
+
+
+def parse_running_config(running, candidate, ignore_lines=None):
+    """Returns the masked, sanitized and parsed running config, reusing a
+    previous parse of the same content when one is still cached.
+
+    ``running`` is a string, a file object or an iterable of chunks. It is
+    read in chunks and masked, sanitized and parsed in a single pass, so
+    only the parsed lines are held in memory. A string is hashed before
+    parsing to look up the cache; any other source is hashed while it is
+    read, and its parse cached for the next lookup of the same content.
+    """
+    candidate_lines = candidate.split("\n")
+    forced_blocks = any(
+        block["start"].search(line)
+        for block in CONFIG_BLOCKS_FORCED_IN_DIFF
+        for line in candidate_lines
+    )
+
+    def cache_key(digest):
+        if forced_blocks:
+            # masking depends on the RPL blocks present in the candidate
+            digest.update(b"\0" + to_bytes(candidate, errors="surrogate_or_strict"))
+        return (digest.hexdigest(), tuple(ignore_lines or ()))
+
+    digest = hashlib.sha1()
+    chunks = iter_config_chunks(running)
+    if isinstance(running, str):
+        for chunk in chunks:
+            digest.update(to_bytes(chunk, errors="surrogate_or_strict"))
+        key = cache_key(digest)
+        parsed = _cache_get(_running_config_cache, key)
+        chunks = iter_config_chunks(running)
+    else:
+        key = parsed = None
+        chunks = _hashed_chunks(chunks, digest)
+
+    if parsed is None:
+        lines = iter_config_lines(chunks)
+        if forced_blocks:
+            lines = mask_config_lines(lines, candidate, "ansible")
+        parsed = ParsedConfig(sanitize_config_lines(lines), ignore_lines)
+        _cache_put(_running_config_cache, key or cache_key(digest), parsed, RUNNING_CONFIG_CACHE_SIZE)
+    return parsed
+
+
+INTERFACE_LINE_RE = re.compile(
+    r"^(no\s+)?interface\s+(preconfigure\s+)?([A-Za-z][A-Za-z\-]*?)\s*(\d[\w/\.]*)(.*)$",
+)
+INTERFACE_TYPES = {
+    "gi": "GigabitEthernet",
+    "gigabitethernet": "GigabitEthernet",
+    "te": "TenGigE",
+    "tengige": "TenGigE",
+    "hu": "HundredGigE",
+    "hundredgige": "HundredGigE",
+    "mg": "MgmtEth",
+    "mgmteth": "MgmtEth",
+    "be": "Bundle-Ether",
+    "bundle-ether": "Bundle-Ether",
+    "lo": "Loopback",
+    "loopback": "Loopback",
+}
+
+
+def normalize_config_line(line):
+    """Spells the interface of an `interface ...` line the way the running
+    config does (gigabitEthernet 0/0/0/0 -> GigabitEthernet0/0/0/0).
+    """
+    match = INTERFACE_LINE_RE.match(line)
+    if not match or match.group(3).lower() not in INTERFACE_TYPES:
+        return line
+    negate, preconfigure, kind, number, rest = match.groups()
+    return "%sinterface %s%s%s%s" % (
+        "no " if negate else "",
+        "preconfigure " if preconfigure else "",
+        INTERFACE_TYPES[kind.lower()],
+        number,
+        rest,
+    )
+
+
+def _match_config_path(running, base, words, negate=False):
+    """Returns the running config path under ``base`` that the command
+    ``words`` refers to, splitting one-liners such as
+    `interface X lldp enable` along the hierarchy, or None.
+
+    For a negated command a line under ``base`` starting with the same
+    keyword is enough, since `no description` removes `description foo`.
+    """
+    text = " ".join(words)
+    if base + (text,) in running.objects:
+        return (text,)
+    parent_found = False
+    for size in range(len(words) - 1, 0, -1):
+        head = " ".join(words[:size])
+        if base + (head,) in running.objects:
+            parent_found = True
+            rest = _match_config_path(running, base + (head,), words[size:], negate)
+            if rest:
+                return (head,) + rest
+    if negate and not parent_found and (base, words[0]) in running.keywords:
+        return (text,)
+    return None
+
+
+def _opens_block(running, path):
+    """True when the running config line at ``path`` has lines below it."""
+    obj = running.objects.get(path)
+    return bool(obj and obj._children)
+
+
+def prune_candidate(lines, running):
+    """Drops the configuration ``lines`` (send_command dicts) that would not
+    change ``running``, a ParsedConfig, and returns the ones to send.
+
+    A command already present, or the removal of one that is not, is only
+    followed for the configuration mode it leaves the CLI in. Before the
+    next command that must be sent, `root` and the commands of the current
+    mode are replayed, so the command is applied in the same mode as in the
+    full candidate.
+
+    Commands are only looked up in their own mode: the one their
+    indentation places them in or, in a candidate without indentation, the
+    current mode. Like the CLI, an unindented command falls back to a
+    parent mode only when that mode has no command of the same keyword and
+    the command opens a block in the parent, such as the next `interface`
+    of a flat candidate. Commands below a mode missing from the running
+    config are always sent.
+    """
+    context = []  # (running config path, command, indentation) of the modes entered
+    device = []  # modes the device is known to be in, None when unknown
+    pruned = []
+    for line in lines:
+        text = line["command"].strip()
+        if not text or text == "!":
+            continue
+        if text in ("exit", "root"):
+            context = context[:-1] if text == "exit" else []
+            device = None
+            continue
+
+        words = normalize_config_line(text).split()
+        negate = words[0] == "no" and len(words) > 1
+        if negate:
+            words = words[1:]
+
+        indent = len(line["command"]) - len(line["command"].lstrip())
+        if indent or any(mode[2] for mode in context):
+            # the command is below the modes entered with less indentation
+            context = [mode for mode in context if mode[2] < indent]
+            levels = [len(context)]
+        else:
+            levels = range(len(context), -1, -1)
+
+        found = None
+        if len(line) == 1:
+            for level in levels:
+                base = tuple(part for path, _cmd, _indent in context[:level] for part in path)
+                path = _match_config_path(running, base, words, negate)
+                if path and (level == len(context) or _opens_block(running, base + path[:1])):
+                    found = (level, path)
+                    break
+                if (base, words[0]) in running.keywords:
+                    break
+            if found and not negate:
+                context = context[: found[0]] + [(found[1], text, indent)]
+                device = None
+                continue
+            base = tuple(part for path, _cmd, _indent in context for part in path)
+            if not found and negate and (not base or base in running.objects):
+                device = None
+                continue
+
+        if device != context:
+            if pruned and device != []:
+                pruned.append({"command": "root"})
+            pruned.extend({"command": cmd} for _path, cmd, _indent in context)
+        pruned.append(line)
+        if found:
+            context = context[: found[0]]
+        elif not negate:
+            context = context + [((" ".join(words),), text, indent)]
+        device = list(context)
+    return pruned
+
+
+def expand_block(obj, block=None, seen=None):
+    """Same as NetworkConfig._expand_block, with a set for the visited lines."""
+    if block is None:
+        block, seen = [], set()
+    block.append(obj)
+    seen.add(obj.line)
+    for child in obj._children:
+        if child.line not in seen:
+            expand_block(child, block, seen)
+    return block
+
+
+def config_difference(candidate, running, match="line", path=None, replace=None):
+    """Returns the same ConfigLine list as NetworkConfig.difference for
+    ``candidate`` (a NetworkConfig) against ``running`` (a ParsedConfig),
+    using set and dict lookups instead of list scans.
+    """
+    if path and match != "line":
+        other = running.get_block(path)
+    else:
+        other = running.items
+
+    if match == "line":
+        updates = [item for item in candidate.items if item.line not in running.lines]
+    elif match == "strict":
+        if other and other[0]._parents:
+            # NetworkConfig inserts the missing parents one by one at the head
+            other = [ConfigLine(p) for p in reversed(other[0].parents)] + other
+        updates = []
+        for index, line in enumerate(candidate.items):
+            if index >= len(other) or str(line).strip() != str(other[index]).strip():
+                updates.append(line)
+    elif match == "exact":
+        if len(other) != len(candidate.items) or any(
+            ours.line != theirs.line for ours, theirs in zip(candidate.items, other)
+        ):
+            updates = list(candidate.items)
+        else:
+            updates = []
+    else:
+        raise ValueError("unsupported diff match %s" % match)
+
+    if replace == "block":
+        parents = []
+        seen = set()
+        for item in updates:
+            if not item._parents:
+                parents.append(item)
+                seen.add(item.line)
+            else:
+                for p in item._parents:
+                    if p.line not in seen:
+                        parents.append(p)
+                        seen.add(p.line)
+
+        updates = []
+        for item in parents:
+            updates.extend(expand_block(item))
+
+    visited = set()
+    expanded = []
+
+    for curr_elem in updates:
+        add_parents = False
+        if expanded:
+            last_elem = expanded[-1]
+            if (
+                curr_elem._parents
+                and last_elem._parents
+                and curr_elem._parents[0].text != last_elem._parents[0].text
+            ):
+                add_parents = True
+            if last_elem._children and last_elem._children[0].text != curr_elem.text:
+                add_parents = True
+        for p in curr_elem._parents:
+            line = p.line
+            if line not in visited or add_parents:
+                visited.add(line)
+                expanded.append(p)
+        expanded.append(curr_elem)
+        visited.add(curr_elem.line)
+
+    return expanded
+
+
+# Cliconf methods timed when the metrics_file option is set
+INSTRUMENTED_METHODS = [
+    "get_device_info",
+    "get_config",
+    "edit_config",
+    "get",
+    "commit",
+    "discard_changes",
+    "run_commands",
+    "get_diff",
+    "restore",
+    "configure",
+    "abort",
+    "set_cli_prompt_context",
+]
+
+
+class RpcRecorder(object):
+    """Records the latency of the cliconf method calls of one host and of
+    the commands each of them sends, and appends one JSON line per call to
+    ``path``. Commands are attributed to the innermost method in progress.
+    """
+
+    def __init__(self, path, host):
+        self.path = path
+        self.host = host
+        self._calls = []
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            call = {"method": name, "commands": [], "prompts": 0}
+            if self._calls:
+                call["parent"] = self._calls[-1]["method"]
+            self._calls.append(call)
+            start = time.time()
+            call["error"] = True
+            try:
+                result = func(*args, **kwargs)
+                call["error"] = False
+                return result
+            finally:
+                call["seconds"] = round(time.time() - start, 6)
+                call["ts"] = round(start, 3)
+                call["host"] = self.host
+                self._calls.pop()
+                self._write(call)
+
+        return timed
+
+    def command(self, command, seconds, sent, received):
+        if self._calls:
+            self._calls[-1]["commands"].append([command, round(seconds, 6), sent, received])
+
+    def prompt(self):
+        if self._calls:
+            self._calls[-1]["prompts"] += 1
+
+    def _write(self, call):
+        line = to_bytes(json.dumps(call, sort_keys=True) + "\n")
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except (IOError, OSError):
+            # metrics must never fail the task they measure
+            pass
+
+
+class InstrumentedConnection(object):
+    """Connection wrapper reporting every send/receive/get_prompt to an
+    RpcRecorder. Everything else is answered by the wrapped connection.
+    """
+
+    def __init__(self, connection, recorder):
+        self._wrapped = connection
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    def send(self, command, **kwargs):
+        start = time.time()
+        response = None
+        try:
+            response = self._wrapped.send(command, **kwargs)
+            return response
+        finally:
+            self._recorder.command(
+                to_text(command, errors="surrogate_or_strict"),
+                time.time() - start,
+                len(command) + 1,
+                len(to_bytes(response)) if response else 0,
+            )
+
+    def receive(self, **kwargs):
+        start = time.time()
+        response = None
+        try:
+            response = self._wrapped.receive(**kwargs)
+            return response
+        finally:
+            self._recorder.command("<receive>", time.time() - start, 0, len(response or b""))
+
+    def get_prompt(self):
+        self._recorder.prompt()
+        return self._wrapped.get_prompt()
+
+
+TRANSCRIPT_READ_COMMANDS = ("show", "terminal", "dir", "more")
+
+
+def is_read_command(command):
+    """True when every line of ``command`` is a read-only command."""
+    return all(
+        not line.split() or line.split()[0] in TRANSCRIPT_READ_COMMANDS for line in command.split("\r")
+    )
+
+
+def transcript_key(command, kwargs):
+    """Identifies a send: the command and the arguments shaping its reply."""
+
+    def texts(value):
+        return [to_text(item, errors="surrogate_or_strict") for item in to_list(value)]
+
+    return json.dumps(
+        [
+            command,
+            texts(kwargs.get("prompt")),
+            texts(kwargs.get("answer")),
+            kwargs.get("strip_prompt", True),
+            bool(kwargs.get("sendonly")),
+        ],
+    )
+
+
+class TranscriptConnection(object):
+    """Connection wrapper recording the sends of a host to a JSON lines
+    transcript, or replaying them from it without contacting the device.
+
+    Each line is a send ({"key", "read", "response" or "error", "after"}, the
+    prompt that followed), a continuation read by ``receive`` ({"more"}), or
+    the prompt seen before the first send ({"prompt"}).
+    """
+
+    def __init__(self, connection, path, mode, writes="refuse"):
+        self._wrapped = connection
+        self._transcript_path = path
+        self._mode = mode
+        self._writes = writes
+        self._reads = {}
+        self._recorded_writes = []
+        self._recorded = set()
+        self._cursor = 0
+        self._prompt = None
+        self._more = []
+        self._last = None
+        self._skip_more = False
+        self._load()
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    @property
+    def connected(self):
+        return True if self._mode == "replay" else self._wrapped.connected
+
+    def _load(self):
+        try:
+            with open(self._transcript_path) as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            if self._mode == "replay":
+                raise AnsibleConnectionFailure("no transcript at %s to replay" % self._transcript_path)
+            return
+        entry = None
+        for line in lines:
+            if not line.strip():
+                continue
+            self._recorded.add(line.strip())
+            item = json.loads(line)
+            if "more" in item:
+                if entry is not None:
+                    entry["more"].append(item["more"])
+            elif "prompt" in item:
+                if self._prompt is None:
+                    self._prompt = item["prompt"]
+            else:
+                entry = dict(item, more=[])
+                if entry["read"]:
+                    self._reads[entry["key"]] = entry
+                else:
+                    self._recorded_writes.append(entry)
+
+    def send(self, command, **kwargs):
+        text = to_text(command, errors="surrogate_or_strict")
+        key = transcript_key(text, kwargs)
+        read = is_read_command(text)
+        if self._mode == "replay":
+            return self._replay(text, key, read)
+
+        entry = {"key": key, "read": read}
+        try:
+            response = self._wrapped.send(command, **kwargs)
+            if response is not None:
+                entry["response"] = to_text(response, errors="surrogate_or_strict")
+            return response
+        except AnsibleConnectionFailure as exc:
+            entry["error"] = to_text(exc, errors="surrogate_or_strict")
+            raise
+        finally:
+            entry["after"] = to_text(self._wrapped.get_prompt(), errors="surrogate_or_strict")
+            self._last = entry
+            self._skip_more = not self._write(entry, dedupe=read)
+
+    def receive(self, **kwargs):
+        if self._mode == "replay":
+            if not self._more:
+                raise AnsibleConnectionFailure("no further output recorded in %s" % self._transcript_path)
+            return to_bytes(self._more.pop(0), errors="surrogate_or_strict")
+        response = self._wrapped.receive(**kwargs)
+        if not self._skip_more:
+            self._write({"more": to_text(response, errors="surrogate_or_strict")})
+        return response
+
+    def get_prompt(self):
+        if self._mode == "replay":
+            return to_bytes(self._prompt or "", errors="surrogate_or_strict")
+        prompt = self._wrapped.get_prompt()
+        if self._last is None and self._prompt is None:
+            self._prompt = to_text(prompt, errors="surrogate_or_strict")
+            self._write({"prompt": self._prompt}, dedupe=True)
+        return prompt
+
+    def _update_cli_prompt_context(self, config_context=None, exit_command="exit"):
+        if self._mode != "replay":
+            self._wrapped._update_cli_prompt_context(config_context=config_context, exit_command=exit_command)
+
+    def _replay(self, command, key, read):
+        if read:
+            entry = self._reads.get(key)
+            if entry is None:
+                raise AnsibleConnectionFailure(
+                    "%s was not recorded in %s" % (command, self._transcript_path),
+                )
+        elif self._writes != "verify":
+            raise AnsibleConnectionFailure("%s: commands changing the device are refused in replay mode" % command)
+        else:
+            entry = None
+            if self._cursor < len(self._recorded_writes):
+                entry = self._recorded_writes[self._cursor]
+            if entry is None or entry["key"] != key:
+                raise AnsibleConnectionFailure(
+                    "%s differs from the recorded session, which sent %s"
+                    % (command, json.loads(entry["key"])[0] if entry else "nothing more"),
+                )
+            self._cursor += 1
+
+        self._prompt = entry.get("after", self._prompt)
+        self._more = list(entry["more"])
+        if "error" in entry:
+            raise AnsibleConnectionFailure(entry["error"])
+        return entry.get("response")
+
+    def _write(self, item, dedupe=False):
+        """Appends ``item`` to the transcript; returns False when it was
+        already recorded and ``dedupe`` is set.
+        """
+        line = json.dumps(item, sort_keys=True)
+        if dedupe and line in self._recorded:
+            return False
+        self._recorded.add(line)
+        directory = os.path.dirname(self._transcript_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd = os.open(self._transcript_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, to_bytes(line + "\n"))
+        finally:
+            os.close(fd)
+        return True
+
+
 class Cliconf(CliconfBase):
     def __init__(self, *args, **kwargs):
         self._device_info = {}
+        self._running_config = None
+        self._capabilities = None
+        self._cli_mode = None
+        self._prompt_base = None
+        self._netconf = None
         super(Cliconf, self).__init__(*args, **kwargs)
 
+    def set_options(self, task_keys=None, var_options=None, direct=None):
+        super(Cliconf, self).set_options(task_keys=task_keys, var_options=var_options, direct=direct)
+        self._attach_session_pool()
+        self._attach_transcript()
+        self._attach_metrics()
+
+    def _attach_session_pool(self):
+        """Routes the CLI calls through a session leased from the local
+        session pool instead of dialing the device from this connection.
+        """
+        socket_path = self.get_option("session_pool_socket")
+        if not socket_path or getattr(self._connection, "_socket_path", None) == socket_path:
+            return
+        if not HAS_SESSION_POOL:
+            raise AnsibleConnectionFailure(
+                "session_pool_socket requires session_pool.py to be importable",
+            )
+        self._connection = PooledConnection(self._connection, socket_path)
+
+    def _attach_transcript(self):
+        """Records the sends of the host to its transcript, or replays them
+        from it, when transcript_dir and transcript_mode are set.
+        """
+        directory = self.get_option("transcript_dir")
+        mode = self.get_option("transcript_mode")
+        if not directory or not mode or getattr(self._connection, "_transcript_path", None):
+            return
+        self._connection = TranscriptConnection(
+            self._connection,
+            self._host_cache_file(directory, ".transcript.jsonl"),
+            mode,
+            self.get_option("transcript_writes"),
+        )
+
+    def _attach_metrics(self):
+        """Wraps the connection and the public methods in an RpcRecorder.
+        Nothing is wrapped, and nothing costs anything, unless metrics_file
+        is set.
+        """
+        path = self.get_option("metrics_file")
+        if not path or isinstance(self._connection, InstrumentedConnection):
+            return
+        recorder = RpcRecorder(path, self._connection.get_option("host"))
+        self._connection = InstrumentedConnection(self._connection, recorder)
+        for name in INSTRUMENTED_METHODS:
+            setattr(self, name, recorder.wrap(name, getattr(self, name)))
+
+    def send_command(
+        self,
+        command=None,
+        prompt=None,
+        answer=None,
+        sendonly=False,
+        newline=True,
+        prompt_retry_check=False,
+        check_all=False,
+        strip_prompt=True,
+    ):
+        try:
+            response = super(Cliconf, self).send_command(
+                command=command,
+                prompt=prompt,
+                answer=answer,
+                sendonly=sendonly,
+                newline=newline,
+                prompt_retry_check=prompt_retry_check,
+                check_all=check_all,
+                strip_prompt=strip_prompt,
+            )
+        except AnsibleConnectionFailure:
+            self._cli_mode = self._prompt_base = None
+            raise
+        if self._cli_mode is not None:
+            self._cli_mode = None if sendonly else next_cli_mode(self._cli_mode, to_text(command))
+        return response
+
+    def _get_cli_mode(self):
+        """Returns the CLI mode, from the tracked state when cli_mode_tracking
+        is enabled and the mode is known, otherwise from the prompt.
+        """
+        if self._cli_mode is None:
+            prompt = to_text(self._connection.get_prompt(), errors="surrogate_or_strict")
+            if not self.get_option("cli_mode_tracking"):
+                return cli_mode_from_prompt(prompt)
+            self._cli_mode = cli_mode_from_prompt(prompt)
+        return self._cli_mode
+
     def get_command_output(self, command):
         reply = self.get(command)
         data = to_text(reply, errors="surrogate_or_strict").strip()
@@ -221,84 +1835,246 @@ class Cliconf(CliconfBase):
 
     def get_device_info(self):
         if not self._device_info:
-            device_info = dict()
-            device_info["network_os"] = "iosxr"
-            data = self.get_command_output("show version | utility head -n 20")
-            match = re.search(r"Version (\S+)$", data, re.M)
-            if match:
-                device_info["network_os_version"] = match.group(1)
-            else:
-                match = re.search(r"Version (\S+ \S+)$", data, re.M)
-                if match:
-                    device_info["network_os_version"] = match.group(1)
-
-            match = re.search(r'image file is "(.+)"', data)
-            if match:
-                device_info["network_os_image"] = match.group(1)
-
-            model_search_strs = [
-                r"^[Cc]isco (.+) \(\) processor",
-                r"^[Cc]isco ([A-Z0-9\-]+) processor",
-                r"^[Cc]isco (.+) \(revision",
-                r"^[Cc]isco (\S+ \S+).+bytes of .*memory",
+            cache_dir = self.get_option("device_info_cache_dir")
+            commands = [
+                "show version | utility head -n 20",
+                "show inventory",
+                "show running-config hostname",
             ]
-            for item in model_search_strs:
-                match = re.search(item, data, re.M)
-                if match:
-                    device_info["network_os_model"] = match.group(1)
-                    break
+            marker = None
 
-            if "network_os_model" not in device_info:
-                #data = self.get_command_output("show inventory")
-                try:
-	                data = self.get_command_output("show inventory")
-                except:
-	                data = 'NAME: "0/RP0", DESCR: "Cisco IOS-XRv 9000 Centralized Route Processor"\nPID: R-IOSXRV9000-RP-C , VID: V01, SN: 123456789AB\n\nNAME: "Rack 0", DESCR: "Cisco IOS-XRv 9000 Centralized Virtual Router"\nPID: R-IOSXRV9000-CC   , VID: V01, SN: BA987654321'
+            if cache_dir:
+                commit_list, hostname = self._send_batch(
+                    ["show configuration commit list 1", "show running-config hostname"],
+                )
+                marker = config_change_marker(commit_list[0], hostname[0])
+                device_info = self._load_cached_device_info(cache_dir, marker)
+                if device_info:
+                    self._device_info = device_info
+                    return self._device_info
+                commands.pop()
+                replies = self._send_batch(commands) + [hostname]
+            else:
+                replies = self._send_batch(commands)
 
+            version, inventory, hostname = [reply[0] for reply in replies]
+            if replies[1][1]:
+                inventory = XRD_INVENTORY_FALLBACK
 
-                match = re.search(r"DESCR: \"[Cc]isco (\S+ \S+)", data, re.M)
-                if match:
-                    device_info["network_os_model"] = match.group(1)
+            self._device_info = parse_device_info(version, inventory, hostname)
+            if cache_dir and marker:
+                self._store_cached_device_info(cache_dir, marker, self._device_info)
 
-            #data = self.get_command_output("show inventory")
-            try:
-                data = self.get_command_output("show inventory")
-            except:
-                data = 'NAME: "0/RP0", DESCR: "Cisco IOS-XRv 9000 Centralized Route Processor"\nPID: R-IOSXRV9000-RP-C , VID: V01, SN: 123456789AB\n\nNAME: "Rack 0", DESCR: "Cisco IOS-XRv 9000 Centralized Virtual Router"\nPID: R-IOSXRV9000-CC   , VID: V01, SN: BA987654321'
+        return self._device_info
 
+    def _host_cache_file(self, cache_dir, suffix=".json"):
+        host = self._connection.get_option("host")
+        return os.path.join(cache_dir, re.sub(r"[^\w\-\.]", "_", host) + suffix)
+
+    def _load_cached_device_info(self, cache_dir, marker):
+        if not marker:
+            return None
+        try:
+            with open(self._host_cache_file(cache_dir)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get("marker") != marker:
+            return None
+        self._connection.queue_message("vvvv", "device_info cache hit (%s)" % marker)
+        return entry.get("device_info")
+
+    def _store_cached_device_info(self, cache_dir, marker, device_info):
+        self._write_host_cache(
+            cache_dir,
+            self._host_cache_file(cache_dir),
+            {"marker": marker, "device_info": device_info},
+        )
 
+    def _write_host_cache(self, cache_dir, path, entry):
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except (IOError, OSError) as exc:
+            self._connection.queue_message(
+                "warning",
+                "unable to write cache %s: %s" % (path, to_text(exc)),
+            )
 
-            match = re.search(r"SN: (\S+)\n\nNAME:", data, re.M)
-            if match:
-                device_info["network_os_serialnum"] = match.group(1)
+    def _capability_profile(self):
+        """Returns {capability: accepted} learned for this device, loaded
+        from capability_cache_dir when it was recorded for the same
+        network_os_version.
+        """
+        if self._capabilities is None:
+            version = self.get_device_info().get("network_os_version")
+            profile = {}
+            cache_dir = self.get_option("capability_cache_dir")
+            if cache_dir:
+                try:
+                    with open(self._host_cache_file(cache_dir, ".capabilities.json")) as f:
+                        entry = json.load(f)
+                    if entry.get("network_os_version") == version:
+                        profile = entry.get("capabilities") or {}
+                except (IOError, OSError, ValueError):
+                    pass
+            self._capabilities = {"network_os_version": version, "capabilities": profile}
+        return self._capabilities["capabilities"]
 
-            hostname = self.get_command_output("show running-config hostname")
-            match = re.search(r"hostname\s(\S+)$", hostname, re.M)
-            if match:
-                device_info["network_os_hostname"] = match.group(1)
+    def _loaded_capability_profile(self):
+        """Returns the capability profile when reading it costs no round
+        trip to the device (it is loaded, or the device info is known),
+        otherwise an empty one.
+        """
+        if self._capabilities is None and not self._device_info:
+            return {}
+        return self._capability_profile()
+
+    def _learn_capability(self, name, accepted):
+        if self._capabilities is None and not self._device_info:
+            # the profile is recorded per network_os_version, which cannot
+            # be read from configuration mode
+            return
+        profile = self._capability_profile()
+        if profile.get(name) == accepted:
+            return
+        profile[name] = accepted
+        cache_dir = self.get_option("capability_cache_dir")
+        if cache_dir:
+            self._write_host_cache(
+                cache_dir,
+                self._host_cache_file(cache_dir, ".capabilities.json"),
+                self._capabilities,
+            )
 
-            self._device_info = device_info
+    def _send_batch(self, commands):
+        """Writes ``commands`` to the device in a single exchange and splits
+        the combined reply back into one (output, failed) tuple per command.
 
-        return self._device_info
+        Error detection on the connection is suspended while the batch is in
+        flight, so a failing command cannot leave the output of the commands
+        after it unread; each framed output is matched against the terminal
+        error regexes instead.
+        """
+        commands = [to_text(cmd, errors="surrogate_or_strict").strip() for cmd in commands]
+        connection = self._connection
+        stderr_re = list(getattr(connection, "_terminal_stderr_re", None) or [])
+        stderr_option = connection.get_option("terminal_stderr_re")
+        prompt_base = self._prompt_base
+        if prompt_base is None:
+            prompt = to_text(connection.get_prompt(), errors="surrogate_or_strict").strip()
+            prompt_base = PROMPT_MODE_RE.sub("", prompt)
+            if self.get_option("cli_mode_tracking"):
+                # the device part of the prompt only changes with the
+                # hostname, so it is kept until the next commit or error
+                self._prompt_base = prompt_base
+
+        before = self._cli_mode
+        connection.set_option("terminal_stderr_re", [{"pattern": "(?!)"}])
+        try:
+            reply = to_text(
+                self.send_command(command="\r".join(commands), strip_prompt=False),
+                errors="surrogate_or_strict",
+            )
+            outputs = frame_batch_reply(reply, commands, prompt_base)
+            while outputs is None:
+                # the reply was cut at an intermediate prompt, keep reading
+                # until the prompt following the last command shows up
+                more = connection.receive(strip_prompt=False)
+                reply += "\n" + to_text(more, errors="surrogate_or_strict")
+                outputs = frame_batch_reply(reply, commands, prompt_base)
+        finally:
+            connection.set_option("terminal_stderr_re", stderr_option)
+
+        results = [
+            (out, any(regex.search(to_bytes(out)) for regex in stderr_re)) for out in outputs
+        ]
+        if self._cli_mode is not None:
+            # send_command assumed every command of the batch was accepted
+            mode = before
+            for command, (_out, failed) in zip(commands, results):
+                if mode is not None and not failed:
+                    mode = next_cli_mode(mode, command)
+            self._cli_mode = mode
+        return results
 
     def configure(self, admin=False, exclusive=False):
-        prompt = to_text(self._connection.get_prompt(), errors="surrogate_or_strict").strip()
-        if not prompt.endswith(")#"):
-            if admin and "admin-" not in prompt:
-                self.send_command("admin")
+        mode = self._get_cli_mode()
+        if mode not in CONFIG_MODES:
+            # the show commands of get_device_info are rejected in
+            # configuration mode, the profile commit uses is loaded first
+            self._capability_profile()
+            if admin and mode != "admin":
+                self._send_learned_command("admin", "admin")
             if exclusive or self.get_option("config_mode_exclusive"):
-                self.send_command("configure exclusive")
-                return
+                if self._capability_profile().get("config_exclusive") is not False:
+                    try:
+                        self._send_learned_command("configure exclusive", "config_exclusive")
+                        return
+                    except AnsibleConnectionFailure:
+                        if self._capability_profile().get("config_exclusive") is not False:
+                            raise
+                self._connection.queue_message(
+                    "warning",
+                    "configure exclusive is not supported by the device, using configure terminal",
+                )
             self.send_command("configure terminal")
 
+    def _send_learned_command(self, command, capability):
+        """Sends ``command`` unless the device is known to reject it, and
+        records whether it was accepted.
+        """
+        if self._capability_profile().get(capability) is False:
+            raise AnsibleConnectionFailure(
+                "%s is not supported by the device (network_os_version %s)"
+                % (command, self._capabilities["network_os_version"]),
+            )
+        try:
+            self.send_command(command)
+        except AnsibleConnectionFailure as exc:
+            if "Invalid input detected" in to_text(exc, errors="surrogate_or_strict"):
+                self._learn_capability(capability, False)
+            raise
+        self._learn_capability(capability, True)
+
     def abort(self, admin=False):
-        prompt = to_text(self._connection.get_prompt(), errors="surrogate_or_strict").strip()
-        if prompt.endswith(")#"):
+        mode = self._get_cli_mode()
+        if mode in CONFIG_MODES:
             self.send_command("abort")
-            if admin and "admin-" in prompt:
+            if admin and mode == "admin-config":
                 self.send_command("exit")
 
+    def _netconf_backend(self):
+        """Returns the NetconfBackend of the host when config_backend is
+        netconf, opening its session on first use, or None.
+        """
+        if self.get_option("config_backend") != "netconf":
+            return None
+        if self._netconf is None:
+            if not HAS_NETCONF_BACKEND:
+                raise AnsibleConnectionFailure(
+                    "config_backend netconf requires netconf_backend.py to be importable",
+                )
+            connection = self._connection
+            self._netconf = NetconfBackend(
+                connect_netconf(
+                    connection.get_option("host"),
+                    port=self.get_option("netconf_port"),
+                    username=connection.get_option("remote_user"),
+                    password=connection.get_option("password"),
+                    transport=self.get_option("netconf_transport"),
+                ),
+            )
+        return self._netconf
+
     def get_config(self, source="running", flags=None, format="text"):
+        netconf = self._netconf_backend()
+        if netconf is not None:
+            return netconf.get_config(source=source, flags=to_list(flags), format=format)
+
         if source not in ["running"]:
             raise ValueError("fetching configuration from %s is not supported" % source)
 
@@ -322,23 +2098,51 @@ class Cliconf(CliconfBase):
         label=None,
     ):
         operations = self.get_device_operations()
+        if comment and not operations["supports_commit_comment"]:
+            self._connection.queue_message(
+                "warning",
+                "value of comment option '%s' is ignored as it in not supported by IOSXR" % comment,
+            )
+            comment = None
         self.check_edit_config_capability(operations, candidate, commit, replace, comment)
 
+        netconf = self._netconf_backend()
+        if netconf is not None:
+            return self._netconf_edit_config(netconf, candidate, commit, replace, diff, comment, admin, exclusive, label)
+
         resp = {}
         results = []
         requests = []
 
-        self.configure(admin=admin, exclusive=exclusive)
-
         if replace:
             candidate = "load {0}".format(replace)
 
+        lines = []
         for line in to_list(candidate):
             if not isinstance(line, Mapping):
                 line = {"command": line}
-            cmd = line["command"]
-            results.append(self.send_command(**line))
-            requests.append(cmd)
+            lines.append(line)
+
+        if self.get_option("config_delta_push") and not replace and not admin:
+            lines = prune_candidate(lines, self._cached_running_config())
+            if not lines:
+                self._connection.queue_message(
+                    "vvvv",
+                    "edit_config: candidate already present in the running config",
+                )
+                return {"request": [], "response": [], "show_commit_config_diff": ""}
+
+        self.configure(admin=admin, exclusive=exclusive)
+
+        if self.get_option("config_bulk_send"):
+            for cmd, out in self._send_config_bulk(lines):
+                results.append(out)
+                requests.append(cmd)
+        else:
+            for line in lines:
+                cmd = line["command"]
+                results.append(self.send_command(**line))
+                requests.append(cmd)
 
         # Before any commit happened, we can get a real configuration
         # diff from the device and make it available by the iosxr_config module.
@@ -371,7 +2175,86 @@ class Cliconf(CliconfBase):
         resp["response"] = results
         return resp
 
-    def restore(self, filename=None, path=""):
+    def _netconf_edit_config(self, netconf, candidate, commit, replace, diff, comment, admin, exclusive, label):
+        """edit_config over NETCONF: the whole candidate in one edit-config
+        and, when committing, one commit RPC. ``replace`` names a file on the
+        device for the CLI and is not available here; replace=True replaces
+        the running config with the candidate.
+        """
+        if admin:
+            raise ValueError("admin configuration is not supported over NETCONF")
+        if not isinstance(replace, (bool, type(None))):
+            raise ValueError("replace from a file is not supported over NETCONF")
+        self._warn_netconf_ignored(comment=comment, label=label)
+
+        lines = [line if isinstance(line, Mapping) else {"command": line} for line in to_list(candidate)]
+        if self.get_option("config_delta_push") and not replace:
+            lines = prune_candidate(lines, self._cached_running_config())
+            if not lines:
+                return {"request": [], "response": [], "show_commit_config_diff": ""}
+
+        result = netconf.edit_config(
+            [line["command"] for line in lines],
+            commit=commit,
+            replace=bool(replace),
+            exclusive=exclusive or self.get_option("config_mode_exclusive"),
+            diff=diff,
+            confirm_timeout=self._netconf_confirm_timeout(),
+        )
+        return {
+            "request": [line["command"] for line in lines],
+            "response": result["response"],
+            "show_commit_config_diff": result["diff"],
+        }
+
+    def _warn_netconf_ignored(self, **options):
+        for name, value in sorted(options.items()):
+            if value:
+                self._connection.queue_message(
+                    "warning",
+                    "value of %s option '%s' is ignored over NETCONF" % (name, value),
+                )
+
+    def _netconf_confirm_timeout(self):
+        if not self.get_option("commit_confirmed"):
+            return None
+        # the confirm-timeout default of RFC 6241
+        return self.get_option("commit_confirmed_timeout") or 600
+
+    def _cached_running_config(self):
+        """Returns the parsed running config, fetching it again only when
+        the device reports a commit newer than the cached copy.
+        """
+        commit_list = self.send_command("show configuration commit list 1")
+        marker = config_change_marker(to_text(commit_list, errors="surrogate_or_strict"))
+        if marker is None or self._running_config is None or self._running_config[0] != marker:
+            running = to_text(self.get_config(), errors="surrogate_or_strict")
+            self._running_config = (marker, parse_running_config(running, ""))
+        return self._running_config[1]
+
+    def _send_config_bulk(self, lines):
+        """Sends consecutive plain configuration lines as one batch.
+
+        Lines that carry a prompt/answer (or any other send_command argument)
+        are sent on their own so the interactive dialogue is handled as usual.
+        Returns a list of (command, response) tuples in candidate order and
+        raises on the first line the device rejected.
+        """
+        responses = []
+        for batched, group in group_plain_commands(lines):
+            if not batched:
+                responses.append((group[0]["command"], self.send_command(**group[0])))
+                continue
+            cmds = [line["command"] for line in group]
+            for cmd, (out, failed) in zip(cmds, self._send_batch(cmds)):
+                if failed:
+                    raise AnsibleConnectionFailure("%s\n%s" % (cmd, out))
+                responses.append((cmd, out))
+        return responses
+
+    def restore(self, filename=None, path="", version=None, host=None):
+        if version is not None:
+            return self._restore_stored_version(version, host)
         if not filename:
             raise ValueError("'file_name' value is required for restore")
         self.configure()
@@ -380,6 +2263,39 @@ class Cliconf(CliconfBase):
         self.commit()
         return resp
 
+    def _restore_stored_version(self, version, host=None):
+        """Replaces the running config with ``version`` of ``host`` (the host
+        of the connection by default) from the config history store, sending
+        the snapshot in bulk over the CLI.
+        """
+        if not HAS_CONFIG_STORE:
+            raise AnsibleConnectionFailure(
+                "restoring a stored version requires config_store.py to be importable",
+            )
+        host = host or self._connection.get_option("host")
+        if not host:
+            raise ValueError("'host' value is required to restore a stored version")
+        store_dir = self.get_option("config_store_dir")
+        if not store_dir:
+            raise ValueError("'config_store_dir' option is required to restore a stored version")
+
+        try:
+            text = ConfigStore(store_dir).get(host, version)
+        except KeyError as exc:
+            raise ValueError(to_text(exc))
+
+        lines = [
+            {"command": line}
+            for line in text.splitlines()
+            if line.strip()
+            and not line.startswith("!!")
+            and line.strip() not in ("end", "Building configuration...")
+        ]
+        self.configure()
+        resp = [out for cmd, out in self._send_config_bulk(lines)]
+        self.commit(replace=True)
+        return resp
+
     def get_diff(
         self,
         candidate=None,
@@ -415,16 +2331,9 @@ class Cliconf(CliconfBase):
 
         if running and diff_match != "none":
             # running configuration
-            running = mask_config_blocks_from_diff(running, candidate, "ansible")
-            running = sanitize_config(running)
-
-            running_obj = NetworkConfig(
-                indent=1,
-                contents=running,
-                ignore_lines=diff_ignore_lines,
-                comment_tokens=["!"],
-            )
-            configdiffobjs = candidate_obj.difference(
+            running_obj = parse_running_config(running, candidate, diff_ignore_lines)
+            configdiffobjs = config_difference(
+                candidate_obj,
                 running_obj,
                 path=path,
                 match=diff_match,
@@ -446,9 +2355,24 @@ class Cliconf(CliconfBase):
         newline=True,
         output=None,
         check_all=False,
+        spool_threshold=None,
     ):
+        """Sends ``command`` and returns its reply. With ``spool_threshold``,
+        a reply past that many bytes is returned as a SpooledOutput, the way
+        run_commands does with output_spool_threshold. Only meant for direct
+        callers: a SpooledOutput cannot go back over the persistent
+        connection, so the host option does not apply here.
+        """
         if output:
             raise ValueError("'output' value %s is not supported for get" % output)
+        threshold = spool_threshold
+        if threshold and not (prompt or answer or sendonly or check_all) and newline:
+            if not HAS_OUTPUT_SPOOL:
+                raise AnsibleConnectionFailure(
+                    "output_spool_threshold requires output_spool.py to be importable",
+                )
+            cmd = {"command": command}
+            return self._spooled_reply(cmd, self._run_command(cmd, True, threshold), threshold, False)
         return self.send_command(
             command=command,
             prompt=prompt,
@@ -468,7 +2392,22 @@ class Cliconf(CliconfBase):
             replace (bool, optional): Flag to replace commit. Defaults to None.
         """
 
+        netconf = self._netconf_backend()
+        if netconf is not None:
+            self._warn_netconf_ignored(comment=comment, label=label)
+            netconf.commit(self._netconf_confirm_timeout())
+            return
+
         cmd_obj = {}
+        profile = self._loaded_capability_profile()
+        if profile.get("commit_comment") is False:
+            if comment or self.get_option("commit_comment"):
+                self._connection.queue_message(
+                    "warning",
+                    "value of comment option '%s' is ignored as it in not supported by IOSXR"
+                    % (comment or self.get_option("commit_comment")),
+                )
+            comment = None
         if replace:
             cmd_obj["command"] = "commit replace"
             if self.get_option("commit_confirmed"):
@@ -493,14 +2432,15 @@ class Cliconf(CliconfBase):
                 cmd_obj["command"] += " label {0}".format(
                     self.get_option("commit_label"),
                 )
-            if self.get_option("commit_comment"):
+            if self.get_option("commit_comment") and profile.get("commit_comment") is not False:
                 cmd_obj["command"] += " comment {0}".format(
                     self.get_option("commit_comment"),
                 )
 
         else:
             label = label or self.get_option("commit_label")
-            comment = comment or self.get_option("commit_comment")
+            if profile.get("commit_comment") is not False:
+                comment = comment or self.get_option("commit_comment")
 
             if comment or label:
                 cmd_obj["command"] = "commit"
@@ -509,6 +2449,8 @@ class Cliconf(CliconfBase):
                 if comment:
                     cmd_obj["command"] += " comment {0}".format(comment)
 
+            elif profile.get("commit_show_error") is False:
+                cmd_obj["command"] = "commit"
             else:
                 cmd_obj["command"] = "commit show-error"
             # In some cases even a normal commit, i.e., !replace,
@@ -516,12 +2458,28 @@ class Cliconf(CliconfBase):
             # proceeding further
             cmd_obj["prompt"] = "(C|c)onfirm"
             cmd_obj["answer"] = "y"
-        self.send_command(**cmd_obj)
+
+        # a commit may change the hostname shown in the prompt
+        self._prompt_base = None
+        try:
+            self.send_command(**cmd_obj)
+        except AnsibleConnectionFailure as exc:
+            form = rejected_keyword(
+                cmd_obj["command"],
+                to_text(exc, errors="surrogate_or_strict"),
+                commit_keywords(cmd_obj["command"]),
+                to_text(self._connection.get_prompt(), errors="surrogate_or_strict").strip(),
+            )
+            if form:
+                self._learn_capability("commit_" + form.replace("-", "_"), False)
+            raise
+        for _position, form in commit_keywords(cmd_obj["command"]):
+            self._learn_capability("commit_" + form.replace("-", "_"), True)
 
     def run_commands(self, commands=None, check_rc=True):
         if commands is None:
             raise ValueError("'commands' value is required")
-        responses = list()
+        cmds = list()
         for cmd in to_list(commands):
             if not isinstance(cmd, Mapping):
                 cmd = {"command": cmd}
@@ -531,14 +2489,27 @@ class Cliconf(CliconfBase):
                 raise ValueError(
                     "'output' value %s is not supported for run_commands" % output,
                 )
+            cmds.append(cmd)
 
-            try:
-                out = self.send_command(**cmd)
-            except AnsibleConnectionFailure as e:
-                if check_rc:
-                    raise
-                out = getattr(e, "err", e)
+        threshold = self.get_option("output_spool_threshold")
+        if threshold and not HAS_OUTPUT_SPOOL:
+            raise AnsibleConnectionFailure(
+                "output_spool_threshold requires output_spool.py to be importable",
+            )
 
+        if self.get_option("run_commands_pipeline"):
+            replies = self._run_commands_pipelined(cmds, check_rc)
+        else:
+            replies = (self._run_command(cmd, check_rc, threshold) for cmd in cmds)
+
+        parse = self.get_option("parse_output")
+        responses = list()
+        for cmd, out in zip(cmds, replies):
+            if threshold and out is not None:
+                out = self._spooled_reply(cmd, out, threshold, parse)
+                if isinstance(out, SpooledOutput):
+                    responses.append(out)
+                    continue
             if out is not None:
                 try:
                     out = to_text(out, errors="surrogate_or_strict").strip()
@@ -547,32 +2518,104 @@ class Cliconf(CliconfBase):
                         message="Failed to decode output from %s: %s" % (cmd, to_text(out)),
                     )
 
-                try:
-                    out = json.loads(out)
-                except ValueError:
-                    pass
+                parsed = parse_command_output(cmd["command"], out) if parse else None
+                if parsed is not None:
+                    out = parsed
+                elif out.startswith(("{", "[")):
+                    try:
+                        out = json.loads(out)
+                    except ValueError:
+                        pass
 
                 responses.append(out)
         return responses
 
+    def _run_command(self, cmd, check_rc, threshold=None):
+        try:
+            if threshold and self._streams_output(cmd):
+                return self._send_spooled(cmd["command"], threshold)
+            return self.send_command(**cmd)
+        except AnsibleConnectionFailure as e:
+            if check_rc:
+                raise
+            return getattr(e, "err", e)
+
+    def _streams_output(self, cmd):
+        """True when the reply of ``cmd`` can be written to a spool as it is
+        received: a plain read-only command, on a connection sending straight
+        to the device (not through a transcript or metrics wrapper).
+        """
+        return (
+            list(cmd) == ["command"]
+            and is_read_command(to_text(cmd["command"]))
+            and getattr(type(self._connection), "send_spooled", None) is not None
+        )
+
+    def _send_spooled(self, command, threshold):
+        output = SpooledOutput(to_text(command), threshold)
+        try:
+            return self._connection.send_spooled(command, output)
+        except AnsibleConnectionFailure:
+            output.close()
+            self._cli_mode = self._prompt_base = None
+            raise
+
+    def _spooled_reply(self, cmd, out, threshold, parse):
+        """Returns a SpooledOutput for a reply past ``threshold``, the text of
+        a smaller one.
+        """
+        if not isinstance(out, SpooledOutput):
+            if not isinstance(out, (str, bytes)) or len(out) <= threshold:
+                return out
+            output = SpooledOutput(to_text(cmd["command"]), threshold)
+            output.write(to_bytes(out, errors="surrogate_or_strict"))
+            out = output
+        elif not out.spilled:
+            with out:
+                return out.text()
+        if parse:
+            parser = find_output_parser(cmd["command"])
+            out.parser = RECORD_ITERATORS.get(parser, parser)
+        return out
+
+    def _run_commands_pipelined(self, cmds, check_rc):
+        """Yields the output of ``cmds`` in order, sending each run of plain
+        commands as one batch. A command the device rejected raises when
+        check_rc is set, otherwise its error output is returned in its place.
+        """
+        for batched, group in group_plain_commands(cmds):
+            if not batched:
+                yield self._run_command(group[0], check_rc)
+                continue
+            replies = self._send_batch([cmd["command"] for cmd in group])
+            for out, failed in replies:
+                if failed and check_rc:
+                    raise AnsibleConnectionFailure(out)
+                yield out
+
     def discard_changes(self):
+        netconf = self._netconf_backend()
+        if netconf is not None:
+            netconf.discard_changes()
+            return
         self.send_command("abort")
 
     def get_device_operations(self):
+        profile = self._loaded_capability_profile()
         return {
             "supports_diff_replace": True,
             "supports_commit": True,
             "supports_rollback": False,
             "supports_defaults": False,
             "supports_onbox_diff": False,
-            "supports_commit_comment": True,
+            "supports_commit_comment": profile.get("commit_comment") is not False,
             "supports_multiline_delimiter": False,
             "supports_diff_match": True,
             "supports_diff_ignore_lines": True,
             "supports_generate_diff": True,
             "supports_replace": True,
-            "supports_admin": True,
-            "supports_commit_label": True,
+            "supports_admin": profile.get("admin") is not False,
+            "supports_commit_label": profile.get("commit_label") is not False,
         }
 
     def get_option_values(self):
@@ -596,4 +2639,8 @@ class Cliconf(CliconfBase):
         :return: None
         """
         if self._connection.connected and not self.get_option("commit_confirmed"):
+            if self.get_option("cli_mode_tracking") and self._cli_mode is not None:
+                if self._cli_mode in CONFIG_MODES:
+                    self.send_command("abort")
+                return
             self._update_cli_prompt_context(config_context=")#", exit_command="abort")
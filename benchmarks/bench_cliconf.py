@@ -0,0 +1,239 @@
+"""Benchmarks the iosxr Cliconf against emulated IOS-XR devices.
+
+Every node is an XrDevice seeded from a running_configs fixture and reached
+through an EmulatorConnection with a fixed latency per exchange. For each
+fleet size the Cliconf operations are run once per node, first with the
+default options, then with config_bulk_send and run_commands_pipeline and
+then with cli_mode_tracking, and the round trips, prompt queries, wall time
+and peak allocations of every operation are reported, with the prompt
+queries each mode saves over the default options. After every operation
+the mode tracked by cli_mode_tracking must match the prompt. Allocations
+are measured in a second pass under tracemalloc so they do not skew the
+wall time. Beforehand, candidates with sub-mode lines are committed with
+and without config_delta_push, and must leave the same running config and
+a device info read from exec mode.
+
+    python benchmarks/bench_cliconf.py [--nodes 1 30 500] [--latency 0.002]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import yaml
+
+from ansible.module_utils._text import to_text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uninet_lab import (  # noqa: E402
+    LAB_DIR,
+    is_iosxr_config,
+    load_iosxr_cliconf,
+    new_iosxr_cliconf,
+    running_config_files,
+)
+from xr_emulator import EmulatorConnection, XrDevice  # noqa: E402
+
+MODES = [
+    ("default", {}),
+    (
+        "batched",
+        {"ansible_iosxr_config_bulk_send": True, "ansible_iosxr_run_commands_pipeline": True},
+    ),
+    ("tracked", {"ansible_iosxr_cli_mode_tracking": True}),
+]
+
+HOSTNAME_RE = re.compile(r"^hostname \S+", re.M)
+
+SHOW_COMMANDS = [
+    "show version",
+    "show lldp neighbors",
+    "show running-config hostname",
+    "show configuration commit list 1",
+]
+
+CANDIDATE = """lldp
+interface GigabitEthernet0/0/0/0
+ lldp
+  enable
+ !
+!
+interface GigabitEthernet0/0/0/7
+ description added by bench
+!"""
+
+# candidates whose sub-mode lines also exist at the top level, or below a
+# mode missing from the running config
+DELTA_CANDIDATES = [
+    ["interface MgmtEth0/RP0/CPU0/0", " lldp", "  enable"],
+    ["interface MgmtEth0/RP0/CPU0/0", "lldp"],
+    ["interface GigabitEthernet0/0/0/0", " lldp", "  enable", "interface GigabitEthernet0/0/0/7", " description bench"],
+    ["interface GigabitEthernet0/0/0/9", " no description", " lldp", "  enable"],
+    ["lldp", "interface MgmtEth0/RP0/CPU0/0", "no lldp"],
+]
+
+
+def xr_config_commands():
+    """Returns the commands of the IOS-XR play of config_commands.yaml."""
+    with open(os.path.join(LAB_DIR, "config_commands.yaml")) as f:
+        plays = yaml.safe_load(f)
+    for play in plays:
+        for task in play.get("tasks") or []:
+            if "cisco.iosxr.iosxr_config" in task:
+                return task["cisco.iosxr.iosxr_config"]["commands"]
+    return []
+
+
+def op_get_device_info(cliconf, index):
+    cliconf.get_device_info()
+
+
+def op_run_commands(cliconf, index):
+    cliconf.run_commands(SHOW_COMMANDS)
+
+
+def op_get_diff(cliconf, index):
+    cliconf.get_diff(candidate=CANDIDATE, running=cliconf.get_config())
+
+
+def op_edit_config(cliconf, index):
+    cliconf.edit_config(xr_config_commands(), commit=False)
+
+
+def op_commit(cliconf, index):
+    cliconf.configure()
+    cliconf.send_command("interface GigabitEthernet0/0/0/7 description bench %d" % index)
+    cliconf.commit(label="bench%d" % index)
+    cliconf.abort()
+
+
+OPERATIONS = [
+    ("get_device_info", op_get_device_info),
+    ("run_commands", op_run_commands),
+    ("get_diff", op_get_diff),
+    ("edit_config", op_edit_config),
+    ("commit", op_commit),
+]
+
+
+def seed_configs():
+    seeds = []
+    for path in sorted(running_config_files().values()):
+        with open(path) as f:
+            text = f.read()
+        if is_iosxr_config(text):
+            seeds.append(text)
+    return seeds
+
+
+def check_delta_push(seeds):
+    """Commits every DELTA_CANDIDATES entry and the IOS-XR commands of
+    config_commands.yaml with and without config_delta_push; the running
+    configs must end up the same.
+    """
+    candidates = DELTA_CANDIDATES + [xr_config_commands()]
+    for seed in seeds:
+        for candidate in candidates:
+            configs = []
+            for variables in ({}, {"ansible_iosxr_config_delta_push": True}):
+                device = XrDevice("N0000", HOSTNAME_RE.sub("hostname N0000", seed, 1))
+                cliconf = new_iosxr_cliconf(EmulatorConnection(device), variables)
+                cliconf.edit_config(candidate, commit=True)
+                if not cliconf.get_device_info().get("network_os_version"):
+                    sys.exit("edit_config: the device info was read in configuration mode")
+                configs.append("\n".join(device.running.lines()))
+            if configs[0] != configs[1]:
+                sys.exit("config_delta_push: %s committed a different config" % candidate)
+
+
+def build_fleet(nodes, seeds, variables, latency):
+    fleet = []
+    for index in range(nodes):
+        hostname = "N%04d" % index
+        running = HOSTNAME_RE.sub("hostname " + hostname, seeds[index % len(seeds)], 1)
+        device = XrDevice(hostname, running)
+        connection = EmulatorConnection(device, latency=latency)
+        fleet.append((connection, new_iosxr_cliconf(connection, variables)))
+    return fleet
+
+
+def run_pass(nodes, seeds, variables, latency, trace):
+    """Returns {operation: (round trips, prompt queries, wall time, peak bytes)}."""
+    fleet = build_fleet(nodes, seeds, variables, latency)
+    results = {}
+    for name, func in OPERATIONS:
+        trips = sum(connection.round_trips for connection, _cliconf in fleet)
+        prompts = sum(connection.prompt_queries for connection, _cliconf in fleet)
+        if trace:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        for index, (_connection, cliconf) in enumerate(fleet):
+            func(cliconf, index)
+        wall = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - base if trace else None
+        results[name] = (
+            sum(connection.round_trips for connection, _cliconf in fleet) - trips,
+            sum(connection.prompt_queries for connection, _cliconf in fleet) - prompts,
+            wall,
+            peak,
+        )
+        check_tracked_modes(name, fleet)
+    return results
+
+
+def check_tracked_modes(name, fleet):
+    """The CLI mode tracked by cli_mode_tracking must be the one the prompt
+    shows; configure exclusive shows the config prompt.
+    """
+    cli_mode_from_prompt = load_iosxr_cliconf().cli_mode_from_prompt
+    for connection, cliconf in fleet:
+        mode = cliconf._cli_mode
+        if mode is None:
+            continue
+        shown = cli_mode_from_prompt(to_text(connection.get_prompt()))
+        if shown != {"config-exclusive": "config"}.get(mode, mode):
+            sys.exit("%s: the tracked CLI mode is %s, the prompt shows %s" % (name, mode, shown))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 30, 500])
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per exchange")
+    parser.add_argument("--no-allocations", action="store_true", help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    seeds = seed_configs()
+    check_delta_push(seeds)
+    print("config_delta_push commits identical")
+    print(
+        "%6s %-8s %-16s %8s %8s %8s %10s %12s %12s"
+        % ("nodes", "mode", "operation", "trips", "prompts", "saved", "wall s", "ms/node", "peak KiB"),
+    )
+    for nodes in args.nodes:
+        baseline = {}
+        for mode, variables in MODES:
+            timed = run_pass(nodes, seeds, variables, args.latency, trace=False)
+            traced = {}
+            if not args.no_allocations:
+                tracemalloc.start()
+                try:
+                    traced = run_pass(nodes, seeds, variables, 0.0, trace=True)
+                finally:
+                    tracemalloc.stop()
+            for name, _func in OPERATIONS:
+                trips, prompts, wall, _peak = timed[name]
+                saved = baseline.setdefault(name, prompts) - prompts
+                peak = traced[name][3] / 1024.0 if name in traced else float("nan")
+                print(
+                    "%6d %-8s %-16s %8d %8d %8d %10.3f %12.2f %12.1f"
+                    % (nodes, mode, name, trips, prompts, saved, wall, wall * 1000 / nodes, peak),
+                )
+
+
+if __name__ == "__main__":
+    main()
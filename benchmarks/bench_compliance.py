@@ -0,0 +1,117 @@
+"""Benchmarks the fleet compliance check across process pool sizes.
+
+An archive of --hosts running configs is generated from the IOS-XR
+running_configs fixtures, padded to about --lines lines with synthetic
+interfaces; every third host loses an LLDP line and every fifth gets a
+`shutdown` the policy forbids. The archive is checked in this process with
+the intent parsed again for every host, the way a get_diff per device
+does, then by compliance.run_compliance with the intent parsed once, in
+process and with pools of growing size. Hosts left as the fixtures must
+be compliant, and all runs must report the same deviations; the wall time and hosts per second are printed.
+
+    python benchmarks/bench_compliance.py [--hosts 300] [--lines 2000] [--workers 1 2 4]
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import compliance  # noqa: E402
+from rollout import config_task_commands  # noqa: E402
+from uninet_lab import is_iosxr_config, running_config_files  # noqa: E402
+
+HOSTNAME_RE = re.compile(r"^hostname \S+", re.M)
+
+
+def padding(lines):
+    out = []
+    index = 0
+    while len(out) < lines:
+        out.extend(
+            [
+                "interface GigabitEthernet0/0/%d/%d" % (1 + index // 64, index % 64),
+                " description padding %d" % index,
+                " ipv4 address 10.%d.%d.1 255.255.255.0" % (index // 256 % 256, index % 256),
+                "!",
+            ],
+        )
+        index += 1
+    return "\n".join(out)
+
+
+def write_archive(directory, hosts, lines):
+    seeds = []
+    for path in running_config_files().values():
+        with open(path) as f:
+            text = f.read()
+        if is_iosxr_config(text):
+            seeds.append(text)
+    pad = padding(lines)
+    for index in range(hosts):
+        host = "N%04d" % index
+        text = HOSTNAME_RE.sub("hostname " + host, seeds[index % len(seeds)], 1)
+        if index % 3 == 0:
+            text = text.replace("interface GigabitEthernet0/0/0/0\n lldp\n  enable\n", "interface GigabitEthernet0/0/0/0\n", 1)
+        if index % 5 == 0:
+            text = text.replace("interface GigabitEthernet0/0/0/1\n", "interface GigabitEthernet0/0/0/1\n shutdown\n", 1)
+        text = text.replace("\nend", "\n" + pad + "\nend", 1)
+        with open(os.path.join(directory, "%s.cfg" % host), "w") as f:
+            f.write(text)
+
+
+def reparsed(sources, commands):
+    """Checks every host with the intent parsed again for it."""
+    records = []
+    for item in sources:
+        compliance.init_worker(compliance.golden_requirements(), compliance.policy_requirements(commands), False)
+        records.append(compliance.check_source(item))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=300)
+    parser.add_argument("--lines", type=int, default=2000, help="padding lines per running config")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted(set([1, 2, 4, os.cpu_count() or 1])))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-compliance-")
+    try:
+        write_archive(workdir, args.hosts, args.lines)
+        sources = compliance.archive_sources(workdir)
+        commands = config_task_commands()
+
+        start = time.perf_counter()
+        expected = reparsed(sources, commands)
+        elapsed = time.perf_counter() - start
+        for record in expected:
+            index = int(record["host"][1:])
+            if record.get("compliant") is False and index % 3 and index % 5:
+                sys.exit("%s: deviations on an unchanged running config: %s" % (record["host"], record["blocks"]))
+        deviating = sum(not record["compliant"] for record in expected)
+        print("%d hosts, %d deviating, %d CPUs" % (len(sources), deviating, os.cpu_count() or 1))
+        print("%-24s %10s %10s" % ("run", "wall s", "hosts/s"))
+        print("%-24s %10.2f %10.1f" % ("intent parsed per host", elapsed, len(sources) / elapsed))
+
+        golden = compliance.golden_requirements()
+        policy = compliance.policy_requirements(commands)
+        for workers in args.workers:
+            start = time.perf_counter()
+            records = list(compliance.run_compliance(sources, golden, policy, workers))
+            elapsed = time.perf_counter() - start
+            if records != expected:
+                sys.exit("%d workers: the report differs from the per host check" % workers)
+            label = "in process" if workers == 1 else "%d workers" % workers
+            print("%-24s %10.2f %10.1f" % (label, elapsed, len(sources) / elapsed))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
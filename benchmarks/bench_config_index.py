@@ -0,0 +1,144 @@
+"""Benchmarks the config archive index against re-reading every snapshot.
+
+A ConfigStore is filled with --versions snapshots of every running_configs
+fixture, each version adding, removing or changing a few interface lines,
+then indexed from scratch and incrementally (one more version per host).
+A set of exact, subtree and glob queries is answered by the index and by
+parsing every snapshot again; both must return the same hosts and paths,
+and the time of each is reported.
+
+    python benchmarks/bench_config_index.py [--versions 20]
+"""
+
+import argparse
+import fnmatch
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config_index import (  # noqa: E402
+    ConfigIndex,
+    display_path,
+    parse_paths,
+    path_term,
+    query_term,
+)
+from config_store import ConfigStore  # noqa: E402
+from uninet_lab import running_config_files  # noqa: E402
+
+QUERIES = [
+    ("exact", "interface preconfigure GigabitEthernet0/0/0/5"),
+    ("exact", "lldp"),
+    ("under", "interface GigabitEthernet0/0/0/0"),
+    ("glob", "*lldp > enable"),
+    ("glob", "*description bench*"),
+]
+
+
+def mutate(text, rng, version):
+    lines = text.splitlines()
+    for _change in range(3):
+        port = rng.randrange(8)
+        lines.extend(
+            [
+                "interface GigabitEthernet0/0/0/%d" % port,
+                " description bench %d" % version,
+                "!",
+            ],
+        )
+    if rng.random() < 0.3:
+        lines = [line for line in lines if "preconfigure GigabitEthernet0/0/0/5" not in line]
+    return "\n".join(lines) + "\n"
+
+
+def fill_store(store, versions, rng, start=0):
+    seeds = {}
+    for host, path in running_config_files().items():
+        with open(path) as f:
+            seeds[host] = f.read()
+    count = 0
+    for version in range(start, start + versions):
+        for host, text in seeds.items():
+            store.add(host, mutate(text, rng, version))
+            count += 1
+    return count
+
+
+def scan(store, mode, query):
+    """Answers a query by parsing every newest snapshot again."""
+    term = query_term(query)
+    results = {}
+    for host in sorted(os.listdir(os.path.join(store.root, "hosts"))):
+        host = os.path.splitext(host)[0]
+        paths = set(path_term(path) for path in parse_paths(store.get(host)))
+        if mode == "exact":
+            found = [term] if term in paths else []
+        elif mode == "under":
+            found = [path for path in paths if path == term or path.startswith(term + "\x1f")]
+        else:
+            found = [path for path in paths if fnmatch.fnmatchcase(display_path(path), query)]
+        if found:
+            results[host] = sorted(display_path(path) for path in found)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--versions", type=int, default=20, help="snapshots per host")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-config-index-")
+    try:
+        store = ConfigStore(os.path.join(workdir, "store"))
+        snapshots = fill_store(store, args.versions, rng)
+        root = os.path.join(workdir, "index")
+
+        start = time.perf_counter()
+        index = ConfigIndex(root)
+        index.update(store=store)
+        index.close()
+        print("%-40s %10.1f ms  (%d snapshots)" % ("full build", (time.perf_counter() - start) * 1000, snapshots))
+
+        added = fill_store(store, 1, rng, start=args.versions)
+        start = time.perf_counter()
+        index = ConfigIndex(root)
+        index.update(store=store)
+        index.close()
+        print("%-40s %10.1f ms  (%d snapshots)" % ("incremental update", (time.perf_counter() - start) * 1000, added))
+
+        start = time.perf_counter()
+        index = ConfigIndex(root)
+        index.segments()
+        print("%-40s %10.2f ms" % ("open", (time.perf_counter() - start) * 1000))
+
+        for mode, query in QUERIES:
+            start = time.perf_counter()
+            results = index.search(query, mode)
+            indexed = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            expected = scan(store, mode, query)
+            scanned = (time.perf_counter() - start) * 1000
+            found = dict((snapshot["host"], paths) for snapshot, paths in results)
+            if found != expected:
+                sys.exit("%s %r: the index disagrees with a scan of the snapshots" % (mode, query))
+            print(
+                "%-40s %10.2f ms  scan %8.1f ms  %d hosts"
+                % ("%s %s" % (mode, query[:32]), indexed, scanned, len(found)),
+            )
+            start = time.perf_counter()
+            history = index.search(query, mode, history=True)
+            print("%-40s %10.2f ms  %d snapshots" % ("  with history", (time.perf_counter() - start) * 1000, len(history)))
+        index.close()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
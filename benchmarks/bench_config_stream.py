@@ -0,0 +1,177 @@
+"""Compares the streaming running config pipeline with the materialized one.
+
+The running config is masked, sanitized and parsed by the upstream
+functions (mask_config_blocks_from_diff, sanitize_config, NetworkConfig),
+and by the single-pass pipeline of parse_running_config fed a string, a
+file object and lists of odd-sized text and byte chunks. The
+ConfigLine lists must be identical for every running_configs fixture and
+for synthetic configs with RPL blocks that match the candidate, differ
+from it, run past the end of the running block or repeat. Then both are
+timed on large synthetic configs read from a file, and the memory held by
+the parsed lines is reported along with the peak each path needs on top of
+it for the text.
+
+    python benchmarks/bench_config_stream.py [--lines 10000 100000 500000]
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ansible_collections.cisco.iosxr.plugins.module_utils.network.iosxr.iosxr import (  # noqa: E402
+    mask_config_blocks_from_diff,
+)
+from bench_get_diff import CANDIDATE, synthetic_config  # noqa: E402
+from uninet_lab import load_iosxr_cliconf, running_config_files  # noqa: E402
+
+iosxr = load_iosxr_cliconf()
+
+RPL_RUNNING = """!! IOS XR Configuration 24.4.1
+hostname RPL
+description ñandú
+prefix-set PS-A
+  10.0.0.0/8,
+  192.168.0.0/16
+end-set
+!
+route-policy RP-A
+  if destination in PS-A then
+    pass
+  endif
+end-policy
+!
+route-policy RP-B
+  drop
+end-policy
+!
+end-policy
+router bgp 65000
+!"""
+
+RPL_CANDIDATES = {
+    "rpl matching": "!\nroute-policy RP-B\n  drop\nend-policy",
+    "rpl changed": "!\nroute-policy RP-A\n  pass\nend-policy\nprefix-set PS-A\n  10.0.0.0/8\nend-set",
+    "rpl longer": "!\nroute-policy RP-A\n  if destination in PS-A then\n    pass\n    set med 10\n  endif\nend-policy\n"
+    "route-policy RP-B\n  pass\nend-policy",
+    "rpl first line": "route-policy RP-B\n  pass\nend-policy",
+    "rpl repeated": "!\nroute-policy RP-B\n  pass\nend-policy\nroute-policy RP-B\n  drop\nend-policy",
+    "rpl at the end": "!\nrouter bgp 65000\nroute-policy RP-C\n  pass\nend-policy",
+}
+
+
+def legacy_items(running, candidate):
+    if any(
+        block["start"].search(line) for block in iosxr.CONFIG_BLOCKS_FORCED_IN_DIFF for line in candidate.split("\n")
+    ):
+        running = mask_config_blocks_from_diff(running, candidate, "ansible")
+    config = iosxr.NetworkConfig(indent=1, contents=iosxr.sanitize_config(running), comment_tokens=["!"])
+    return config.items
+
+
+def streamed_items(source, candidate):
+    iosxr._running_config_cache.clear()
+    return iosxr.parse_running_config(source, candidate).items
+
+
+def signature(items):
+    return [(item.raw, item.parents, [child.raw for child in item._children]) for item in items]
+
+
+def odd_chunks(data):
+    sizes = [1, 7, 64, 3, 1000]
+    offset = index = 0
+    while offset < len(data):
+        size = sizes[index % len(sizes)]
+        yield data[offset : offset + size]
+        offset += size
+        index += 1
+
+
+def check(name, running, candidate):
+    expected = signature(legacy_items(running, candidate))
+    data = running.encode("utf-8")
+    sources = [
+        ("string", running),
+        ("file", io.BytesIO(data)),
+        ("chunks", list(odd_chunks(running))),
+        ("byte chunks", list(odd_chunks(data))),
+    ]
+    for label, source in sources:
+        if signature(streamed_items(source, candidate)) != expected:
+            sys.exit("%s (%s): the streamed parse differs from the materialized one" % (name, label))
+
+
+def measure(func):
+    """Returns (items, seconds, MiB held by the result, MiB of peak above it)."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = func()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(result), elapsed, held / 2.0**20, (peak - held) / 2.0**20
+
+
+def legacy_from_file(path, candidate):
+    with open(path) as f:
+        return legacy_items(f.read(), candidate)
+
+
+def streamed_from_file(path, candidate):
+    with open(path, "rb") as f:
+        lines = iosxr.iter_config_lines(iosxr.iter_config_chunks(f))
+        lines = iosxr.mask_config_lines(lines, candidate, "ansible")
+        return iosxr.parse_config_lines(iosxr.sanitize_config_lines(lines), ["!"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="*", default=[10000, 100000, 500000])
+    args = parser.parse_args()
+
+    cases = 0
+    for host, filename in sorted(running_config_files().items()):
+        with open(filename) as f:
+            running = f.read()
+        for candidate in ("", CANDIDATE, running):
+            check(host, running, candidate)
+            cases += 1
+    for name, candidate in sorted(RPL_CANDIDATES.items()):
+        check(name, RPL_RUNNING, candidate)
+        check(name + " (padded)", synthetic_config(200) + "\n" + RPL_RUNNING, candidate)
+        cases += 2
+    print("%d cases identical" % cases)
+
+    workdir = tempfile.mkdtemp(prefix="bench-config-stream-")
+    try:
+        print(
+            "%8s %8s %10s %10s %10s %12s %12s"
+            % ("lines", "items", "legacy s", "streamed s", "parsed MiB", "legacy +MiB", "streamed +MiB"),
+        )
+        for lines in args.lines:
+            path = os.path.join(workdir, "running-%d.cfg" % lines)
+            with open(path, "w") as f:
+                f.write(synthetic_config(lines) + "\n" + RPL_RUNNING)
+            candidate = RPL_CANDIDATES["rpl changed"]
+            count, legacy_time, held, legacy_extra = measure(lambda: legacy_from_file(path, candidate))
+            streamed_count, streamed_time, _held, streamed_extra = measure(lambda: streamed_from_file(path, candidate))
+            if streamed_count != count:
+                sys.exit("%d lines: %d items streamed, %d expected" % (lines, streamed_count, count))
+            print(
+                "%8d %8d %10.3f %10.3f %10.1f %12.1f %12.1f"
+                % (lines, count, legacy_time, streamed_time, held, legacy_extra, streamed_extra),
+            )
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
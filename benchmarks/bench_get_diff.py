@@ -0,0 +1,145 @@
+"""Compares the indexed get_diff engine with NetworkConfig.difference.
+
+Every combination of match/replace/path is checked to produce the same
+config_diff text on the running_configs fixtures and on synthetic configs,
+then both implementations are timed.
+
+    python benchmarks/bench_get_diff.py [--lines 100000] [--compare-limit 5000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ansible_collections.cisco.iosxr.plugins.module_utils.network.iosxr.iosxr import (  # noqa: E402
+    mask_config_blocks_from_diff,
+)
+from uninet_lab import is_iosxr_config, load_iosxr_cliconf, running_config_files  # noqa: E402
+
+iosxr = load_iosxr_cliconf()
+
+MATCHES = ["line", "strict", "exact"]
+REPLACES = ["line", "block"]
+
+CANDIDATE = """lldp
+interface GigabitEthernet0/0/0/0
+ lldp
+  enable
+ !
+!
+interface GigabitEthernet0/0/0/7
+ description added by bench
+ lldp
+  enable
+ !
+!"""
+
+
+def synthetic_config(lines):
+    out = ["!! IOS XR Configuration 24.4.1", "hostname BENCH"]
+    index = 0
+    while len(out) < lines:
+        out.extend(
+            [
+                "interface GigabitEthernet0/0/%d/%d" % (index // 64, index % 64),
+                " description synthetic %d" % index,
+                " ipv4 address 10.%d.%d.1 255.255.255.0" % (index // 256 % 256, index % 256),
+                " lldp",
+                "  enable",
+                " !",
+                "!",
+            ],
+        )
+        index += 1
+    return "\n".join(out)
+
+
+def legacy_diff(candidate, running, match, replace, path):
+    candidate_obj = iosxr.NetworkConfig(indent=1, comment_tokens=["!"])
+    candidate_obj.load(iosxr.sanitize_config(candidate))
+    running = mask_config_blocks_from_diff(running, candidate, "ansible")
+    running_obj = iosxr.NetworkConfig(
+        indent=1,
+        contents=iosxr.sanitize_config(running),
+        comment_tokens=["!"],
+    )
+    diff = candidate_obj.difference(running_obj, path=path, match=match, replace=replace)
+    return iosxr.dumps(diff, "commands") if diff else ""
+
+
+def indexed_diff(candidate, running, match, replace, path):
+    candidate_obj = iosxr.NetworkConfig(indent=1, comment_tokens=["!"])
+    candidate_obj.load(iosxr.sanitize_config(candidate))
+    running_obj = iosxr.parse_running_config(running, candidate)
+    diff = iosxr.config_difference(
+        candidate_obj,
+        running_obj,
+        path=path,
+        match=match,
+        replace=replace,
+    )
+    return iosxr.dumps(diff, "commands") if diff else ""
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_case(name, running, candidate, compare):
+    legacy_total = indexed_total = 0.0
+    for match in MATCHES:
+        for replace in REPLACES:
+            for path in (None, ["interface GigabitEthernet0/0/0/0"]):
+                indexed, elapsed = timed(indexed_diff, candidate, running, match, replace, path)
+                indexed_total += elapsed
+                if not compare:
+                    continue
+                legacy, elapsed = timed(legacy_diff, candidate, running, match, replace, path)
+                legacy_total += elapsed
+                if legacy != indexed:
+                    raise AssertionError(
+                        "%s: diff mismatch for match=%s replace=%s path=%s"
+                        % (name, match, replace, path),
+                    )
+    if compare:
+        print(
+            "%-40s legacy %9.4fs  indexed %9.4fs  x%.1f"
+            % (name, legacy_total, indexed_total, legacy_total / max(indexed_total, 1e-9)),
+        )
+    else:
+        print("%-40s legacy %10s  indexed %9.4fs" % (name, "skipped", indexed_total))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument(
+        "--compare-limit",
+        type=int,
+        default=5000,
+        help="largest synthetic config also diffed with NetworkConfig.difference",
+    )
+    args = parser.parse_args()
+
+    for host, filename in running_config_files().items():
+        with open(filename) as f:
+            running = f.read()
+        if not is_iosxr_config(running):
+            continue
+        run_case(host, running, CANDIDATE, True)
+        run_case(host + " (self)", running, running, True)
+
+    for lines in args.lines:
+        running = synthetic_config(lines)
+        compare = lines <= args.compare_limit
+        run_case("synthetic %d lines" % lines, running, CANDIDATE, compare)
+        run_case("synthetic %d lines (self)" % lines, running, running, compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmarks the cached dynamic inventory on large synthetic topologies.
+
+For every size a containerlab topology and a matching deployed state
+(topology-data.json) are generated in a temporary directory. The inventory
+is resolved cold, from the cache, after the topology was touched without
+changing it, and after a node was added; the cached answers must equal a
+fresh build.
+
+    python benchmarks/bench_inventory.py [--nodes 30 1000 5000]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clab_inventory import InventoryCache, inventory_list  # noqa: E402
+
+KINDS = [("xrd", "xr"), ("crpd", "junos"), ("cisco_csr1000v", "xe")]
+SITES = ["cuautitlan", "vallejo", "triara"]
+
+
+def write_lab(directory, nodes, name="bench-lab"):
+    topology = {"name": name, "topology": {"nodes": {}, "links": []}}
+    state = {"name": name, "nodes": {}}
+    for index in range(nodes):
+        node = "S%d-R%d" % (index % len(SITES), index)
+        kind, family = KINDS[index % len(KINDS)]
+        topology["topology"]["nodes"][node] = {
+            "kind": kind,
+            "labels": {"ansible-group": "%s_%s" % (SITES[index % len(SITES)], family)},
+        }
+        state["nodes"][node] = {
+            "longname": "clab-%s-%s" % (name, node),
+            "kind": kind,
+            "mgmt-ipv4-address": "10.%d.%d.%d" % (index >> 16, (index >> 8) & 255, index & 255),
+        }
+    path = os.path.join(directory, "topology.clab.yaml")
+    with open(path, "w") as f:
+        yaml.safe_dump(topology, f)
+    lab_dir = os.path.join(directory, "clab-%s" % name)
+    os.makedirs(lab_dir, exist_ok=True)
+    with open(os.path.join(lab_dir, "topology-data.json"), "w") as f:
+        json.dump(state, f)
+    return path
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[30, 1000, 5000])
+    args = parser.parse_args()
+
+    print("%6s %10s %10s %10s %10s" % ("nodes", "cold ms", "cached ms", "touched ms", "changed ms"))
+    for nodes in args.nodes:
+        workdir = tempfile.mkdtemp(prefix="bench-inventory-")
+        try:
+            path = write_lab(workdir, nodes)
+            cache = InventoryCache(os.path.join(workdir, "cache"))
+            cold, cold_ms = timed(lambda: inventory_list(path, cache))
+            cached, cached_ms = timed(lambda: inventory_list(path, cache))
+
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            touched, touched_ms = timed(lambda: inventory_list(path, cache))
+
+            write_lab(workdir, nodes + 1)
+            changed, changed_ms = timed(lambda: inventory_list(path, cache))
+
+            fresh = inventory_list(path, cache, refresh=True)
+            if cached != cold or touched != cold or changed != fresh:
+                sys.exit("%d nodes: the cached inventory differs from a fresh build" % nodes)
+            if len(changed["_meta"]["hostvars"]) != nodes + 1:
+                sys.exit("%d nodes: the cache was not invalidated by a changed topology" % nodes)
+            print("%6d %10.1f %10.2f %10.2f %10.1f" % (nodes, cold_ms, cached_ms, touched_ms, changed_ms))
+        finally:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Compares the CLI and NETCONF config backends of the iosxr Cliconf.
+
+Every node is an XrDevice seeded from a running_configs fixture, reached
+over the emulated terminal for the CLI backend and through a local
+NetconfServer for the NETCONF backend, both with the same latency per
+exchange. The IOS-XR commands of config_commands.yaml and a multi-block
+candidate are committed through both backends on twin fleets; the resulting
+running configs must be identical, then the exchanges (CLI round trips or
+NETCONF RPCs), the bytes on the wire and the wall time are reported.
+
+    python benchmarks/bench_netconf.py [--nodes 1 30] [--latency 0.002]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cliconf import CANDIDATE, HOSTNAME_RE, seed_configs, xr_config_commands  # noqa: E402
+from uninet_lab import new_iosxr_cliconf  # noqa: E402
+from xr_emulator import EmulatorConnection, NetconfServer, XrDevice  # noqa: E402
+
+OPERATIONS = [
+    ("config_commands", lambda: xr_config_commands()),
+    ("candidate", lambda: CANDIDATE.splitlines()),
+]
+
+
+def build_fleet(nodes, seeds, backend, latency):
+    fleet = []
+    for index in range(nodes):
+        hostname = "N%04d" % index
+        running = HOSTNAME_RE.sub("hostname " + hostname, seeds[index % len(seeds)], 1)
+        device = XrDevice(hostname, running)
+        connection = EmulatorConnection(device, latency=latency, host="127.0.0.1")
+        server = None
+        variables = {}
+        if backend == "netconf":
+            server = NetconfServer(device, latency=latency).start()
+            variables = {
+                "ansible_iosxr_config_backend": "netconf",
+                "ansible_iosxr_netconf_transport": "tcp",
+                "ansible_iosxr_netconf_port": server.port,
+            }
+        cliconf = new_iosxr_cliconf(connection, variables)
+        # facts are learned over the CLI by both backends, keep them out
+        cliconf.get_device_operations()
+        fleet.append((device, connection, server, cliconf))
+    return fleet
+
+
+def exchanges(backend, connection, cliconf):
+    """Returns (exchanges, bytes on the wire) of a node so far."""
+    if backend == "netconf":
+        client = cliconf._netconf.client if cliconf._netconf else None
+        return (client.rpcs, client.bytes_sent + client.bytes_received) if client else (0, 0)
+    return connection.round_trips, connection.bytes_sent + connection.bytes_received
+
+
+def run_backend(nodes, seeds, backend, latency):
+    """Returns ({operation: (exchanges, bytes, wall)}, [running config])."""
+    fleet = build_fleet(nodes, seeds, backend, latency)
+    results = {}
+    try:
+        for name, candidate in OPERATIONS:
+            before = [exchanges(backend, conn, cliconf) for _dev, conn, _srv, cliconf in fleet]
+            start = time.perf_counter()
+            for _device, _connection, _server, cliconf in fleet:
+                cliconf.edit_config(candidate())
+            wall = time.perf_counter() - start
+            after = [exchanges(backend, conn, cliconf) for _dev, conn, _srv, cliconf in fleet]
+            results[name] = (
+                sum(a[0] - b[0] for a, b in zip(after, before)),
+                sum(a[1] - b[1] for a, b in zip(after, before)),
+                wall,
+            )
+        return results, [device._snapshot() for device, _conn, _srv, _cliconf in fleet]
+    finally:
+        for _device, _connection, server, cliconf in fleet:
+            if cliconf._netconf is not None:
+                cliconf._netconf.close()
+            if server is not None:
+                server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, nargs="+", default=[1, 30])
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per exchange")
+    args = parser.parse_args()
+
+    seeds = seed_configs()
+    print("%6s %-8s %-16s %10s %10s %10s %12s" % ("nodes", "backend", "operation", "exchanges", "KiB", "wall s", "ms/node"))
+    for nodes in args.nodes:
+        runs = {}
+        for backend in ("cli", "netconf"):
+            runs[backend] = run_backend(nodes, seeds, backend, args.latency)
+            for name, _candidate in OPERATIONS:
+                count, size, wall = runs[backend][0][name]
+                print(
+                    "%6d %-8s %-16s %10d %10.1f %10.3f %12.2f"
+                    % (nodes, backend, name, count, size / 1024.0, wall, wall * 1000 / nodes),
+                )
+        if runs["cli"][1] != runs["netconf"][1]:
+            sys.exit("%d nodes: the NETCONF backend left a different running config than the CLI" % nodes)
+
+
+if __name__ == "__main__":
+    main()
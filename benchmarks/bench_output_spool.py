@@ -0,0 +1,142 @@
+"""Benchmarks the spooled output of run_commands on huge show commands.
+
+An emulated device holding --routes BGP routes answers `show route`. The
+command is run through the iosxr Cliconf with the default options, which
+return the whole reply as text, then with output_spool_threshold, which
+streams it to a SpooledOutput past the threshold, and with
+run_commands_pipeline on top, which spools the reply once received. The
+spooled lines must be the lines of the text and, with parse_output, the
+records must be those parse_route builds from the text; replies under the
+threshold are returned as before. Cliconf.get must spool and stream the
+same way when given spool_threshold, and ignore output_spool_threshold. The wall time, the peak allocated during
+the call (the emulated device's own copy of the reply included) and the
+memory the reply holds afterwards are reported.
+
+    python benchmarks/bench_output_spool.py [--routes 10000 100000 500000] [--threshold 1048576]
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cliconf import seed_configs  # noqa: E402
+from output_spool import SpooledOutput  # noqa: E402
+from uninet_lab import new_iosxr_cliconf  # noqa: E402
+from xr_emulator import EmulatorConnection, XrDevice  # noqa: E402
+
+HOSTNAME_RE = re.compile(r"^hostname \S+", re.M)
+
+NEIGHBORS = [("N0001", "Gi0/0/0/0", "Gi0/0/0/1"), ("N0002", "Gi0/0/0/1", "Gi0/0/0/0")]
+
+MODES = [
+    ("text", {}),
+    ("streamed", {"ansible_iosxr_output_spool_threshold": None}),
+    (
+        "spooled after",
+        {"ansible_iosxr_output_spool_threshold": None, "ansible_iosxr_run_commands_pipeline": True},
+    ),
+]
+
+
+def new_cliconf(seed, routes, variables, threshold):
+    running = HOSTNAME_RE.sub("hostname N0000", seed, 1)
+    device = XrDevice("N0000", running, lldp_neighbors=NEIGHBORS, routes=routes)
+    variables = dict((key, threshold if value is None else value) for key, value in variables.items())
+    return new_iosxr_cliconf(EmulatorConnection(device, latency=0.0), variables)
+
+
+def run(cliconf, commands):
+    """Returns (replies, seconds, MiB of peak during the call, MiB held by
+    the replies after it).
+    """
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        replies = cliconf.run_commands(commands)
+        elapsed = time.perf_counter() - start
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return replies, elapsed, (peak - base) / 2.0**20, (held - base) / 2.0**20
+
+
+def check(label, seed, threshold):
+    """The spooled replies must read as the text ones, small replies and
+    parsed ones included.
+    """
+    commands = ["show route", "show lldp neighbors", "show version"]
+    for parse in (False, True):
+        expected = None
+        for mode, variables in MODES:
+            variables = dict(variables, ansible_iosxr_parse_output=parse)
+            replies = new_cliconf(seed, 2000, variables, threshold).run_commands(commands)
+            route, neighbors, version = replies
+            if isinstance(route, SpooledOutput):
+                with route:
+                    if not route.spilled:
+                        sys.exit("%s %s: the reply was spooled without spilling" % (label, mode))
+                    if parse:
+                        route = list(route.records())
+                    else:
+                        lines = list(route)
+                        route = route.text()
+                        if lines != route.split("\n"):
+                            sys.exit("%s %s: the lines differ from the text" % (label, mode))
+            elif mode != "text":
+                sys.exit("%s %s: the reply of show route was not spooled" % (label, mode))
+            if expected is None:
+                expected = [route, neighbors, version]
+            elif [route, neighbors, version] != expected:
+                sys.exit("%s %s (parse_output %s): the replies differ from the text" % (label, mode, parse))
+        if parse and not (expected[0] and isinstance(expected[1], list)):
+            sys.exit("%s: show route and show lldp neighbors were not parsed" % label)
+
+    cliconf = new_cliconf(seed, 2000, dict(MODES)["streamed"], threshold)
+    if not isinstance(cliconf.get("show route"), str):
+        sys.exit("%s: get spooled a reply without spool_threshold" % label)
+    plain = new_cliconf(seed, 2000, {}, threshold)
+    route = cliconf.get("show route", spool_threshold=threshold)
+    if not isinstance(route, SpooledOutput):
+        sys.exit("%s: get did not spool the reply of show route" % label)
+    with route:
+        if not route.spilled or route.text() != plain.get("show route"):
+            sys.exit("%s: the reply get spooled differs from the text" % label)
+    if cliconf.get("show version", spool_threshold=threshold) != plain.get("show version"):
+        sys.exit("%s: get changed a reply under the threshold" % label)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--routes", type=int, nargs="+", default=[10000, 100000, 500000])
+    parser.add_argument("--threshold", type=int, default=1 << 20, help="bytes kept in memory")
+    args = parser.parse_args()
+
+    seed = seed_configs()[0]
+    check("2000 routes", seed, 4096)
+    print("replies identical")
+
+    print("%8s %-14s %10s %10s %10s %10s" % ("routes", "mode", "MiB", "wall s", "peak MiB", "held MiB"))
+    for routes in args.routes:
+        for mode, variables in MODES:
+            cliconf = new_cliconf(seed, routes, variables, args.threshold)
+            replies, elapsed, peak, held = run(cliconf, ["show route"])
+            reply = replies[0]
+            size = len(reply) if isinstance(reply, SpooledOutput) else len(reply.encode("utf-8"))
+            count = sum(1 for _line in reply) if isinstance(reply, SpooledOutput) else reply.count("\n") + 1
+            if isinstance(reply, SpooledOutput):
+                reply.close()
+            if count < routes:
+                sys.exit("%d routes %s: %d lines returned" % (routes, mode, count))
+            print(
+                "%8d %-14s %10.1f %10.3f %10.1f %10.1f" % (routes, mode, size / 2.0**20, elapsed, peak, held),
+            )
+
+
+if __name__ == "__main__":
+    main()
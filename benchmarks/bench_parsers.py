@@ -0,0 +1,131 @@
+"""Measures the structured-output parsers registered in the iosxr cliconf.
+
+Parses generated variations of captured XRd outputs, first uncached (every
+output is distinct) and then through the memoized parse_command_output,
+whose records must not be shared between callers, nor change when threads
+fill and evict the memo at once the way fleet_exec workers do.
+
+    python benchmarks/bench_parsers.py [--outputs 5000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uninet_lab import load_iosxr_cliconf  # noqa: E402
+
+iosxr = load_iosxr_cliconf()
+
+LLDP_NEIGHBORS = """Thu Mar 27 16:02:11.394 UTC
+Capability codes:
+        (R) Router, (B) Bridge, (T) Telephone, (C) DOCSIS Cable Device
+        (W) WLAN Access Point, (P) Repeater, (S) Station, (O) Other
+
+Device ID       Local Intf               Hold-time  Capability      Port ID
+CU-R{0}           GigabitEthernet0/0/0/0   120        R               GigabitEthernet0/0/0/0
+CU-R4           GigabitEthernet0/0/0/1   120        R               GigabitEthernet0/0/0/0
+CU-R7           GigabitEthernet0/0/0/2   120        R               eth1
+CU-R6           GigabitEthernet0/0/0/3   120        R               eth1
+CU-R5           GigabitEthernet0/0/0/4   120        R               eth1
+
+Total entries displayed: 5"""
+
+VERSION = """Thu Mar 27 16:03:40.117 UTC
+Cisco IOS XR Software, Version 24.4.1 LNT
+Copyright (c) 2013-2024 by Cisco Systems, Inc.
+
+Build Information:
+ Built By     : swtools
+ Built On     : Sat Dec 14 02:39:20 UTC 2024
+ Build Host   : iox-ucs-039
+ Workspace    : /auto/srcarchive13/prod/24.4.1/xrd-control-plane/ws
+ Version      : 24.4.1
+ Label        : 24.4.1
+
+cisco XRd Control Plane
+cisco XRd-CP-C-01 processor with 32GB of memory
+CU-R1 uptime is {0} minutes
+XRd Control Plane Container"""
+
+INVENTORY = """Thu Mar 27 16:04:02.551 UTC
+NAME: "0/RP0/CPU0", DESCR: "Cisco XRd Control Plane"
+PID: XRd-CP-C-01       , VID: V01, SN: 5E7AF{0:05d}
+
+NAME: "Rack 0", DESCR: "Cisco XRd Control Plane Container"
+PID: XRd-CP-C-01       , VID: V01, SN: 5E7AF00000"""
+
+INTERFACE_BRIEF = """Thu Mar 27 16:04:30.902 UTC
+
+Interface                      IP-Address      Status          Protocol Vrf-Name
+MgmtEth0/RP0/CPU0/0            172.20.20.{0}    Up              Up       default
+GigabitEthernet0/0/0/0         unassigned      Up              Up       default
+GigabitEthernet0/0/0/1         unassigned      Up              Up       default
+GigabitEthernet0/0/0/2         unassigned      Up              Up       default
+GigabitEthernet0/0/0/3         unassigned      Up              Up       default
+GigabitEthernet0/0/0/4         unassigned      Up              Up       default
+GigabitEthernet0/0/0/5         unassigned      Shutdown        Down     default
+GigabitEthernet0/0/0/6         unassigned      Shutdown        Down     default"""
+
+SAMPLES = [
+    ("show lldp neighbors", LLDP_NEIGHBORS),
+    ("show version", VERSION),
+    ("show inventory", INVENTORY),
+    ("show ipv4 interface brief", INTERFACE_BRIEF),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--outputs", type=int, default=5000, help="outputs per command")
+    args = parser.parse_args()
+
+    # XR 7 and later print `System uptime is` instead of the hostname
+    version = iosxr.parse_version(VERSION.format(0).replace("CU-R1 uptime", "System uptime"))
+    if "hostname" in version or version.get("uptime") != "0 minutes":
+        raise AssertionError("show version: System uptime is parsed as %r" % version)
+
+    for command, template in SAMPLES:
+        outputs = [template.format(index) for index in range(args.outputs)]
+        func = iosxr.find_output_parser(command)
+        if not func(outputs[0]):
+            raise AssertionError("%s: sample output did not parse" % command)
+        # a caller modifying its records must not change the memoized ones
+        records = iosxr.parse_command_output(command, outputs[0])
+        records.clear()
+        if iosxr.parse_command_output(command, outputs[0]) != func(outputs[0]):
+            raise AssertionError("%s: the memoized records were modified by a caller" % command)
+
+        start = time.perf_counter()
+        for output in outputs:
+            func(output)
+        uncached = time.perf_counter() - start
+
+        cached = outputs[: iosxr.PARSED_OUTPUT_CACHE_SIZE]
+        for output in cached:
+            iosxr.parse_command_output(command, output)
+        start = time.perf_counter()
+        for output in cached:
+            iosxr.parse_command_output(command, output)
+        memoized = time.perf_counter() - start
+
+        def threaded(index):
+            output = outputs[index % len(outputs)]
+            return iosxr.parse_command_output(command, output) == func(output)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            if not all(executor.map(threaded, range(len(outputs)))):
+                raise AssertionError("%s: threads got wrong records from the memo" % command)
+
+        print(
+            "%-28s %9.0f outputs/s parsed  %9.0f outputs/s memoized"
+            % (command, len(outputs) / uncached, len(cached) / memoized),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmarks the staged rollout against emulated IOS-XR sites.
+
+Every site wave holds --nodes XrDevices seeded from the running_configs
+fixtures, reached through EmulatorConnections whose latency varies per
+device. The IOS-XR commands of config_commands.yaml, plus a description
+marker, are rolled out wave by wave; the wall time of every wave is
+reported next to its slowest device, and the rollout must take about the
+sum of those. The devices of that run return parsed output
+(parse_output), which the LLDP check must not depend on, and a device
+without LLDP neighbors must fail the check. Then the rollout is run
+again with a device of the second wave losing an LLDP neighbor while its
+trial commit is pending: the first wave must stay confirmed, the later
+waves must not be touched and the failed wave must be back on its previous
+running config once the commit confirmed timer expired.
+
+    python benchmarks/bench_rollout.py [--nodes 10] [--concurrency 10] [--latency 0.002]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cliconf import HOSTNAME_RE, seed_configs  # noqa: E402
+from rollout import SITES, config_task_commands, lldp_neighbors, parse_args, run_rollout  # noqa: E402
+from uninet_lab import new_iosxr_cliconf  # noqa: E402
+from xr_emulator import EmulatorConnection, XrDevice  # noqa: E402
+
+NEIGHBORS = [("peer-a", "GigabitEthernet0/0/0/0", "Gi0/0/0/1"), ("peer-b", "GigabitEthernet0/0/0/1", "Gi0/0/0/0")]
+
+
+class FlappingDevice(XrDevice):
+    """Loses its first LLDP neighbor while a commit confirmed is pending."""
+
+    def _show_lldp_neighbors(self):
+        if self.confirm_deadline:
+            saved, self.lldp_neighbors = self.lldp_neighbors, self.lldp_neighbors[1:]
+            try:
+                return XrDevice._show_lldp_neighbors(self)
+            finally:
+                self.lldp_neighbors = saved
+        return XrDevice._show_lldp_neighbors(self)
+
+
+class EmulatedTarget(object):
+    def __init__(self, device, latency, variables):
+        self.connection = EmulatorConnection(device, latency=latency, host="127.0.0.1")
+        self.cliconf = new_iosxr_cliconf(self.connection, variables)
+
+    def close(self):
+        pass
+
+
+def build_lab(nodes, seeds, latency, rng, flapping=None, variables=None):
+    """Returns (waves, {host: (device, latency)})."""
+    waves = []
+    devices = {}
+    for site in SITES:
+        hosts = []
+        for index in range(nodes):
+            host = "%s-R%d" % (site, index)
+            running = HOSTNAME_RE.sub("hostname " + host, seeds[index % len(seeds)], 1)
+            cls = FlappingDevice if host == flapping else XrDevice
+            devices[host] = (cls(host, running, lldp_neighbors=NEIGHBORS), latency * rng.uniform(0.5, 2.0))
+            hosts.append((host, dict(variables or {})))
+        waves.append((site, hosts))
+    return waves, devices
+
+
+def opener(devices):
+    def open_target(host, variables):
+        device, latency = devices[host]
+        return EmulatedTarget(device, latency, variables)
+
+    return open_target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=10, help="devices per site wave")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.002, help="mean seconds per exchange")
+    parser.add_argument("--timer", type=int, default=2, help="commit confirmed timeout of the failing run")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seeds = seed_configs()
+    # the marker makes the change visible on nodes that already run the commands
+    commands = config_task_commands() + ["interface GigabitEthernet0/0/0/7 description rollout bench"]
+
+    waves, devices = build_lab(args.nodes, seeds, args.latency, rng, variables={"ansible_iosxr_parse_output": True})
+    options = parse_args(["--concurrency", str(args.concurrency), "--timer", "300"])
+    events = []
+    start = time.perf_counter()
+    done, timings = run_rollout(waves, commands, opener(devices), options, events.append)
+    total = time.perf_counter() - start
+    if done != len(waves) or any(device.confirm_deadline for device, _latency in devices.values()):
+        sys.exit("healthy rollout: not every wave was confirmed")
+
+    slowest = {}
+    for event in events:
+        if "elapsed" in event:
+            slowest[event["site"]] = max(slowest.get(event["site"], 0.0), event["elapsed"])
+    print("%-12s %6s %10s %12s" % ("wave", "hosts", "wall ms", "slowest ms"))
+    for site, wall in timings:
+        print("%-12s %6d %10.1f %12.1f" % (site, args.nodes, wall * 1000, slowest[site] * 1000))
+    print(
+        "%-12s %6d %10.1f %12.1f  (sum of the slowest devices)"
+        % ("total", args.nodes * len(waves), total * 1000, sum(slowest.values()) * 1000),
+    )
+
+    lonely = EmulatedTarget(XrDevice("lonely", seeds[0]), 0.0, {})
+    try:
+        lldp_neighbors(lonely.cliconf)
+    except RuntimeError:
+        pass
+    else:
+        sys.exit("lldp check: a device without neighbors passed")
+
+    flapping = "%s-R%d" % (SITES[1], args.nodes - 1)
+    waves, devices = build_lab(args.nodes, seeds, args.latency, rng, flapping=flapping)
+    before = dict((host, device._snapshot()) for host, (device, _latency) in devices.items())
+    options = parse_args(
+        ["--concurrency", str(args.concurrency), "--timer", str(args.timer), "--confirm-margin", "0.5"],
+    )
+    events = []
+    done, _timings = run_rollout(waves, commands, opener(devices), options, events.append)
+    if done != 1:
+        sys.exit("failing rollout: %d waves confirmed, expected 1" % done)
+    time.sleep(args.timer + 0.2)
+
+    states = {}
+    for event in events:
+        if "host" in event:
+            states[event["state"]] = states.get(event["state"], 0) + 1
+    for host, (device, _latency) in devices.items():
+        device._check_confirmed_commit()
+        changed = device._snapshot() != before[host]
+        if host.startswith(SITES[0]) != changed:
+            sys.exit("failing rollout: %s is %s" % (host, "changed" if changed else "unchanged"))
+    print(
+        "failing run: %s lost a neighbor; %s; %s skipped, %s rolled back"
+        % (
+            flapping,
+            ", ".join("%d %s" % (count, state) for state, count in sorted(states.items())),
+            ", ".join(SITES[2:]),
+            SITES[1],
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
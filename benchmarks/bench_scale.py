@@ -0,0 +1,205 @@
+"""Benchmarks backup, fact gathering and diff on generated labs of growing size.
+
+For every --sizes entry, SITESxNODES, scale_lab.generate_lab writes a
+topology, an inventory and seed configs to a temporary directory. The
+inventory is loaded from the static file and built from the topology by
+clab_inventory, and both must list the same hosts. Every IOS-XR host is
+then an XrDevice seeded from its generated config, with the LLDP
+neighbors of the topology, behind an EmulatorConnection, and is driven by
+the fleet_exec IosxrDriver through --forks threads:
+
+- backup: the fleet_exec backup of the running config to a ConfigStore;
+- facts: get_device_info and `show lldp neighbors`, whose neighbors must
+  match the topology links (lldp_verify);
+- diff: get_diff of a candidate against the running config.
+
+The wall time, the time per host and its growth over the smallest size
+are reported for every operation.
+
+    python benchmarks/bench_scale.py [--sizes 3x10 10x30 30x100] [--latency 0.002] [--forks 30]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_cliconf import CANDIDATE  # noqa: E402
+from cli_session import network_os_name  # noqa: E402
+from clab_inventory import InventoryCache, inventory_list  # noqa: E402
+from config_store import ConfigStore  # noqa: E402
+from fleet_exec import IosxrDriver, backup  # noqa: E402
+from lldp_verify import LinkIndex, parse_neighbors, verify  # noqa: E402
+from scale_lab import generate_lab  # noqa: E402
+from uninet_lab import load_inventory, load_topology, new_iosxr_cliconf  # noqa: E402
+from xr_emulator import EmulatorConnection, XrDevice  # noqa: E402
+
+
+class EmulatedDriver(IosxrDriver):
+    """IosxrDriver talking to an emulated device instead of over SSH."""
+
+    def __init__(self, host, variables, device, latency):
+        IosxrDriver.__init__(self, host, variables)
+        self.device = device
+        self.latency = latency
+
+    def open(self):
+        self.session = EmulatorConnection(self.device, latency=self.latency, host=self.host)
+        self.cliconf = new_iosxr_cliconf(self.session, self.variables)
+        return self
+
+    def close(self):
+        pass
+
+
+def parse_size(value):
+    sites, sep, nodes = value.lower().partition("x")
+    if not sep or not sites.isdigit() or not nodes.isdigit():
+        raise argparse.ArgumentTypeError("sizes are SITESxNODES, got %r" % value)
+    return int(sites), int(nodes)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def load_lab(paths):
+    """Loads both inventories and returns ({inventory: seconds}, hosts,
+    IOS-XR hosts).
+    """
+    (inventory, _groups), static_time = timed(lambda: load_inventory(paths["inventory"]))
+    cache = InventoryCache(os.path.join(os.path.dirname(paths["topology"]), ".inventory_cache"))
+    dynamic, dynamic_time = timed(lambda: inventory_list(paths["topology"], cache, refresh=True))
+    if sorted(dynamic["_meta"]["hostvars"]) != sorted(inventory):
+        sys.exit("%s: the static and the dynamic inventories differ" % paths["topology"])
+    hosts = [
+        host for host in inventory if network_os_name(inventory[host].get("ansible_network_os")) == "iosxr"
+    ]
+    return {"static inventory": static_time, "clab inventory": dynamic_time}, inventory, hosts
+
+
+def build_drivers(paths, index, inventory, hosts, latency):
+    neighbors = {}
+    for (node, interface), (_link, (peer, peer_interface)) in sorted(index.ports.items()):
+        neighbors.setdefault(node, []).append((peer, interface, peer_interface))
+    drivers = []
+    for host in hosts:
+        node = index.node_name(host)
+        with open(os.path.join(paths["configs"], "%s.cfg" % host)) as f:
+            device = XrDevice(node, f.read(), lldp_neighbors=neighbors.get(node))
+        drivers.append(EmulatedDriver(host, inventory[host], device, latency))
+    return drivers
+
+
+def run_operation(drivers, forks, func, *args):
+    """Runs ``func(driver, *args)`` for every driver and returns (results,
+    seconds).
+    """
+
+    def run(driver):
+        driver.open()
+        try:
+            return func(driver, *args)
+        finally:
+            driver.close()
+
+    executor = ThreadPoolExecutor(max_workers=forks)
+    try:
+        return timed(lambda: list(executor.map(run, drivers)))
+    finally:
+        executor.shutdown()
+
+
+def check_results(label, index, drivers, store, facts, diffs):
+    for driver in drivers:
+        if not store.history(driver.host):
+            sys.exit("%s: no backup of %s" % (label, driver.host))
+    observations = []
+    for driver, (info, outputs) in zip(drivers, facts):
+        node = index.node_name(driver.host)
+        if info.get("network_os_hostname") != node:
+            sys.exit("%s: %s reported hostname %s" % (label, driver.host, info.get("network_os_hostname")))
+        for interface, system_name, port in parse_neighbors("iosxr", outputs[0]):
+            observations.append((node, interface, system_name, port))
+    report = verify(index, observations, set(index.node_name(driver.host) for driver in drivers))
+    for category in ("missing", "extra", "miswired", "one_sided"):
+        if report[category]:
+            sys.exit("%s: %d %s links, e.g. %s" % (label, len(report[category]), category, report[category][0]))
+    if not all(diff.get("config_diff") for diff in diffs):
+        sys.exit("%s: a diff against the candidate came back empty" % label)
+
+
+def op_facts(driver, store, directory):
+    return driver.facts(), driver.show(["show lldp neighbors"])
+
+
+def op_diff(driver, store, directory):
+    return driver.cliconf.get_diff(candidate=CANDIDATE, running=driver.running_config())
+
+
+OPERATIONS = [("backup", backup), ("facts", op_facts), ("diff", op_diff)]
+
+
+def run_size(sites, nodes, args):
+    """Returns (paths, hosts, IOS-XR hosts, {operation: seconds}) of a lab
+    of ``sites`` x ``nodes``.
+    """
+    label = "%dx%d" % (sites, nodes)
+    workdir = tempfile.mkdtemp(prefix="bench-scale-")
+    try:
+        paths = generate_lab(workdir, sites, nodes, hubs=args.hubs)
+        index = LinkIndex(load_topology(paths["topology"]))
+        timings, inventory, hosts = load_lab(paths)
+        drivers = build_drivers(paths, index, inventory, hosts, args.latency)
+
+        store = ConfigStore(os.path.join(workdir, "config_history"))
+        directory = os.path.join(workdir, "backups")
+        os.makedirs(directory)
+        results = {}
+        for name, func in OPERATIONS:
+            results[name], timings[name] = run_operation(drivers, args.forks, func, store, directory)
+        check_results(label, index, drivers, store, results["facts"], results["diff"])
+        return paths, inventory, hosts, timings
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[(3, 10), (10, 30), (30, 100)])
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per exchange")
+    parser.add_argument("-f", "--forks", type=int, default=30, help="devices driven at once")
+    parser.add_argument("--hubs", type=int, default=2, help="meshed XRd nodes per site")
+    args = parser.parse_args()
+
+    # the first run pays for loading the plugin and the collections
+    run_size(1, 3, args)
+
+    print(
+        "%-9s %6s %6s %6s %-18s %10s %12s %8s"
+        % ("size", "nodes", "xrd", "links", "operation", "wall s", "ms/host", "growth"),
+    )
+    baseline = {}
+    for sites, nodes in args.sizes:
+        paths, inventory, hosts, timings = run_size(sites, nodes, args)
+        label = "%dx%d" % (sites, nodes)
+        for name, elapsed in timings.items():
+            count = len(inventory) if name.endswith("inventory") else len(hosts)
+            per_host = elapsed * 1000 / max(count, 1)
+            growth = per_host / baseline.setdefault(name, per_host)
+            print(
+                "%-9s %6d %6d %6d %-18s %10.3f %12.3f %8.2f"
+                % (label, paths["nodes"], len(hosts), paths["links"], name, elapsed, per_host, growth),
+            )
+
+
+if __name__ == "__main__":
+    main()
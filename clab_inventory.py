@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""Dynamic Ansible inventory of the containerlab topology.
+
+Hosts are the nodes of uninet-lab-v1.yaml, named like containerlab names
+their containers (clab-<lab>-<node>). Every node is put in the group of its
+kind, with the connection vars of that kind, and in the group named by its
+``ansible-group`` label. When the lab is deployed, the management addresses
+are read from clab-<lab>/topology-data.json, otherwise ansible_host is the
+container name, which containerlab adds to /etc/hosts.
+
+The generated inventory is cached, keyed on the size, mtime and sha256 of
+the topology file and of the deployed state: an unchanged stat answers from
+the cache without reading the topology, a touched file with the same hash
+only refreshes the key.
+
+    ansible-playbook -i clab_inventory.py show_ver.yaml
+    python clab_inventory.py --list [--topology uninet-lab-v1.yaml] [--refresh]
+    python clab_inventory.py --host clab-uninet-lab-v1-CU-R1
+
+The lab scripts accept it too, e.g. ``fleet_exec.py -i clab_inventory.py``.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from uninet_lab import LAB_DIR, TOPOLOGY  # noqa: E402
+
+DEFAULT_CACHE_DIR = os.path.join(LAB_DIR, ".inventory_cache")
+CACHE_VERSION = 1
+
+ALL_VARS = {
+    # The inventory is assumed to be used from the clab host, hence no
+    # http proxy should be used.
+    "ansible_httpapi_use_proxy": False,
+    "ansible_ssh_common_args": "-o StrictHostKeyChecking=no",
+}
+
+# containerlab kind -> connection vars of its group
+KIND_VARS = {
+    "xrd": {
+        "ansible_connection": "network_cli",
+        "ansible_network_os": "iosxr",
+        "ansible_user": "admin",
+        "ansible_password": "cisco123",
+        "ansible_iosxr_config_backend": "cli",
+    },
+    "crpd": {
+        "ansible_connection": "netconf",
+        "ansible_network_os": "junipernetworks.junos.junos",
+        "ansible_user": "root",
+        "ansible_password": "clab123",
+        "ansible_netconf_port": 830,
+    },
+    "cisco_csr1000v": {
+        "ansible_connection": "ansible.netcommon.network_cli",
+        "ansible_network_os": "cisco.ios.ios",
+        "ansible_user": "admin",
+        "ansible_password": "admin",
+        "ansible_become": True,
+        "ansible_become_method": "enable",
+    },
+}
+
+try:
+    SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    SafeLoader = yaml.SafeLoader
+
+
+def file_key(path):
+    """Returns [size, mtime_ns] of ``path``, or None when it is missing."""
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError):
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def file_sha(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def node_longname(topology, node):
+    prefix = topology.get("prefix", "clab")
+    if prefix == "":
+        return node
+    if prefix == "__lab-name":
+        return "%s-%s" % (topology.get("name", ""), node)
+    return "%s-%s-%s" % (prefix, topology.get("name", ""), node)
+
+
+def state_path(topology_path, name):
+    """Returns the topology-data.json containerlab writes on deploy."""
+    return os.path.join(os.path.dirname(os.path.abspath(topology_path)), "clab-%s" % name, "topology-data.json")
+
+
+def build_inventory(topology, state=None):
+    """Returns the inventory in the JSON format of Ansible script inventories."""
+    deployed = (state or {}).get("nodes") or {}
+    nodes = (topology.get("topology") or {}).get("nodes") or {}
+    kinds = (topology.get("topology") or {}).get("kinds") or {}
+    defaults = (topology.get("topology") or {}).get("defaults") or {}
+
+    groups = {}
+    hostvars = {}
+
+    def member(group, host):
+        groups.setdefault(group, {"hosts": []})["hosts"].append(host)
+
+    for name, node in nodes.items():
+        node = node or {}
+        kind = node.get("kind") or defaults.get("kind")
+        labels = dict(defaults.get("labels") or {})
+        labels.update((kinds.get(kind) or {}).get("labels") or {})
+        labels.update(node.get("labels") or {})
+        state_node = deployed.get(name) or {}
+        host = state_node.get("longname") or node_longname(topology, name)
+
+        hostvars[host] = {
+            "ansible_host": state_node.get("mgmt-ipv4-address") or node.get("mgmt-ipv4") or host,
+            "clab_node": name,
+            "clab_kind": kind,
+            "clab_image": state_node.get("image") or node.get("image") or (kinds.get(kind) or {}).get("image"),
+            "clab_labels": labels,
+            "clab_deployed": bool(state_node),
+        }
+        if kind:
+            member(kind, host)
+        if labels.get("ansible-group"):
+            member(labels["ansible-group"], host)
+
+    for kind, variables in KIND_VARS.items():
+        if kind in groups:
+            groups[kind]["vars"] = dict(variables)
+
+    inventory = {"all": {"children": sorted(groups), "vars": dict(ALL_VARS)}}
+    inventory.update(groups)
+    inventory["_meta"] = {"hostvars": hostvars}
+    return inventory
+
+
+class InventoryCache(object):
+    """One JSON file per topology path holding the inventory and the keys
+    of the files it was built from.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+
+    def path(self, topology_path):
+        digest = hashlib.sha1(os.path.abspath(topology_path).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.directory, "inventory-%s.json" % digest)
+
+    def load(self, topology_path):
+        try:
+            with open(self.path(topology_path)) as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        return entry if entry.get("version") == CACHE_VERSION else None
+
+    def store(self, topology_path, entry):
+        entry["version"] = CACHE_VERSION
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp, self.path(topology_path))
+        except (IOError, OSError):
+            # a read-only checkout still gets an inventory, only slower
+            pass
+
+
+def _fresh(sources):
+    """Checks the cached file keys; returns (fresh, touched), touched when a
+    file changed its stat but not its content.
+    """
+    touched = False
+    for source in sources:
+        key = file_key(source["path"])
+        if key == source["key"]:
+            continue
+        if file_sha(source["path"]) != source["sha"]:
+            return False, False
+        source["key"] = key
+        touched = True
+    return True, touched
+
+
+def inventory_list(topology_path=TOPOLOGY, cache=None, refresh=False):
+    """Returns the inventory of ``topology_path``, from the cache when the
+    topology and the deployed state are unchanged.
+    """
+    cache = cache or InventoryCache()
+    entry = None if refresh else cache.load(topology_path)
+    if entry is not None:
+        fresh, touched = _fresh(entry["sources"])
+        if fresh:
+            if touched:
+                cache.store(topology_path, entry)
+            return entry["inventory"]
+
+    with open(topology_path, "rb") as f:
+        data = f.read()
+    topology = yaml.load(data, Loader=SafeLoader) or {}
+    sources = [{"path": topology_path, "key": file_key(topology_path), "sha": hashlib.sha256(data).hexdigest()}]
+
+    state = None
+    path = state_path(topology_path, topology.get("name", ""))
+    key = file_key(path)
+    sha = None
+    if key is not None:
+        with open(path, "rb") as f:
+            raw = f.read()
+        sha = hashlib.sha256(raw).hexdigest()
+        try:
+            state = json.loads(raw)
+        except ValueError:
+            state = None
+    # the deployed state is part of the key even while absent, so deploying
+    # the lab invalidates the entry
+    sources.append({"path": path, "key": key, "sha": sha})
+
+    inventory = build_inventory(topology, state)
+    cache.store(topology_path, {"sources": sources, "inventory": inventory})
+    return inventory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--list", action="store_true", help="print the whole inventory")
+    parser.add_argument("--host", help="print the vars of a host")
+    parser.add_argument(
+        "--topology",
+        default=os.environ.get("CLAB_TOPOLOGY", TOPOLOGY),
+        help="containerlab topology file, $CLAB_TOPOLOGY by default",
+    )
+    parser.add_argument("--cache-dir", default=os.environ.get("CLAB_INVENTORY_CACHE_DIR", DEFAULT_CACHE_DIR))
+    parser.add_argument("--refresh", action="store_true", help="rebuild the cached inventory")
+    args = parser.parse_args()
+
+    inventory = inventory_list(args.topology, InventoryCache(args.cache_dir), args.refresh)
+    if args.host:
+        print(json.dumps(inventory["_meta"]["hostvars"].get(args.host, {})))
+    else:
+        print(json.dumps(inventory))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Interactive SSH CLI session usable as the connection of a cliconf plugin.
+
+CliSession implements the part of the ansible.netcommon network_cli
+connection API that the iosxr Cliconf relies on (send, receive, get_prompt,
+queue_message, get/set_option and the prompt context helper), so the lab
+scripts can drive devices with the same plugin code the playbooks use,
+without a persistent ansible-connection process per host.
+
+paramiko is required to open sessions.
+"""
+
+import importlib
+import re
+import time
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.module_utils._text import to_bytes, to_text
+
+from output_spool import LineSpooler
+
+try:
+    import paramiko
+
+    HAS_PARAMIKO = True
+except ImportError:
+    HAS_PARAMIKO = False
+
+ANSI_RE = re.compile(rb"\x1b\[\??\d*(?:;\d*)*[a-zA-Z]|\x08|\r")
+
+# network_os -> (terminal plugin module, commands sent once the shell is open)
+TERMINALS = {
+    "iosxr": (
+        "ansible_collections.cisco.iosxr.plugins.terminal.iosxr",
+        [b"terminal length 0", b"terminal width 512", b"terminal exec prompt no-timestamp"],
+    ),
+    "ios": (
+        "ansible_collections.cisco.ios.plugins.terminal.ios",
+        [b"terminal length 0", b"terminal width 512"],
+    ),
+}
+
+DEFAULT_STDOUT_RE = [re.compile(rb"[\r\n]?[\w+\-\.:\/\[\]]+(?:\([^\)]+\)){,3}(?:>|#) ?$")]
+DEFAULT_STDERR_RE = [
+    re.compile(rb"% ?Error"),
+    re.compile(rb"invalid input", re.I),
+    re.compile(rb"(?:incomplete|ambiguous) command", re.I),
+]
+
+
+def network_os_name(network_os):
+    """Returns the short platform name of an ansible_network_os value."""
+    return (network_os or "").split(".")[-1]
+
+
+def terminal_regexes(network_os):
+    """Returns the stdout and stderr regexes of the platform terminal plugin."""
+    module_name = TERMINALS.get(network_os_name(network_os), (None,))[0]
+    if module_name:
+        try:
+            terminal = importlib.import_module(module_name).TerminalModule
+            return list(terminal.terminal_stdout_re), list(terminal.terminal_stderr_re)
+        except ImportError:
+            pass
+    return list(DEFAULT_STDOUT_RE), list(DEFAULT_STDERR_RE)
+
+
+class CliSession(object):
+    def __init__(
+        self,
+        host,
+        username=None,
+        password=None,
+        port=22,
+        network_os="iosxr",
+        command_timeout=30,
+        buffer_read_timeout=0.1,
+    ):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.port = int(port or 22)
+        self.network_os = network_os_name(network_os)
+        self.command_timeout = command_timeout
+        self.buffer_read_timeout = buffer_read_timeout
+        self.messages = []
+
+        self._options = {"host": host, "terminal_stderr_re": None}
+        self._terminal_stdout_re, self._default_stderr_re = terminal_regexes(network_os)
+        self._terminal_stderr_re = self._default_stderr_re
+        self._client = None
+        self._shell = None
+        self._matched_prompt = None
+
+    @property
+    def connected(self):
+        return self._shell is not None and not self._shell.closed
+
+    def open(self):
+        if not HAS_PARAMIKO:
+            raise AnsibleConnectionFailure("paramiko is required to open a CLI session")
+        self._client = paramiko.SSHClient()
+        self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._client.connect(
+            self.host,
+            port=self.port,
+            username=self.username,
+            password=self.password,
+            look_for_keys=False,
+            allow_agent=False,
+            timeout=self.command_timeout,
+        )
+        self._shell = self._client.invoke_shell(width=512, height=0)
+        self._shell.settimeout(self.command_timeout)
+        self.receive()
+        for command in TERMINALS.get(self.network_os, (None, []))[1]:
+            self.send(command)
+        return self
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+        self._client = self._shell = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get_option(self, option):
+        return self._options.get(option)
+
+    def set_option(self, option, value):
+        self._options[option] = value
+
+    def queue_message(self, level, message):
+        self.messages.append((level, message))
+
+    def get_prompt(self):
+        return self._matched_prompt
+
+    def send(
+        self,
+        command,
+        prompt=None,
+        answer=None,
+        newline=True,
+        sendonly=False,
+        prompt_retry_check=False,
+        check_all=False,
+        strip_prompt=True,
+    ):
+        command = to_bytes(command)
+        self._shell.sendall(command + b"\r")
+        if sendonly:
+            return None
+        response = self.receive(command, prompt, answer, newline, prompt_retry_check, check_all, strip_prompt)
+        return to_text(response, errors="surrogate_then_replace")
+
+    def receive(
+        self,
+        command=None,
+        prompts=None,
+        answer=None,
+        newline=True,
+        prompt_retry_check=False,
+        check_all=False,
+        strip_prompt=True,
+    ):
+        self._terminal_stderr_re = self._stderr_regexes()
+        prompts = [re.compile(to_bytes(p), re.I) for p in _as_list(prompts)]
+        answers = [to_bytes(a) for a in _as_list(answer)]
+        handled = False
+        errored = None
+        recv = b""
+        deadline = time.monotonic() + self.command_timeout
+
+        while True:
+            data = self._read(deadline)
+            recv += ANSI_RE.sub(b"", data)
+            window = recv[-256:]
+
+            if prompts and not handled:
+                handled = self._handle_prompt(window, prompts, answers, newline, check_all)
+
+            if any(regex.search(window) for regex in self._terminal_stderr_re):
+                errored = window
+
+            if self._find_prompt(window) and not self._pending():
+                if errored:
+                    raise AnsibleConnectionFailure(to_text(errored))
+                return self._sanitize(recv, command, strip_prompt)
+
+    def send_spooled(self, command, output):
+        """Sends ``command`` and writes its reply to ``output``, a
+        SpooledOutput, as it is received; returns ``output``. Only the last
+        line and a window for the prompt and error regexes are held in
+        memory, and the echo and prompt lines are dropped like ``send``
+        does, against the prompt the previous command ended with.
+        """
+        command = to_bytes(command)
+        self._shell.sendall(command + b"\r")
+        self._terminal_stderr_re = self._stderr_regexes()
+        spooler = LineSpooler(output, command, self._matched_prompt)
+        errored = None
+        window = carry = b""
+        deadline = time.monotonic() + self.command_timeout
+
+        while True:
+            data = carry + self._read(deadline)
+            # escape sequences do not span lines, keep the last one whole
+            cut = data.rfind(b"\n") + 1
+            clean = ANSI_RE.sub(b"", data[:cut])
+            carry = data[cut:]
+            spooler.feed(clean)
+            window = (window + clean)[-256:]
+            tail = window + ANSI_RE.sub(b"", carry)
+
+            if any(regex.search(tail) for regex in self._terminal_stderr_re):
+                errored = tail
+
+            if self._find_prompt(tail) and not self._pending():
+                if errored:
+                    raise AnsibleConnectionFailure(to_text(errored))
+                spooler.feed(ANSI_RE.sub(b"", carry))
+                return spooler.finish(self._matched_prompt)
+
+    def _update_cli_prompt_context(self, config_context=None, exit_command="exit"):
+        """Leaves configuration mode when the current prompt shows it."""
+        prompt = to_text(self._matched_prompt or b"", errors="surrogate_or_strict").strip()
+        if config_context and prompt.endswith(config_context):
+            self.send(exit_command)
+
+    def _stderr_regexes(self):
+        option = self._options.get("terminal_stderr_re")
+        if not option:
+            return self._default_stderr_re
+        return [
+            re.compile(to_bytes(item["pattern"]), getattr(re, item["flags"].split(".")[-1]) if item.get("flags") else 0)
+            for item in option
+        ]
+
+    def _read(self, deadline):
+        while not self._shell.recv_ready():
+            if self._shell.closed or self._shell.exit_status_ready():
+                raise AnsibleConnectionFailure("%s: session closed by the device" % self.host)
+            if time.monotonic() > deadline:
+                raise AnsibleConnectionFailure(
+                    "%s: command timeout of %s seconds reached" % (self.host, self.command_timeout),
+                )
+            time.sleep(0.005)
+        return self._shell.recv(65536)
+
+    def _pending(self):
+        """Waits buffer_read_timeout for more output after a prompt matched,
+        in case the prompt was matched in the middle of the response.
+        """
+        deadline = time.monotonic() + self.buffer_read_timeout
+        while time.monotonic() < deadline:
+            if self._shell.recv_ready():
+                return True
+            time.sleep(0.005)
+        return False
+
+    def _handle_prompt(self, window, prompts, answers, newline, check_all):
+        for index, regex in enumerate(prompts):
+            if regex.search(window):
+                reply = answers[index] if len(answers) > index else answers[0]
+                self._shell.sendall(reply + (b"\r" if newline else b""))
+                if check_all and len(prompts) > 1:
+                    prompts.pop(0)
+                    answers.pop(0)
+                    return False
+                return True
+        return False
+
+    def _find_prompt(self, window):
+        for regex in self._terminal_stdout_re:
+            match = regex.search(window)
+            if match:
+                self._matched_prompt = match.group()
+                return True
+        return False
+
+    def _sanitize(self, recv, command=None, strip_prompt=True):
+        prompt = (self._matched_prompt or b"").strip()
+        cleaned = []
+        for line in recv.splitlines():
+            if command and line.strip() == command.strip():
+                continue
+            if strip_prompt and prompt and prompt in line:
+                continue
+            cleaned.append(line)
+        return b"\n".join(cleaned).strip()
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
@@ -0,0 +1,136 @@
+"""Aggregates the iosxr cliconf metrics file into counters and histograms.
+
+The plugin appends one JSON line per cliconf method call to the file named
+by ``ansible_iosxr_metrics_file``. This script folds them into per-host
+series, by method and by command, with call and error counts, bytes sent
+and received and a latency histogram, and prints them as JSON lines or in
+the Prometheus text exposition format.
+
+    python cliconf_metrics.py metrics.jsonl
+    python cliconf_metrics.py metrics.jsonl --format prometheus > cliconf.prom
+"""
+
+import argparse
+import json
+import re
+import sys
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+NUMBER_RE = re.compile(r"\d+(?:[/.:]\d+)*")
+
+
+def command_key(command, words=3):
+    """Bounds the label cardinality of a command: batches collapse into
+    ``<batch>``, numbers (interfaces, addresses, IDs) into ``N`` and only the
+    first ``words`` words are kept.
+    """
+    if "\r" in command:
+        return "<batch>"
+    command = command.split("|")[0]
+    return " ".join(NUMBER_RE.sub("N", command).split()[:words]) or "<empty>"
+
+
+class Series(object):
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.sent = 0
+        self.received = 0
+        self.prompts = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.seconds += seconds
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes_sent": self.sent,
+            "bytes_received": self.received,
+            "prompt_queries": self.prompts,
+            "seconds_sum": round(self.seconds, 6),
+            "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS], self.buckets)),
+        }
+
+
+def aggregate(lines, words=3):
+    """Returns {(kind, host, name): Series} for kind "method" and "command"."""
+    series = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        call = json.loads(line)
+        method = series.setdefault(("method", call["host"], call["method"]), Series())
+        method.observe(call["seconds"])
+        method.errors += bool(call.get("error"))
+        method.prompts += call.get("prompts", 0)
+        for command, seconds, sent, received in call["commands"]:
+            method.sent += sent
+            method.received += received
+            entry = series.setdefault(("command", call["host"], command_key(command, words)), Series())
+            entry.observe(seconds)
+            entry.sent += sent
+            entry.received += received
+    return series
+
+
+def _labels(kind, host, name):
+    return '%s="%s",host="%s"' % (kind, name.replace("\\", "\\\\").replace('"', '\\"'), host)
+
+
+def prometheus_text(series):
+    out = []
+    for kind in ("method", "command"):
+        prefix = "iosxr_cliconf_%s" % kind
+        out.append("# HELP %s_seconds Latency of iosxr cliconf %s calls." % (prefix, kind))
+        out.append("# TYPE %s_seconds histogram" % prefix)
+        entries = sorted(item for item in series.items() if item[0][0] == kind)
+        for (_kind, host, name), entry in entries:
+            labels = _labels(kind, host, name)
+            for bound, count in zip(LATENCY_BUCKETS, entry.buckets):
+                out.append('%s_seconds_bucket{%s,le="%s"} %d' % (prefix, labels, bound, count))
+            out.append('%s_seconds_bucket{%s,le="+Inf"} %d' % (prefix, labels, entry.count))
+            out.append("%s_seconds_sum{%s} %s" % (prefix, labels, round(entry.seconds, 6)))
+            out.append("%s_seconds_count{%s} %d" % (prefix, labels, entry.count))
+        for metric, attr, help_text in (
+            ("errors_total", "errors", "calls that raised"),
+            ("sent_bytes_total", "sent", "bytes written to the device"),
+            ("received_bytes_total", "received", "bytes read from the device"),
+            ("prompt_queries_total", "prompts", "get_prompt calls"),
+        ):
+            if kind == "command" and attr in ("errors", "prompts"):
+                continue
+            out.append("# HELP %s_%s Number of %s." % (prefix, metric, help_text))
+            out.append("# TYPE %s_%s counter" % (prefix, metric))
+            for (_kind, host, name), entry in entries:
+                out.append("%s_%s{%s} %d" % (prefix, metric, _labels(kind, host, name), getattr(entry, attr)))
+    return "\n".join(out) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("metrics_file")
+    parser.add_argument("--format", choices=["json", "prometheus"], default="json")
+    parser.add_argument("--command-words", type=int, default=3, help="words kept in command labels")
+    args = parser.parse_args()
+
+    with open(args.metrics_file) as f:
+        series = aggregate(f, args.command_words)
+
+    if args.format == "prometheus":
+        sys.stdout.write(prometheus_text(series))
+        return
+    for (kind, host, name), entry in sorted(series.items()):
+        record = {"kind": kind, "host": host, kind: name}
+        record.update(entry.as_dict())
+        print(json.dumps(record))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""Checks the IOS-XR running configs of the fleet against the golden config.
+
+The intent is the first boot config of the XRd nodes (a containerlab
+template, rendered with the --set values; the node name is matched as any
+hostname, secrets only by their keyword) plus the iosxr_config commands of
+config_commands.yaml, a `no ...` command requiring the line to be absent.
+It is parsed once in this process and handed to every worker of a process
+pool, which parses and checks the running configs. The running configs are
+the running_configs/ archive, the newest version of every host of a
+ConfigStore, or fetched from the devices with --fetch.
+
+A JSON line is printed per host with its deviations grouped by top level
+block: missing golden or policy lines, present `no` lines and, with
+--extra, lines the golden blocks do not define.
+
+    python compliance.py
+    python compliance.py --workers 8 --extra
+    python compliance.py --fetch --limit xrd --set Env.CLAB_MGMT_VRF=mgmt
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ansible.module_utils._text import to_text
+
+from config_store import ConfigStore
+from rollout import CONFIG_COMMANDS, config_task_commands
+from uninet_lab import (
+    INVENTORY,
+    LAB_DIR,
+    RUNNING_CONFIGS_DIR,
+    is_iosxr_config,
+    load_inventory,
+    load_iosxr_cliconf,
+    running_config_files,
+    select_hosts,
+)
+
+GOLDEN_CONFIG = os.path.join(LAB_DIR, "first_boot_configs", "xrd_config.cfg")
+
+# per node values of the template, matched as any word
+NODE_FIELDS = ("ShortName",)
+WILDCARD = "\0"
+# lines compared by their keyword only, the device stores them hashed
+MASKED_KEYWORDS = ("secret", "password")
+# defaults the device spells out, e.g. `ssh server netconf vrf default`
+IMPLICIT_SUFFIXES = (" vrf default",)
+
+TEMPLATE_ACTION_RE = re.compile(r"\{\{(-?)\s*(.*?)\s*(-?)\}\}", re.S)
+
+
+def render_template(text, values):
+    """Renders the subset of Go templates used by the containerlab startup
+    configs: ``{{ .Field }}``, ``{{ if .Field }}...{{ end }}`` with an
+    optional else, and the ``{{-``/``-}}`` whitespace trimming. Fields are
+    looked up by their dotted name in ``values``; a missing one is empty.
+    """
+    out = []
+    stack = [True]
+    trim_next = False
+    position = 0
+    for match in TEMPLATE_ACTION_RE.finditer(text):
+        literal = text[position : match.start()]
+        if trim_next:
+            literal = literal.lstrip()
+        if match.group(1):
+            literal = literal.rstrip()
+        if all(stack):
+            out.append(literal)
+        position = match.end()
+        trim_next = bool(match.group(3))
+
+        action = match.group(2)
+        words = action.split()
+        if words[:1] == ["if"]:
+            stack.append(bool(values.get(words[1].lstrip("."), "")))
+        elif action == "else":
+            stack[-1] = not stack[-1]
+        elif action == "end":
+            stack.pop()
+        elif action.startswith(".") and all(stack):
+            out.append(to_text(values.get(action[1:], "")))
+    literal = text[position:]
+    out.append(literal.lstrip() if trim_next else literal)
+    return "".join(out)
+
+
+def segment(text):
+    """Returns the text of a golden line, or ("re", pattern) when it holds
+    a node field or a masked value.
+    """
+    words = text.split()
+    if words and words[0] in MASKED_KEYWORDS:
+        return ("re", r"%s(\s.*)?$" % re.escape(words[0]))
+    if WILDCARD in text:
+        return ("re", r"\S+".join(re.escape(part) for part in text.split(WILDCARD)) + "$")
+    return text
+
+
+def display(path):
+    return " > ".join(part if isinstance(part, str) else part[1] for part in path)
+
+
+def golden_requirements(path=GOLDEN_CONFIG, values=None):
+    """Returns the (source, path) of every line of the rendered template."""
+    fields = dict((field, WILDCARD) for field in NODE_FIELDS)
+    fields.update(values or {})
+    with open(path) as f:
+        rendered = render_template(f.read(), fields)
+
+    iosxr = load_iosxr_cliconf()
+    requirements = []
+    for item in iosxr.parse_config_lines(iosxr.iter_config_lines([rendered]), ["!"]):
+        if not item.parents and item.text == "end":
+            continue
+        requirements.append(("golden", tuple(segment(text) for text in item.parents + [item.text])))
+    return requirements
+
+
+def policy_requirements(commands):
+    """Returns the (source, words, negated) of the policy commands, spelled
+    the way the running config does.
+    """
+    iosxr = load_iosxr_cliconf()
+    requirements = []
+    for command in commands:
+        words = iosxr.normalize_config_line(command.strip()).split()
+        negated = words[0] == "no" and len(words) > 1
+        requirements.append(("policy", tuple(words[1:] if negated else words), negated))
+    return requirements
+
+
+_golden = None
+_policy = None
+_extra = False
+_regexes = {}
+
+
+def init_worker(golden, policy, extra):
+    """Pool initializer: receives the parsed intent once per worker."""
+    global _golden, _policy, _extra
+    _golden, _policy, _extra = golden, policy, extra
+    load_iosxr_cliconf()
+
+
+def _match(part, text):
+    if isinstance(part, str):
+        return part == text
+    regex = _regexes.get(part[1])
+    if regex is None:
+        regex = _regexes[part[1]] = re.compile(part[1])
+    return regex.match(text) is not None
+
+
+def _spellings(words):
+    """Returns the ways the running config may spell the command ``words``:
+    the device keeps the config of an absent interface under
+    `interface preconfigure X`.
+    """
+    if words[:1] == ["interface"] and words[1:2] != ["preconfigure"] and len(words) > 1:
+        return [words, ["interface", "preconfigure"] + words[1:]]
+    return [words]
+
+
+def _find(running, path, children):
+    """Returns the running config key matching the golden ``path``."""
+    key = ()
+    for part in path:
+        if isinstance(part, str):
+            for spelling in _spellings(part.split()):
+                for suffix in ("",) + IMPLICIT_SUFFIXES:
+                    if key + (" ".join(spelling) + suffix,) in running.objects:
+                        key = key + (" ".join(spelling) + suffix,)
+                        break
+                else:
+                    continue
+                break
+            else:
+                return None
+            continue
+        found = [child for child in children.get(key, ()) if _match(part, child)]
+        if not found:
+            return None
+        key = key + (found[0],)
+    return key
+
+
+def _match_policy(iosxr, running, words):
+    """Returns the running config path of the policy command ``words``, in
+    any of its spellings, or None.
+    """
+    for spelling in _spellings(list(words)):
+        path = iosxr._match_config_path(running, (), spelling)
+        if path:
+            return path
+    return None
+
+
+def _block_of(running, words):
+    """Returns the longest top level line starting ``words``. When there is
+    none, an `interface X ...` one-liner belongs to its `interface X` mode
+    line, any other command is its own block.
+    """
+    for spelling in _spellings(list(words)):
+        for size in range(len(spelling) - 1, 0, -1):
+            head = " ".join(spelling[:size])
+            if (head,) in running.objects:
+                return head
+    if words[:1] == ("interface",) and len(words) > 2:
+        return " ".join(words[:3] if words[1] == "preconfigure" else words[:2])
+    return " ".join(words)
+
+
+def check_config(host, text):
+    """Returns the deviation record of a running config."""
+    iosxr = load_iosxr_cliconf()
+    running = iosxr.ParsedConfig(iosxr.iter_config_lines([text]))
+    children = {}
+    for key in running.objects:
+        children.setdefault(key[:-1], []).append(key[-1])
+
+    blocks = {}
+
+    def deviation(block, kind, source, line):
+        blocks.setdefault(block, []).append({"kind": kind, "source": source, "line": line})
+
+    matched = set()
+
+    def match(key):
+        matched.update(key[:size] for size in range(1, len(key) + 1))
+
+    for source, path in _golden:
+        key = _find(running, path, children)
+        if key is None:
+            deviation(display(path[:1]), "missing", source, display(path))
+        else:
+            match(key)
+
+    for source, words, negated in _policy:
+        path = _match_policy(iosxr, running, words)
+        if path:
+            match(tuple(path))
+        block = path[0] if path else _block_of(running, words)
+        if negated and path:
+            deviation(block, "unexpected", source, "no " + " ".join(words))
+        elif not negated and not path:
+            deviation(block, "missing", source, " ".join(words))
+
+    if _extra:
+        for top in set(key[:1] for key in matched):
+            for item in running.get_block(top)[1:]:
+                key = tuple(item.parents) + (item.text,)
+                if key not in matched:
+                    deviation(top[0], "extra", "running", " > ".join(key))
+
+    return {
+        "host": host,
+        "compliant": not blocks,
+        "deviations": sum(len(found) for found in blocks.values()),
+        "blocks": dict((block, blocks[block]) for block in sorted(blocks)),
+    }
+
+
+def check_source(item):
+    """Pool task: ``item`` is (host, path) for a file or (host, None, text)."""
+    host, path = item[:2]
+    if path is not None:
+        with open(path) as f:
+            text = f.read()
+    else:
+        text = item[2]
+    if not is_iosxr_config(text):
+        return {"host": host, "skipped": "not an IOS-XR config"}
+    return check_config(host, text)
+
+
+def archive_sources(directory=RUNNING_CONFIGS_DIR, pattern="*.cfg"):
+    return [(host, path) for host, path in running_config_files(pattern, directory).items()]
+
+
+def store_sources(store):
+    hosts_dir = os.path.join(store.root, "hosts")
+    names = os.listdir(hosts_dir) if os.path.isdir(hosts_dir) else []
+    hosts = sorted(os.path.splitext(name)[0] for name in names)
+    return [(host, None, store.get(host)) for host in hosts]
+
+
+def fetch_sources(inventory_path, limit, forks):
+    """Fetches the running config of the selected IOS-XR hosts."""
+    from cli_session import network_os_name
+    from fleet_exec import IosxrDriver
+
+    inventory, groups = load_inventory(inventory_path)
+    hosts = [
+        host
+        for host in select_hosts(inventory, groups, limit)
+        if network_os_name(inventory[host].get("ansible_network_os")) == "iosxr"
+    ]
+
+    def fetch(host):
+        driver = IosxrDriver(host, inventory[host]).open()
+        try:
+            return (host, None, to_text(driver.running_config()))
+        finally:
+            driver.close()
+
+    executor = ThreadPoolExecutor(max_workers=forks)
+    try:
+        return list(executor.map(fetch, hosts))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def run_compliance(sources, golden, policy, workers=None, extra=False):
+    """Yields the record of every source, in order, checked by ``workers``
+    processes (in this process when 1).
+    """
+    if workers == 1:
+        init_worker(golden, policy, extra)
+        for item in sources:
+            yield check_source(item)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(golden, policy, extra))
+    try:
+        chunksize = max(1, len(sources) // (workers * 4))
+        for record in executor.map(check_source, sources, chunksize=chunksize):
+            yield record
+    finally:
+        executor.shutdown()
+
+
+def parse_values(assignments):
+    values = {}
+    for assignment in assignments:
+        key, sep, value = assignment.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError("--set expects FIELD=VALUE, got %r" % assignment)
+        values[key] = value
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--golden", default=GOLDEN_CONFIG, help="containerlab startup config template")
+    parser.add_argument(
+        "--set",
+        action="append",
+        default=[],
+        metavar="FIELD=VALUE",
+        help="template value, e.g. Env.CLAB_MGMT_VRF=mgmt (repeatable)",
+    )
+    parser.add_argument("--commands-file", default=CONFIG_COMMANDS, help="playbook holding the iosxr_config policy")
+    parser.add_argument("--no-policy", action="store_true", help="check the golden config only")
+    parser.add_argument("--extra", action="store_true", help="also report lines the golden blocks do not define")
+    parser.add_argument("-w", "--workers", type=int, help="processes, the number of CPUs by default")
+    sources = parser.add_mutually_exclusive_group()
+    sources.add_argument("--dir", default=RUNNING_CONFIGS_DIR, help="archive of <host>.cfg running configs")
+    sources.add_argument("--store", help="ConfigStore directory, its newest versions are checked")
+    sources.add_argument("--fetch", action="store_true", help="fetch the running configs from the devices")
+    parser.add_argument("-i", "--inventory", default=INVENTORY)
+    parser.add_argument("-l", "--limit", help="comma separated hosts, groups or patterns, with --fetch")
+    parser.add_argument("-f", "--forks", type=int, default=30, help="devices fetched at once")
+    args = parser.parse_args()
+
+    try:
+        values = parse_values(args.set)
+    except argparse.ArgumentTypeError as exc:
+        parser.error(str(exc))
+
+    start = time.monotonic()
+    golden = golden_requirements(args.golden, values)
+    policy = [] if args.no_policy else policy_requirements(config_task_commands(args.commands_file))
+
+    if args.fetch:
+        items = fetch_sources(args.inventory, args.limit, args.forks)
+    elif args.store:
+        items = store_sources(ConfigStore(args.store))
+    else:
+        items = archive_sources(args.dir)
+    if not items:
+        sys.exit("no running configs to check")
+
+    counts = {"compliant": 0, "deviating": 0, "skipped": 0}
+    for record in run_compliance(items, golden, policy, args.workers, args.extra):
+        if "skipped" in record:
+            counts["skipped"] += 1
+        else:
+            counts["compliant" if record["compliant"] else "deviating"] += 1
+        print(json.dumps(record), flush=True)
+
+    sys.stderr.write(
+        "%d hosts: %d compliant, %d deviating, %d skipped in %.2fs\n"
+        % (len(items), counts["compliant"], counts["deviating"], counts["skipped"], time.monotonic() - start),
+    )
+    return 1 if counts["deviating"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
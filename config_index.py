@@ -0,0 +1,428 @@
+"""Inverted index over the archive of backed up running configs.
+
+Every snapshot (a running_configs/*.cfg backup or a version kept by
+config_store.py) is parsed into hierarchical paths: the indentation of
+IOS-XR and IOS-XE configs, the words of Junos ``set`` lines. Each path and
+every prefix of it is a term, and the index maps terms to the snapshots
+containing them, so "which routers have GigabitEthernet0/0/0/5
+preconfigured" is one lookup instead of a grep through every file.
+
+The index lives in a directory: ``catalog.json`` lists the snapshots (host,
+source, sha256, time) and the segments, and every update writes the new
+snapshots into a new immutable segment file, which is memory-mapped for
+queries. Unchanged files are skipped by size and mtime, known contents by
+(host, sha256), and the segments are merged once there are more than
+MAX_SEGMENTS of them.
+
+    python config_index.py update [--configs running_configs] [--store config_history]
+    python config_index.py query "interface preconfigure GigabitEthernet0/0/0/5"
+    python config_index.py query --under "interface GigabitEthernet0/0/0/0 > lldp"
+    python config_index.py query --glob "*lldp*" --history
+    python config_index.py stats
+
+Paths are written with " > " between levels.
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import mmap
+import os
+import re
+import shlex
+import struct
+import sys
+import tempfile
+import time
+
+from array import array
+
+from config_store import DEFAULT_STORE, ConfigStore
+from uninet_lab import LAB_DIR, RUNNING_CONFIGS_DIR, is_iosxr_config, running_config_files
+
+DEFAULT_INDEX = os.path.join(LAB_DIR, "config_index")
+MAX_SEGMENTS = 8
+
+SEP = "\x1f"
+DISPLAY_SEP = " > "
+SEGMENT_MAGIC = b"UCIDX001"
+SEGMENT_HEADER = struct.Struct("=8sII")
+
+SKIPPED_LINES = ("end", "exit", "exit-address-family", "exit-peer-policy", "exit-af-interface")
+PREAMBLE_RE = re.compile(r"^(?:Building configuration|Current configuration\s*:|\w{3} \w{3} +\d+ [\d:.]+)")
+BANNER_RE = re.compile(r"^banner \S+ (\S)")
+
+
+def config_format(text):
+    """Returns "iosxr", "junos-set" or "ios"."""
+    if is_iosxr_config(text):
+        return "iosxr"
+    for line in text.splitlines()[:20]:
+        if line.startswith("set "):
+            return "junos-set"
+    return "ios"
+
+
+def parse_paths(text, fmt=None):
+    """Returns the set of paths (tuples of config lines or set words) of a
+    config, every prefix of a path included.
+    """
+    fmt = fmt or config_format(text)
+    paths = set()
+    if fmt == "junos-set":
+        for line in text.splitlines():
+            if not line.startswith("set "):
+                continue
+            try:
+                words = shlex.split(line[4:])
+            except ValueError:
+                words = line[4:].split()
+            for depth in range(1, len(words) + 1):
+                paths.add(tuple(words[:depth]))
+        return paths
+
+    stack = []
+    banner = None
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        stripped = line.strip()
+        if banner is not None:
+            # banners span lines until their delimiter, and are one path
+            banner[1].append(line)
+            if banner[0] in stripped:
+                paths.add(("\n".join(banner[1]),))
+                banner = None
+            continue
+        if not stripped or stripped[0] == "!" or stripped in SKIPPED_LINES or PREAMBLE_RE.match(stripped):
+            continue
+        match = BANNER_RE.match(stripped)
+        if match and match.group(1) not in stripped[match.end() :]:
+            banner = (match.group(1), [stripped])
+            continue
+        indent = len(line) - len(line.lstrip())
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = tuple(entry[1] for entry in stack) + (stripped,)
+        stack.append((indent, stripped))
+        paths.add(path)
+    return paths
+
+
+def path_term(path):
+    return SEP.join(path)
+
+
+def display_path(term):
+    return term.replace(SEP, DISPLAY_SEP)
+
+
+def query_term(query):
+    return SEP.join(part.strip() for part in query.split(DISPLAY_SEP.strip()))
+
+
+def write_segment(path, postings):
+    """Writes {term: sorted snapshot ids} as a segment file:
+
+    header (magic, term count, term blob length), term offsets and posting
+    offsets (uint32, term count + 1 each), the sorted terms as one UTF-8
+    blob padded to 4 bytes, then the posting lists as uint32.
+    """
+    terms = sorted(postings)
+    term_offsets = array("I", [0])
+    posting_offsets = array("I", [0])
+    blob = bytearray()
+    ids = array("I")
+    for term in terms:
+        blob += term.encode("utf-8")
+        term_offsets.append(len(blob))
+        ids.extend(postings[term])
+        posting_offsets.append(len(ids))
+    blob += b"\0" * (-len(blob) % 4)
+
+    directory = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(terms), len(blob)))
+        f.write(term_offsets.tobytes())
+        f.write(posting_offsets.tobytes())
+        f.write(bytes(blob))
+        f.write(ids.tobytes())
+    os.replace(tmp, path)
+
+
+class Segment(object):
+    """Read-only, memory-mapped segment; terms are looked up by binary
+    search over the mapped offsets, without reading the file up front.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, blob_len = SEGMENT_HEADER.unpack_from(self._map)
+        if magic != SEGMENT_MAGIC:
+            raise ValueError("%s is not an index segment" % path)
+        view = memoryview(self._map)
+        start = SEGMENT_HEADER.size
+        table = 4 * (self.count + 1)
+        self._term_offsets = view[start : start + table].cast("I")
+        self._posting_offsets = view[start + table : start + 2 * table].cast("I")
+        self._blob = start + 2 * table
+        self._postings = view[self._blob + blob_len :].cast("I")
+        self._terms = None
+
+    def term(self, index):
+        return self._map[self._blob + self._term_offsets[index] : self._blob + self._term_offsets[index + 1]].decode("utf-8")
+
+    def postings(self, index):
+        return self._postings[self._posting_offsets[index] : self._posting_offsets[index + 1]].tolist()
+
+    def lower_bound(self, term):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, term):
+        index = self.lower_bound(term)
+        if index < self.count and self.term(index) == term:
+            return self.postings(index)
+        return []
+
+    def under(self, term):
+        """Yields (term, postings) of ``term`` and of the paths below it."""
+        index = self.lower_bound(term)
+        while index < self.count:
+            found = self.term(index)
+            if found != term and not found.startswith(term + SEP):
+                break
+            yield found, self.postings(index)
+            index += 1
+
+    def items(self):
+        if self._terms is None:
+            self._terms = [self.term(index) for index in range(self.count)]
+        for index, term in enumerate(self._terms):
+            yield term, self.postings(index)
+
+    def close(self):
+        self._term_offsets.release()
+        self._posting_offsets.release()
+        self._postings.release()
+        self._map.close()
+
+
+class ConfigIndex(object):
+    def __init__(self, root=DEFAULT_INDEX):
+        self.root = root
+        try:
+            with open(os.path.join(root, "catalog.json")) as f:
+                self.catalog = json.load(f)
+        except (IOError, OSError):
+            self.catalog = {"snapshots": [], "segments": [], "files": {}, "next_segment": 1}
+        self._segments = None
+
+    @property
+    def snapshots(self):
+        return self.catalog["snapshots"]
+
+    def segments(self):
+        if self._segments is None:
+            self._segments = [Segment(os.path.join(self.root, name)) for name in self.catalog["segments"]]
+        return self._segments
+
+    def close(self):
+        for segment in self._segments or []:
+            segment.close()
+        self._segments = None
+
+    def update(self, configs_dir=None, store=None):
+        """Indexes the snapshots of ``configs_dir`` and of the ConfigStore
+        ``store`` that are not indexed yet; returns how many were added.
+        """
+        known = set((snapshot["host"], snapshot["sha"]) for snapshot in self.snapshots)
+        files = self.catalog["files"]
+        postings = {}
+        added = []
+
+        def add(host, text, source, stamp, sha=None):
+            sha = sha or hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if (host, sha) in known:
+                return
+            known.add((host, sha))
+            fmt = config_format(text)
+            snapshot = {
+                "id": len(self.snapshots) + len(added),
+                "host": host,
+                "source": source,
+                "sha": sha,
+                "time": stamp,
+                "format": fmt,
+            }
+            added.append(snapshot)
+            for path in parse_paths(text, fmt):
+                postings.setdefault(path_term(path), []).append(snapshot["id"])
+
+        if configs_dir:
+            for host, path in running_config_files(path=configs_dir).items():
+                stat = os.stat(path)
+                signature = [stat.st_mtime_ns, stat.st_size]
+                if files.get(path, [None, None])[:2] == signature:
+                    continue
+                with open(path) as f:
+                    text = f.read()
+                sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                files[path] = signature + [sha]
+                add(host, text, os.path.relpath(path, LAB_DIR), int(stat.st_mtime), sha)
+
+        if store:
+            hosts_dir = os.path.join(store.root, "hosts")
+            for filename in sorted(os.listdir(hosts_dir)) if os.path.isdir(hosts_dir) else []:
+                host = os.path.splitext(filename)[0]
+                for entry in store.history(host):
+                    if (host, entry["sha"]) not in known:
+                        add(
+                            host,
+                            store.read(entry["sha"]),
+                            "store:%s@%d" % (host, entry["version"]),
+                            entry["time"],
+                            entry["sha"],
+                        )
+
+        if added:
+            if not os.path.isdir(self.root):
+                os.makedirs(self.root)
+            name = "seg-%06d.idx" % self.catalog["next_segment"]
+            write_segment(os.path.join(self.root, name), postings)
+            self.catalog["next_segment"] += 1
+            self.catalog["segments"].append(name)
+            self.snapshots.extend(added)
+        if len(self.catalog["segments"]) > MAX_SEGMENTS:
+            self.compact()
+        else:
+            self._write_catalog()
+        return len(added)
+
+    def compact(self):
+        """Merges all segments into one."""
+        merged = {}
+        for segment in self.segments():
+            for term, ids in segment.items():
+                merged.setdefault(term, []).extend(ids)
+        old = list(self.catalog["segments"])
+        self.close()
+        name = "seg-%06d.idx" % self.catalog["next_segment"]
+        write_segment(os.path.join(self.root, name), dict((term, sorted(ids)) for term, ids in merged.items()))
+        self.catalog["next_segment"] += 1
+        self.catalog["segments"] = [name]
+        self._write_catalog()
+        for filename in old:
+            os.unlink(os.path.join(self.root, filename))
+
+    def latest(self):
+        """Returns {host: id of its newest snapshot}."""
+        latest = {}
+        for snapshot in self.snapshots:
+            current = latest.get(snapshot["host"])
+            if current is None or (snapshot["time"], snapshot["id"]) >= (
+                self.snapshots[current]["time"],
+                current,
+            ):
+                latest[snapshot["host"]] = snapshot["id"]
+        return latest
+
+    def search(self, query, mode="exact", history=False):
+        """Returns [(snapshot, [matching paths])] for a path ``query``
+        ("a > b > c"): the path itself, every path ``under`` it, or the paths
+        matching a ``glob`` pattern. Only the newest snapshot of every host
+        is searched unless ``history`` is set.
+        """
+        term = query_term(query)
+        matches = {}
+        for segment in self.segments():
+            if mode == "exact":
+                found = [(term, segment.find(term))]
+            elif mode == "under":
+                found = segment.under(term)
+            else:
+                pattern = query.strip()
+                found = (
+                    (item, ids) for item, ids in segment.items() if fnmatch.fnmatchcase(display_path(item), pattern)
+                )
+            for item, ids in found:
+                for snapshot_id in ids:
+                    matches.setdefault(snapshot_id, []).append(display_path(item))
+
+        wanted = None if history else set(self.latest().values())
+        return [
+            (self.snapshots[snapshot_id], sorted(paths))
+            for snapshot_id, paths in sorted(matches.items())
+            if wanted is None or snapshot_id in wanted
+        ]
+
+    def _write_catalog(self):
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.catalog, f, indent=1)
+        os.replace(tmp, os.path.join(self.root, "catalog.json"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="index directory")
+    commands = parser.add_subparsers(dest="action", required=True)
+
+    update = commands.add_parser("update", help="index the new snapshots")
+    update.add_argument("--configs", default=RUNNING_CONFIGS_DIR, help="directory of <host>.cfg backups")
+    update.add_argument("--store", default=DEFAULT_STORE, help="config_store.py directory")
+
+    query = commands.add_parser("query", help="list the hosts having a config path")
+    query.add_argument("path", help='config path, levels separated by " > "')
+    mode = query.add_mutually_exclusive_group()
+    mode.add_argument("--under", action="store_const", const="under", dest="mode", help="match the paths below")
+    mode.add_argument("--glob", action="store_const", const="glob", dest="mode", help="shell-style pattern")
+    query.add_argument("--history", action="store_true", help="search every snapshot, not only the newest")
+    query.add_argument("--json", action="store_true", help="print matches as JSON lines")
+
+    commands.add_parser("stats", help="print the size of the index")
+
+    args = parser.parse_args(argv)
+    index = ConfigIndex(args.index)
+
+    if args.action == "update":
+        start = time.perf_counter()
+        added = index.update(args.configs, ConfigStore(args.store))
+        sys.stderr.write(
+            "%d snapshots added, %d indexed, %d segments in %.1f ms\n"
+            % (added, len(index.snapshots), len(index.catalog["segments"]), (time.perf_counter() - start) * 1000),
+        )
+    elif args.action == "query":
+        start = time.perf_counter()
+        results = index.search(args.path, args.mode or "exact", args.history)
+        elapsed = (time.perf_counter() - start) * 1000
+        for snapshot, paths in results:
+            if args.json:
+                print(json.dumps(dict(snapshot, paths=paths)))
+                continue
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["time"]))
+            for path in paths:
+                print("%-32s %s  %-40s %s" % (snapshot["host"], stamp, snapshot["source"], path))
+        sys.stderr.write("%d snapshots matched in %.2f ms\n" % (len(results), elapsed))
+    else:
+        terms = sum(segment.count for segment in index.segments())
+        size = sum(os.path.getsize(os.path.join(index.root, name)) for name in index.catalog["segments"])
+        print(
+            "%d snapshots, %d hosts, %d segments, %d terms, %.1f KiB"
+            % (len(index.snapshots), len(index.latest()), len(index.catalog["segments"]), terms, size / 1024.0),
+        )
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Content-addressed, compressed history of backed up running configs.
+
+Every snapshot is addressed by the sha256 of its text and stored zlib
+compressed under ``objects/``, either in full or as a line delta against the
+previous version of the same host. ``hosts/<host>.json`` lists the versions of
+a host along with the change marker (last commit ID or "Last configuration
+change" stamp) reported by the device when the snapshot was taken.
+
+    python config_store.py add clab-uninet-lab-v1-CU-R1 running_configs/clab-uninet-lab-v1-CU-R1.cfg --marker commit:1000000042
+    python config_store.py marker clab-uninet-lab-v1-CU-R1
+    python config_store.py log clab-uninet-lab-v1-CU-R1
+    python config_store.py show clab-uninet-lab-v1-CU-R1 3
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import zlib
+
+DEFAULT_STORE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config_history")
+
+
+class ConfigStore(object):
+    def __init__(self, root=DEFAULT_STORE, full_every=10):
+        """``full_every`` bounds the delta chain a restore has to replay."""
+        self.root = root
+        self.full_every = full_every
+
+    def history(self, host):
+        try:
+            with open(self._index_path(host)) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return []
+
+    def latest(self, host):
+        history = self.history(host)
+        return history[-1] if history else None
+
+    def marker(self, host):
+        latest = self.latest(host)
+        return latest["marker"] if latest else None
+
+    def add(self, host, text, marker=None):
+        """Stores ``text`` as the newest version of ``host`` unless it is
+        identical to the latest one, and returns the version entry.
+        """
+        sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        history = self.history(host)
+        latest = history[-1] if history else None
+
+        if latest and latest["sha"] == sha:
+            if marker and marker != latest["marker"]:
+                latest["marker"] = marker
+                self._write_index(host, history)
+            return latest
+
+        if self._has_object(sha):
+            depth = self._object_depth(sha)
+        else:
+            base = None
+            if latest and latest["depth"] + 1 < self.full_every:
+                base = latest
+            depth = self._write_object(sha, text, base)
+
+        entry = {
+            "version": latest["version"] + 1 if latest else 1,
+            "sha": sha,
+            "marker": marker,
+            "time": int(time.time()),
+            "depth": depth,
+        }
+        history.append(entry)
+        self._write_index(host, history)
+        return entry
+
+    def get(self, host, version=None):
+        """Returns the text of ``version`` (the latest one when None)."""
+        history = self.history(host)
+        if not history:
+            raise KeyError("no snapshot stored for %s" % host)
+        if version is None:
+            return self.read(history[-1]["sha"])
+        for entry in history:
+            if entry["version"] == int(version):
+                return self.read(entry["sha"])
+        raise KeyError("version %s of %s is not stored" % (version, host))
+
+    def read(self, sha):
+        chain = []
+        while True:
+            base, payload = self._read_object(sha)
+            chain.append(payload)
+            if base is None:
+                break
+            sha = base
+
+        lines = chain.pop().splitlines(True)
+        while chain:
+            lines = apply_delta(lines, json.loads(chain.pop()))
+        return "".join(lines)
+
+    def _write_object(self, sha, text, base=None):
+        payload = text
+        header = "full"
+        depth = 0
+        if base is not None:
+            delta = json.dumps(
+                make_delta(self.read(base["sha"]).splitlines(True), text.splitlines(True)),
+                separators=(",", ":"),
+            )
+            if len(delta) < len(text):
+                payload = delta
+                header = "delta %s" % base["sha"]
+                depth = base["depth"] + 1
+
+        path = self._object_path(sha)
+        data = zlib.compress(("%s\n%s" % (header, payload)).encode("utf-8"), 9)
+        self._atomic_write(path, data)
+        return depth
+
+    def _read_object(self, sha):
+        with open(self._object_path(sha), "rb") as f:
+            header, payload = zlib.decompress(f.read()).decode("utf-8").split("\n", 1)
+        if header == "full":
+            return None, payload
+        return header.split(" ", 1)[1], payload
+
+    def _object_depth(self, sha):
+        depth = 0
+        sha = self._read_object(sha)[0]
+        while sha is not None:
+            depth += 1
+            sha = self._read_object(sha)[0]
+        return depth
+
+    def _has_object(self, sha):
+        return os.path.exists(self._object_path(sha))
+
+    def _object_path(self, sha):
+        return os.path.join(self.root, "objects", sha[:2], sha[2:])
+
+    def _index_path(self, host):
+        return os.path.join(self.root, "hosts", "%s.json" % host)
+
+    def _write_index(self, host, history):
+        self._atomic_write(
+            self._index_path(host),
+            json.dumps(history, indent=1).encode("utf-8"),
+        )
+
+    def _atomic_write(self, path, data):
+        directory = os.path.dirname(path)
+        # fleet_exec backs up hosts concurrently into the same store
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+
+def make_delta(base, lines):
+    """Encodes ``lines`` as copy ranges of ``base`` and inserted lines."""
+    delta = []
+    matcher = difflib.SequenceMatcher(None, base, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif tag in ("replace", "insert"):
+            delta.append(lines[j1:j2])
+    return delta
+
+
+def apply_delta(base, delta):
+    lines = []
+    for op in delta:
+        if len(op) == 2 and all(isinstance(i, int) for i in op):
+            lines.extend(base[op[0] : op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", default=DEFAULT_STORE, help="store directory")
+    commands = parser.add_subparsers(dest="action", required=True)
+
+    add = commands.add_parser("add", help="store a snapshot unless it is unchanged")
+    add.add_argument("host")
+    add.add_argument("file")
+    add.add_argument("--marker", help="change marker reported by the device")
+
+    marker = commands.add_parser("marker", help="print the marker of the latest snapshot")
+    marker.add_argument("host")
+
+    log = commands.add_parser("log", help="list the stored versions of a host")
+    log.add_argument("host")
+
+    show = commands.add_parser("show", help="print a stored version")
+    show.add_argument("host")
+    show.add_argument("version", nargs="?", type=int)
+
+    args = parser.parse_args(argv)
+    store = ConfigStore(args.store)
+
+    if args.action == "add":
+        with open(args.file) as f:
+            entry = store.add(args.host, f.read(), args.marker or None)
+        print("%s version %d %s" % (args.host, entry["version"], entry["sha"][:12]))
+    elif args.action == "marker":
+        print(store.marker(args.host) or "")
+    elif args.action == "log":
+        for entry in store.history(args.host):
+            print(
+                "%4d  %s  %s  %s"
+                % (
+                    entry["version"],
+                    entry["sha"][:12],
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"])),
+                    entry["marker"] or "-",
+                ),
+            )
+    elif args.action == "show":
+        sys.stdout.write(store.get(args.host, args.version))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Runs show, facts and backup tasks across the lab fleet concurrently.
+
+Hosts are read from the same inventory as the playbooks and scheduled from
+a single asyncio event loop. IOS-XR nodes go through the iosxr Cliconf of
+this repository (run_commands, get_config, get_device_info), IOS-XE nodes
+through a plain CLI session and cRPD nodes through ``cli -c`` over SSH. A
+JSON line is printed for every device as soon as it finishes.
+
+The sessions are paramiko, which blocks, and the Cliconf is synchronous,
+so every device runs in a thread of a ThreadPoolExecutor behind the event
+loop (loop.run_in_executor, collected with asyncio.as_completed). --forks
+is the size of that pool: the number of threads, and so of devices in
+flight at once.
+
+    python fleet_exec.py show 'show lldp neighbors' --limit xrd
+    python fleet_exec.py facts --forks 50
+    python fleet_exec.py backup --store config_history
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from ansible.module_utils._text import to_text
+
+from cli_session import HAS_PARAMIKO, CliSession, network_os_name
+from config_store import DEFAULT_STORE, ConfigStore
+from uninet_lab import (
+    INVENTORY,
+    RUNNING_CONFIGS_DIR,
+    load_inventory,
+    load_iosxr_cliconf,
+    new_iosxr_cliconf,
+    select_hosts,
+)
+
+if HAS_PARAMIKO:
+    import paramiko
+
+
+class DeviceDriver(object):
+    network_os = None
+
+    def __init__(self, host, variables):
+        self.host = host
+        self.variables = variables
+        self.address = variables.get("ansible_host", host)
+        self.username = variables.get("ansible_user")
+        self.password = variables.get("ansible_password")
+
+    def open(self):
+        return self
+
+    def close(self):
+        pass
+
+    def show(self, commands):
+        raise NotImplementedError
+
+    def facts(self):
+        raise NotImplementedError
+
+    def change_marker(self):
+        return None
+
+    def running_config(self):
+        raise NotImplementedError
+
+
+class IosxrDriver(DeviceDriver):
+    network_os = "iosxr"
+
+    def open(self):
+        self.session = CliSession(
+            self.address,
+            self.username,
+            self.password,
+            port=self.variables.get("ansible_port", 22),
+            network_os="iosxr",
+        ).open()
+        self.cliconf = new_iosxr_cliconf(self.session, self.variables)
+        return self
+
+    def close(self):
+        self.session.close()
+
+    def show(self, commands):
+        return self.cliconf.run_commands(commands, check_rc=False)
+
+    def facts(self):
+        return self.cliconf.get_device_info()
+
+    def change_marker(self):
+        commit_list = self.cliconf.run_commands(["show configuration commit list 1"], check_rc=False)
+        return load_iosxr_cliconf().config_change_marker(to_text(commit_list[0]))
+
+    def running_config(self):
+        return self.cliconf.get_config()
+
+
+class IosDriver(DeviceDriver):
+    network_os = "ios"
+
+    def open(self):
+        self.session = CliSession(
+            self.address,
+            self.username,
+            self.password,
+            port=self.variables.get("ansible_port", 22),
+            network_os="ios",
+        ).open()
+        if self.variables.get("ansible_become"):
+            self.session.send(
+                "enable",
+                prompt=r"[\r\n]?[Pp]assword: ?$",
+                answer=self.variables.get("ansible_become_password", self.password),
+            )
+        return self
+
+    def close(self):
+        self.session.close()
+
+    def show(self, commands):
+        return [self.session.send(command) for command in commands]
+
+    def facts(self):
+        version = self.session.send("show version")
+        facts = {"network_os": "ios"}
+        for key, regex in (
+            ("network_os_version", r"Version (\S+),"),
+            ("network_os_hostname", r"^(\S+) uptime is"),
+            ("network_os_model", r"^[Cc]isco (\S+).+bytes of .*memory"),
+        ):
+            match = re.search(regex, version, re.M)
+            if match:
+                facts[key] = match.group(1)
+        return facts
+
+    def change_marker(self):
+        output = self.session.send("show running-config | include Last configuration change")
+        return load_iosxr_cliconf().config_change_marker("", output)
+
+    def running_config(self):
+        return self.session.send("show running-config")
+
+
+class JunosDriver(DeviceDriver):
+    network_os = "junos"
+
+    def open(self):
+        if not HAS_PARAMIKO:
+            raise RuntimeError("paramiko is required to reach %s" % self.host)
+        self.client = paramiko.SSHClient()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.client.connect(
+            self.address,
+            username=self.username,
+            password=self.password,
+            look_for_keys=False,
+            allow_agent=False,
+            timeout=30,
+        )
+        return self
+
+    def close(self):
+        self.client.close()
+
+    def cli(self, command):
+        _stdin, stdout, _stderr = self.client.exec_command("cli -c %s" % json.dumps(command))
+        return to_text(stdout.read()).strip()
+
+    def show(self, commands):
+        return [self.cli(command) for command in commands]
+
+    def facts(self):
+        version = self.cli("show version")
+        facts = {"network_os": "junos"}
+        for line in version.splitlines():
+            key, _sep, value = line.partition(": ")
+            if key == "Hostname":
+                facts["network_os_hostname"] = value.strip()
+            elif key == "Model":
+                facts["network_os_model"] = value.strip()
+            elif key == "Junos":
+                facts["network_os_version"] = value.strip()
+        return facts
+
+    def change_marker(self):
+        for line in self.cli("show system commit").splitlines():
+            if line.startswith("0 "):
+                return "commit:%s" % " ".join(line.split()[1:4])
+        return None
+
+    def running_config(self):
+        return self.cli("show configuration | display set")
+
+
+DRIVERS = {driver.network_os: driver for driver in (IosxrDriver, IosDriver, JunosDriver)}
+
+
+def backup(driver, store, directory):
+    marker = driver.change_marker()
+    if marker and marker == store.marker(driver.host):
+        return {"changed": False, "marker": marker}
+
+    text = driver.running_config()
+    with open(os.path.join(directory, "%s.cfg" % driver.host), "w") as f:
+        f.write(text)
+    entry = store.add(driver.host, text, marker)
+    return {"changed": True, "marker": marker, "version": entry["version"]}
+
+
+def run_host(host, variables, action, args):
+    network_os = network_os_name(variables.get("ansible_network_os"))
+    if network_os not in DRIVERS:
+        raise RuntimeError("unsupported network_os %s" % variables.get("ansible_network_os"))
+    driver = DRIVERS[network_os](host, variables).open()
+    try:
+        if action == "show":
+            return driver.show(args.commands)
+        if action == "facts":
+            return driver.facts()
+        return backup(driver, ConfigStore(args.store), args.dir)
+    finally:
+        driver.close()
+
+
+async def run_fleet(hosts, action, args):
+    """Yields (host, ok, elapsed, result) for every host as it finishes."""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=args.forks)
+
+    async def run(host, variables):
+        start = time.monotonic()
+        try:
+            result = await loop.run_in_executor(executor, run_host, host, variables, action, args)
+            ok = True
+        except Exception as exc:
+            result = "%s: %s" % (type(exc).__name__, to_text(exc))
+            ok = False
+        return host, ok, time.monotonic() - start, result
+
+    try:
+        for finished in asyncio.as_completed([run(host, variables) for host, variables in hosts]):
+            yield await finished
+    finally:
+        executor.shutdown(wait=False)
+
+
+async def main_async(args):
+    inventory, groups = load_inventory(args.inventory)
+    hosts = [(host, inventory[host]) for host in select_hosts(inventory, groups, args.limit)]
+    if not hosts:
+        sys.exit("no hosts matched %s" % args.limit)
+
+    start = time.monotonic()
+    slowest = 0.0
+    failed = 0
+    async for host, ok, elapsed, result in run_fleet(hosts, args.action, args):
+        slowest = max(slowest, elapsed)
+        failed += not ok
+        print(
+            json.dumps({"host": host, "ok": ok, "elapsed": round(elapsed, 3), "result": result}),
+            flush=True,
+        )
+
+    sys.stderr.write(
+        "%d hosts, %d failed, wall time %.2fs, slowest host %.2fs\n"
+        % (len(hosts), failed, time.monotonic() - start, slowest),
+    )
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-i", "--inventory", default=INVENTORY)
+    parser.add_argument("-l", "--limit", help="comma separated hosts, groups or patterns")
+    parser.add_argument("-f", "--forks", type=int, default=30, help="threads, one device each")
+    actions = parser.add_subparsers(dest="action", required=True)
+
+    show = actions.add_parser("show", help="run show commands")
+    show.add_argument("commands", nargs="+")
+
+    actions.add_parser("facts", help="collect device facts")
+
+    backup_parser = actions.add_parser("backup", help="back up changed running configs")
+    backup_parser.add_argument("--store", default=DEFAULT_STORE)
+    backup_parser.add_argument("--dir", default=RUNNING_CONFIGS_DIR)
+
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
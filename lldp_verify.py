@@ -0,0 +1,246 @@
+"""Verifies the LLDP neighbors of the lab against the containerlab topology.
+
+The links of the topology are indexed by endpoint, with the interface names
+of every node kind brought to the names the devices report over LLDP
+(Gi0-0-0-0 on XRd is GigabitEthernet0/0/0/0, eth1 on a CSR1000v is
+GigabitEthernet2). `show lldp neighbors` is collected from the XRd, cRPD
+and CSR nodes concurrently through fleet_exec, or read from captured
+outputs, and every neighbor is checked with a single lookup of its local
+port. Links are reported as missing, extra, miswired, seen from one side
+only, or unverified when neither end could be queried.
+
+    python lldp_verify.py
+    python lldp_verify.py --from-dir lldp_outputs --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+
+from uninet_lab import INVENTORY, TOPOLOGY, load_inventory, load_topology, select_hosts
+
+# containerlab kind -> network_os of the `show lldp neighbors` output
+KIND_NETWORK_OS = {
+    "xrd": "iosxr",
+    "cisco_xrd": "iosxr",
+    "crpd": "junos",
+    "juniper_crpd": "junos",
+    "cisco_csr1000v": "ios",
+    "vr-csr": "ios",
+}
+# kinds whose ethN data ports are GigabitEthernet(N+1) on the device
+CSR_KINDS = set(["cisco_csr1000v", "vr-csr"])
+
+INTERFACE_NAMES = {
+    "gi": "GigabitEthernet",
+    "gigabitethernet": "GigabitEthernet",
+    "te": "TenGigE",
+    "tengige": "TenGigE",
+    "tengigabitethernet": "TenGigabitEthernet",
+    "hu": "HundredGigE",
+    "hundredgige": "HundredGigE",
+    "mg": "MgmtEth",
+    "mgmteth": "MgmtEth",
+    "fa": "FastEthernet",
+    "fastethernet": "FastEthernet",
+}
+INTERFACE_RE = re.compile(r"^([A-Za-z]+)(\d[\d/\-\.:]*)$")
+CSR_PORT_RE = re.compile(r"^eth(\d+)$")
+JUNOS_NEIGHBOR_RE = re.compile(r"^(\S+)\s+(\S+)\s+(\S+)\s+(.+?)\s+(\S+)\s*$")
+
+
+def canonical_interface(name):
+    """Expands abbreviated Cisco interface names and turns the dashes of
+    containerlab names into slashes; other names are returned unchanged.
+    """
+    name = name.strip()
+    match = INTERFACE_RE.match(name)
+    if not match or match.group(1).lower() not in INTERFACE_NAMES:
+        return name
+    return INTERFACE_NAMES[match.group(1).lower()] + match.group(2).replace("-", "/")
+
+
+def topology_interface(kind, name):
+    """Returns the device name of a topology interface of a ``kind`` node."""
+    if kind in CSR_KINDS:
+        match = CSR_PORT_RE.match(name)
+        if match:
+            return "GigabitEthernet%d" % (int(match.group(1)) + 1)
+    return canonical_interface(name)
+
+
+def parse_neighbors(network_os, output):
+    """Returns (local interface, system name, port) for each neighbor."""
+    if network_os == "junos":
+        neighbors = []
+        in_table = False
+        for line in output.splitlines():
+            if line.startswith("Local Interface"):
+                in_table = True
+                continue
+            match = JUNOS_NEIGHBOR_RE.match(line) if in_table else None
+            if match:
+                neighbors.append((match.group(1), match.group(5), match.group(4)))
+        return neighbors
+
+    from uninet_lab import load_iosxr_cliconf
+
+    return [
+        (entry["local_interface"], entry["device_id"], entry["port_id"])
+        for entry in load_iosxr_cliconf().parse_lldp_neighbors(output)
+    ]
+
+
+class LinkIndex(object):
+    """Links of a containerlab topology, indexed by endpoint.
+
+    ``ports`` maps (node, interface) to (link id, peer endpoint), so an LLDP
+    neighbor is checked with one lookup of its local port.
+    """
+
+    def __init__(self, topology):
+        self.lab = topology.get("name", "")
+        nodes = (topology.get("topology") or {}).get("nodes") or {}
+        self.kinds = dict((name, (node or {}).get("kind")) for name, node in nodes.items())
+        self._names = dict((name.lower(), name) for name in nodes)
+        self.links = []
+        self.ports = {}
+        for link in (topology.get("topology") or {}).get("links") or []:
+            ends = [self._endpoint(endpoint) for endpoint in link.get("endpoints") or []]
+            if len(ends) != 2:
+                continue
+            link_id = len(self.links)
+            self.links.append(tuple(ends))
+            self.ports[ends[0]] = (link_id, ends[1])
+            self.ports[ends[1]] = (link_id, ends[0])
+
+    def _endpoint(self, endpoint):
+        if isinstance(endpoint, dict):
+            node, interface = endpoint["node"], endpoint["interface"]
+        else:
+            node, _sep, interface = endpoint.partition(":")
+        return node, topology_interface(self.kinds.get(node), interface)
+
+    def node_name(self, name):
+        """Maps a system name or inventory hostname to its topology node."""
+        name = name.strip()
+        prefix = "clab-%s-" % self.lab
+        if name.startswith(prefix):
+            name = name[len(prefix) :]
+        return self._names.get(name.lower()) or self._names.get(name.split(".")[0].lower()) or name
+
+
+def verify(index, observations, queried):
+    """Checks ``observations``, (node, local interface, system name, port)
+    tuples, against ``index``. ``queried`` are the nodes whose neighbors were
+    collected. Returns {category: [finding, ...]}.
+    """
+    report = {"missing": [], "extra": [], "miswired": [], "one_sided": [], "unverified": []}
+    seen = {}
+    for node, interface, system_name, port in observations:
+        local = (node, canonical_interface(interface))
+        remote = (index.node_name(system_name), canonical_interface(port))
+        entry = index.ports.get(local)
+        if entry is None:
+            report["extra"].append({"local": local, "remote": remote})
+        elif entry[1] == remote:
+            seen.setdefault(entry[0], set()).add(local)
+        else:
+            report["miswired"].append({"local": local, "expected": entry[1], "observed": remote})
+
+    for link_id, ends in enumerate(index.links):
+        sides = seen.get(link_id, ())
+        asked = [end for end in ends if end[0] in queried]
+        if len(sides) == 2:
+            continue
+        if not asked:
+            report["unverified"].append({"link": ends})
+        elif not sides:
+            report["missing"].append({"link": ends})
+        elif len(asked) == 2:
+            report["one_sided"].append({"link": ends, "seen_from": sorted(sides)})
+    return report
+
+
+def read_outputs(index, directory):
+    """Yields (node, network_os, output) from <host>.txt captures."""
+    for filename in sorted(os.listdir(directory)):
+        host, ext = os.path.splitext(filename)
+        if ext != ".txt":
+            continue
+        node = index.node_name(host)
+        with open(os.path.join(directory, filename)) as f:
+            yield node, KIND_NETWORK_OS.get(index.kinds.get(node)), f.read()
+
+
+def collect_outputs(index, args):
+    """Yields (node, network_os, output) from the lab, collected by
+    fleet_exec with at most --forks devices in flight.
+    """
+    from fleet_exec import run_fleet
+
+    inventory, groups = load_inventory(args.inventory)
+    hosts = [
+        (host, inventory[host])
+        for host in select_hosts(inventory, groups, args.limit)
+        if KIND_NETWORK_OS.get(index.kinds.get(index.node_name(host)))
+    ]
+    args.commands = ["show lldp neighbors"]
+
+    async def gather():
+        results = []
+        async for host, ok, _elapsed, result in run_fleet(hosts, "show", args):
+            if ok:
+                results.append((host, result[0]))
+            else:
+                sys.stderr.write("%s: %s\n" % (host, result))
+        return results
+
+    for host, output in asyncio.run(gather()):
+        node = index.node_name(host)
+        yield node, KIND_NETWORK_OS.get(index.kinds.get(node)), output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-t", "--topology", default=TOPOLOGY)
+    parser.add_argument("-i", "--inventory", default=INVENTORY)
+    parser.add_argument("-l", "--limit", help="comma separated hosts, groups or patterns")
+    parser.add_argument("-f", "--forks", type=int, default=30, help="devices queried at once")
+    parser.add_argument("--from-dir", help="read captured outputs, one <host>.txt per node")
+    parser.add_argument("--json", action="store_true", help="print findings as JSON lines")
+    args = parser.parse_args()
+
+    index = LinkIndex(load_topology(args.topology))
+    outputs = read_outputs(index, args.from_dir) if args.from_dir else collect_outputs(index, args)
+
+    observations = []
+    queried = set()
+    for node, network_os, output in outputs:
+        queried.add(node)
+        for interface, system_name, port in parse_neighbors(network_os, output):
+            observations.append((node, interface, system_name, port))
+
+    report = verify(index, observations, queried)
+    for category, findings in report.items():
+        for finding in findings:
+            if args.json:
+                print(json.dumps(dict(finding, category=category)))
+            else:
+                print("%-10s %s" % (category, " ".join("%s=%s" % item for item in sorted(finding.items()))))
+    sys.stderr.write(
+        "%d links, %d nodes queried, %s\n"
+        % (
+            len(index.links),
+            len(queried),
+            ", ".join("%d %s" % (len(findings), category) for category, findings in report.items()),
+        ),
+    )
+    return 1 if report["missing"] or report["extra"] or report["miswired"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""NETCONF transport for the configuration operations of the iosxr Cliconf.
+
+The XRd nodes run ``netconf-yang agent ssh``, so a whole candidate can be
+shipped as one <edit-config> to the candidate datastore and activated with
+one <commit>, instead of being typed into the CLI line by line.
+NetconfBackend offers the get_config/edit_config/commit/discard_changes
+surface of the Cliconf on top of a NetconfClient, which speaks the RFC 6242
+framing (end-of-message for base:1.0, chunked for base:1.1) over the SSH
+``netconf`` subsystem, or over plain TCP for local stand-in agents such as
+the one of xr_emulator.
+
+Configuration text travels in the <cli> container of the
+Cisco-IOS-XR-cli-cfg model; candidates starting with ``<`` are sent as YANG
+XML payloads unchanged.
+
+The iosxr Cliconf uses it when ``ansible_iosxr_config_backend`` is
+``netconf``. paramiko is required for the SSH transport.
+"""
+
+import difflib
+import itertools
+import re
+import socket
+import xml.etree.ElementTree as ET
+
+from xml.sax.saxutils import escape
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.module_utils._text import to_bytes, to_text
+
+try:
+    import paramiko
+
+    HAS_PARAMIKO = True
+except ImportError:
+    HAS_PARAMIKO = False
+
+BASE_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+CLI_NS = "http://cisco.com/ns/yang/Cisco-IOS-XR-cli-cfg"
+BASE_1_0 = "urn:ietf:params:netconf:base:1.0"
+BASE_1_1 = "urn:ietf:params:netconf:base:1.1"
+CAPABILITIES = [BASE_1_0, BASE_1_1]
+EOM = b"]]>]]>"
+CHUNK_HEADER_RE = re.compile(rb"\n#(\d+)\n")
+
+
+def qualified(tag, ns=BASE_NS):
+    return "{%s}%s" % (ns, tag)
+
+
+def hello_message(capabilities, session_id=None):
+    body = "".join("<capability>%s</capability>" % escape(cap) for cap in capabilities)
+    session = "<session-id>%s</session-id>" % session_id if session_id is not None else ""
+    return '<hello xmlns="%s"><capabilities>%s</capabilities>%s</hello>' % (BASE_NS, body, session)
+
+
+def frame_message(data, chunked):
+    """Frames one message for the wire, as a single chunk under base:1.1."""
+    data = to_bytes(data)
+    if chunked:
+        return b"\n#%d\n%s\n##\n" % (len(data), data)
+    return data + EOM
+
+
+class MessageReader(object):
+    """Reads framed messages from ``recv``, a callable returning at most the
+    given number of bytes and an empty string once the peer closed.
+    """
+
+    def __init__(self, recv, bufsize=65536):
+        self._recv = recv
+        self._bufsize = bufsize
+        self._buffer = b""
+
+    def _fill(self):
+        data = self._recv(self._bufsize)
+        if not data:
+            raise AnsibleConnectionFailure("NETCONF session closed by the peer")
+        self._buffer += data
+
+    def read(self, chunked):
+        if not chunked:
+            while EOM not in self._buffer:
+                self._fill()
+            message, _sep, self._buffer = self._buffer.partition(EOM)
+            return message.strip()
+
+        chunks = []
+        while True:
+            while len(self._buffer) < 4:
+                self._fill()
+            if self._buffer.startswith(b"\n##\n"):
+                self._buffer = self._buffer[4:]
+                return b"".join(chunks)
+            match = CHUNK_HEADER_RE.match(self._buffer)
+            while match is None:
+                if not self._buffer.startswith(b"\n#") or len(self._buffer) > 13:
+                    raise AnsibleConnectionFailure("invalid NETCONF chunk header %r" % self._buffer[:13])
+                self._fill()
+                match = CHUNK_HEADER_RE.match(self._buffer)
+            end = match.end() + int(match.group(1))
+            while len(self._buffer) < end:
+                self._fill()
+            chunks.append(self._buffer[match.end() : end])
+            self._buffer = self._buffer[end:]
+
+
+class SocketTransport(object):
+    """NETCONF over a plain TCP stream, for local stand-in agents."""
+
+    def __init__(self, host, port, timeout=30):
+        try:
+            self._sock = socket.create_connection((host, int(port)), timeout=timeout)
+        except (IOError, OSError) as exc:
+            raise AnsibleConnectionFailure(
+                "unable to open NETCONF session to %s:%s: %s" % (host, port, to_text(exc)),
+            )
+
+    def send(self, data):
+        self._sock.sendall(data)
+
+    def recv(self, size):
+        return self._sock.recv(size)
+
+    def close(self):
+        self._sock.close()
+
+
+class SshTransport(object):
+    """NETCONF over the ``netconf`` subsystem of an SSH session."""
+
+    def __init__(self, host, port, username=None, password=None, timeout=30):
+        if not HAS_PARAMIKO:
+            raise AnsibleConnectionFailure("paramiko is required to open a NETCONF session")
+        self._client = paramiko.SSHClient()
+        self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self._client.connect(
+            host,
+            port=int(port),
+            username=username,
+            password=password,
+            look_for_keys=False,
+            allow_agent=False,
+            timeout=timeout,
+        )
+        self._channel = self._client.get_transport().open_session()
+        self._channel.settimeout(timeout)
+        self._channel.invoke_subsystem("netconf")
+
+    def send(self, data):
+        self._channel.sendall(data)
+
+    def recv(self, size):
+        return self._channel.recv(size)
+
+    def close(self):
+        self._client.close()
+
+
+class NetconfClient(object):
+    """NETCONF session: the hello exchange, then one <rpc> per call.
+
+    ``rpcs``, ``bytes_sent`` and ``bytes_received`` count the traffic of the
+    session after the hello.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._reader = MessageReader(transport.recv)
+        self._message_ids = itertools.count(101)
+        self.rpcs = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        transport.send(frame_message(hello_message(CAPABILITIES), chunked=False))
+        hello = ET.fromstring(self._reader.read(chunked=False))
+        self.server_capabilities = [
+            (cap.text or "").strip() for cap in hello.iter(qualified("capability"))
+        ]
+        self.session_id = hello.findtext(qualified("session-id"))
+        self.chunked = BASE_1_1 in self.server_capabilities
+
+    def rpc(self, operation):
+        """Sends ``operation`` (the XML inside <rpc>) and returns the parsed
+        <rpc-reply>; raises AnsibleConnectionFailure on an <rpc-error>.
+        """
+        message_id = str(next(self._message_ids))
+        request = frame_message(
+            '<rpc message-id="%s" xmlns="%s">%s</rpc>' % (message_id, BASE_NS, operation),
+            self.chunked,
+        )
+        self._transport.send(request)
+        data = self._reader.read(self.chunked)
+        self.rpcs += 1
+        self.bytes_sent += len(request)
+        self.bytes_received += len(data)
+
+        reply = ET.fromstring(data)
+        if reply.get("message-id") != message_id:
+            raise AnsibleConnectionFailure(
+                "NETCONF reply to message %s received for %s" % (reply.get("message-id"), message_id),
+            )
+        errors = [
+            error
+            for error in reply.iter(qualified("rpc-error"))
+            if error.findtext(qualified("error-severity"), "error") == "error"
+        ]
+        if errors:
+            raise AnsibleConnectionFailure(
+                "\n".join(
+                    (error.findtext(qualified("error-message")) or error.findtext(qualified("error-tag")) or "").strip()
+                    for error in errors
+                ),
+            )
+        return reply
+
+    def close(self):
+        try:
+            self.rpc("<close-session/>")
+        except (AnsibleConnectionFailure, IOError, OSError):
+            pass
+        finally:
+            self._transport.close()
+
+
+def connect(host, port=830, username=None, password=None, transport="ssh", timeout=30):
+    """Returns a NetconfClient to ``host``, over SSH or plain TCP."""
+    if transport == "tcp":
+        return NetconfClient(SocketTransport(host, port, timeout=timeout))
+    return NetconfClient(SshTransport(host, port, username, password, timeout=timeout))
+
+
+def config_payload(candidate):
+    """Returns the <config> content for a candidate: YANG XML is passed
+    through, configuration lines are carried as <cli> text.
+    """
+    if not isinstance(candidate, str):
+        candidate = "\n".join(
+            line["command"] if isinstance(line, dict) else to_text(line) for line in candidate
+        )
+    if candidate.lstrip().startswith("<"):
+        return candidate
+    return '<cli xmlns="%s">%s</cli>' % (CLI_NS, escape(candidate))
+
+
+def config_sections(text, flags):
+    """Returns the top-level blocks of ``text`` starting with one of
+    ``flags``, as `show running-config <section>` would.
+    """
+    blocks = []
+    keep = False
+    for line in text.splitlines():
+        if line and not line[0].isspace() and line != "!":
+            keep = any(line.startswith(flag) for flag in flags)
+        if keep:
+            blocks.append(line)
+    return "\n".join(blocks)
+
+
+class NetconfBackend(object):
+    """get_config/edit_config/commit/discard_changes as single NETCONF RPCs
+    against the candidate datastore.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_config(self, source="running", flags=None, format="text"):
+        if source not in ("running", "candidate"):
+            raise ValueError("fetching configuration from %s is not supported" % source)
+        if format == "xml":
+            reply = self.client.rpc("<get-config><source><%s/></source></get-config>" % source)
+            data = reply.find(qualified("data"))
+            return "".join(to_text(ET.tostring(child)) for child in data) if data is not None else ""
+
+        reply = self.client.rpc(
+            '<get-config><source><%s/></source><filter type="subtree"><cli xmlns="%s"/></filter></get-config>'
+            % (source, CLI_NS),
+        )
+        text = reply.findtext("%s/%s" % (qualified("data"), qualified("cli", CLI_NS))) or ""
+        flags = [flag for flag in flags or [] if flag]
+        return config_sections(text, flags) if flags else text
+
+    def edit_config(self, candidate, commit=True, replace=False, exclusive=False, diff=False, confirm_timeout=None):
+        """Loads ``candidate`` into the candidate datastore with one
+        <edit-config> and, when ``commit`` is set, activates it with one
+        <commit>. ``exclusive`` holds the candidate lock for the change. The
+        candidate is discarded when the edit or the commit fails.
+
+        Returns {"request", "response", "diff"}; "diff" is only filled in
+        when ``diff`` is set, at the cost of two more <get-config>.
+        """
+        payload = config_payload(candidate)
+        result = {"request": payload, "response": [], "diff": None}
+        if exclusive:
+            self.lock()
+        try:
+            reply = self.client.rpc(
+                "<edit-config><target><candidate/></target>"
+                "<default-operation>%s</default-operation>"
+                "<config>%s</config></edit-config>" % ("replace" if replace else "merge", payload),
+            )
+            result["response"].append(to_text(ET.tostring(reply)))
+            if diff:
+                result["diff"] = "\n".join(
+                    difflib.unified_diff(
+                        self.get_config("running").splitlines(),
+                        self.get_config("candidate").splitlines(),
+                        "running",
+                        "candidate",
+                        lineterm="",
+                    ),
+                )
+            if commit:
+                result["response"].append(self.commit(confirm_timeout))
+            else:
+                self.discard_changes()
+        except AnsibleConnectionFailure:
+            try:
+                self.discard_changes()
+            except AnsibleConnectionFailure:
+                pass
+            raise
+        finally:
+            if exclusive:
+                self.unlock()
+        return result
+
+    def commit(self, confirm_timeout=None):
+        """Commits the candidate; with ``confirm_timeout`` as a confirmed
+        commit that is rolled back unless confirmed within that many seconds.
+        """
+        operation = "<commit/>"
+        if confirm_timeout:
+            operation = "<commit><confirmed/><confirm-timeout>%d</confirm-timeout></commit>" % int(confirm_timeout)
+        return to_text(ET.tostring(self.client.rpc(operation)))
+
+    def discard_changes(self):
+        self.client.rpc("<discard-changes/>")
+
+    def lock(self, target="candidate"):
+        self.client.rpc("<lock><target><%s/></target></lock>" % target)
+
+    def unlock(self, target="candidate"):
+        self.client.rpc("<unlock><target><%s/></target></unlock>" % target)
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,210 @@
+"""Spooled command output, for show commands too large to hold as text.
+
+A SpooledOutput keeps the raw reply of a command in memory up to a size
+threshold and moves it to an unnamed temporary file past it, which is then
+read through mmap. The reply is exposed as an iterator of lines, or of
+records through a line parser, without decoding the whole of it: the
+memory used by a command stays around the threshold whatever the size of
+its output.
+
+The iosxr Cliconf returns one for the replies of ``run_commands`` larger
+than ``ansible_iosxr_output_spool_threshold``. CliSession and the emulator
+connection write replies into it as they are received.
+
+    python output_spool.py 'show route' --threshold 1048576 < output.txt
+"""
+
+import argparse
+import io
+import mmap
+import re
+import sys
+import tempfile
+
+from ansible.module_utils._text import to_text
+
+SPOOL_THRESHOLD = 1 << 20
+READ_SIZE = 1 << 16
+
+# what str.strip() removes in the ASCII range
+STRIP_BYTES = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"
+CONTENT_RE = re.compile(rb"[^" + re.escape(STRIP_BYTES) + rb"]")
+
+
+class SpooledOutput(object):
+    """Reply of a command, in memory up to ``threshold`` bytes, in a
+    temporary file past it. The text it stands for is the reply decoded and
+    stripped, like the text ``run_commands`` returns for small replies.
+    """
+
+    def __init__(self, command=None, threshold=SPOOL_THRESHOLD, directory=None):
+        self.command = command
+        self.parser = None
+        self.threshold = threshold
+        self.directory = directory
+        self.size = 0
+        self._memory = io.BytesIO()
+        self._file = None
+        self._map = None
+
+    def __repr__(self):
+        return "<SpooledOutput %r %d bytes%s>" % (self.command, self.size, " spilled" if self.spilled else "")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        return self.lines()
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def write(self, data):
+        if self._map is not None:
+            raise ValueError("the output of %s was already read" % self.command)
+        if self._file is None and self._memory.tell() + len(data) > self.threshold:
+            self._file = tempfile.TemporaryFile(prefix="iosxr-output-", dir=self.directory)
+            self._file.write(self._memory.getvalue())
+            self._memory = None
+        (self._file or self._memory).write(data)
+        self.size += len(data)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._memory = None
+
+    def _buffer(self):
+        """Returns the reply as a bytes-like object, mmap of the file once
+        spilled.
+        """
+        if self._file is None:
+            return self._memory.getbuffer()
+        if self._map is None:
+            self._file.flush()
+            if not self.size:
+                return b""
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _bounds(self, buf):
+        """Returns the (start, end) offsets of the stripped reply."""
+        match = CONTENT_RE.search(buf)
+        if match is None:
+            return 0, 0
+        end = len(buf)
+        while end > 0:
+            chunk = bytes(buf[max(0, end - READ_SIZE) : end])
+            stripped = chunk.rstrip(STRIP_BYTES)
+            end -= len(chunk) - len(stripped)
+            if stripped:
+                break
+        return match.start(), end
+
+    def raw_lines(self):
+        """Yields the lines of the stripped reply as bytes."""
+        buf = self._buffer()
+        start, end = self._bounds(buf)
+        if isinstance(buf, memoryview):
+            buf = buf.tobytes()
+        while True:
+            newline = buf.find(b"\n", start, end)
+            if newline < 0:
+                yield bytes(buf[start:end])
+                return
+            yield bytes(buf[start:newline])
+            start = newline + 1
+
+    def lines(self):
+        """Yields the lines of the text, the same as ``text().split("\\n")``."""
+        for line in self.raw_lines():
+            yield to_text(line, errors="surrogate_or_strict")
+
+    def records(self, parser=None):
+        """Yields the records ``parser``, by default the one set by the
+        producer, builds from the lines; a parser takes an iterable of lines
+        and returns or yields records.
+        """
+        parser = parser or self.parser
+        if parser is None:
+            raise ValueError("no parser for the output of %s" % self.command)
+        for record in parser(self.lines()):
+            yield record
+
+    def text(self):
+        """Returns the whole text, for callers that need one string."""
+        buf = self._buffer()
+        start, end = self._bounds(buf)
+        return to_text(bytes(buf[start:end]), errors="surrogate_or_strict")
+
+
+class LineSpooler(object):
+    """Writes a reply received in chunks to a SpooledOutput, dropping the
+    echo of ``command`` and the lines holding ``prompt`` the way the
+    connections sanitize a whole reply. The last, possibly incomplete, line
+    is held back until the next chunk or ``finish``.
+    """
+
+    def __init__(self, output, command=None, prompt=None, strip_prompt=True):
+        self.output = output
+        self.command = (command or b"").strip()
+        self.prompt = (prompt or b"").strip() if strip_prompt else b""
+        self._pending = b""
+        self._written = False
+
+    def _keep(self, line, prompt):
+        if self.command and line.strip() == self.command:
+            return False
+        return not (prompt and prompt in line)
+
+    def _emit(self, line):
+        self.output.write(b"\n" + line if self._written else line)
+        self._written = True
+
+    def feed(self, data):
+        data = self._pending + data
+        lines = data.split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            if self._keep(line, self.prompt):
+                self._emit(line)
+
+    def finish(self, prompt=None):
+        """Flushes the last line, checked against the prompt the reply
+        ended with.
+        """
+        prompt = (prompt or b"").strip() if self.prompt else b""
+        line, self._pending = self._pending, b""
+        if self._keep(line, self.prompt) and self._keep(line, prompt):
+            self._emit(line)
+        return self.output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", nargs="?", default="stdin")
+    parser.add_argument("--threshold", type=int, default=SPOOL_THRESHOLD)
+    args = parser.parse_args()
+
+    output = SpooledOutput(args.command, args.threshold)
+    stdin = sys.stdin.buffer
+    for chunk in iter(lambda: stdin.read(READ_SIZE), b""):
+        output.write(chunk)
+    with output:
+        count = sum(1 for _line in output.lines())
+        sys.stderr.write("%r: %d lines\n" % (output, count))
+
+
+if __name__ == "__main__":
+    main()
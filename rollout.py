@@ -0,0 +1,282 @@
+"""Rolls a configuration change out to the IOS-XR nodes in site waves.
+
+The hosts of every site (cuautitlan, vallejo, triara: the groups named
+<site>_*) form a wave. Within a wave up to --concurrency devices at a time
+get the IOS-XR commands of config_commands.yaml pushed through the iosxr
+Cliconf as a `commit confirmed <--timer>`, then are health checked from
+exec mode: the --check commands must succeed and no LLDP neighbor may have
+been lost.
+Only when every device of the wave is healthy, and the confirm window is
+still open, are the commits confirmed, all at once; the next wave starts
+after that. Otherwise the rollout stops without confirming anything, and
+the unconfirmed devices roll back by themselves when their timer expires.
+
+Since the devices of a wave are pushed and checked in parallel and
+confirmed together, the rollout takes about the number of waves times the
+slowest device of a wave.
+
+    python rollout.py --limit xrd --concurrency 10 --timer 300
+    python rollout.py --sites vallejo triara --check 'show ipv4 interface brief'
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+from ansible.module_utils._text import to_text
+
+from cli_session import CliSession, network_os_name
+from uninet_lab import INVENTORY, LAB_DIR, load_inventory, load_iosxr_cliconf, new_iosxr_cliconf, select_hosts
+
+SITES = ["cuautitlan", "vallejo", "triara"]
+CONFIG_COMMANDS = "%s/config_commands.yaml" % LAB_DIR
+
+
+def config_task_commands(path=CONFIG_COMMANDS, module="cisco.iosxr.iosxr_config"):
+    """Returns the commands of the first ``module`` task of a playbook."""
+    with open(path) as f:
+        plays = yaml.safe_load(f) or []
+    for play in plays:
+        for task in play.get("tasks") or []:
+            if module in task:
+                return list(task[module].get("commands") or [])
+    return []
+
+
+def plan_waves(inventory, groups, sites=SITES, limit=None):
+    """Returns [(site, [(host, variables)])], the IOS-XR hosts selected by
+    ``limit`` grouped by the site prefix of their groups, in ``sites`` order.
+    """
+    selected = set(select_hosts(inventory, groups, limit))
+    waves = []
+    for site in sites:
+        members = []
+        for group, hosts in sorted(groups.items()):
+            if not group.startswith(site + "_"):
+                continue
+            for host in hosts:
+                variables = inventory[host]
+                if (
+                    host in selected
+                    and host not in [member[0] for member in members]
+                    and network_os_name(variables.get("ansible_network_os")) == "iosxr"
+                ):
+                    members.append((host, variables))
+        if members:
+            waves.append((site, members))
+    return waves
+
+
+class CliTarget(object):
+    """Cliconf of a device reached over a CliSession."""
+
+    def __init__(self, host, variables):
+        self.host = host
+        self.session = CliSession(
+            variables.get("ansible_host", host),
+            variables.get("ansible_user"),
+            variables.get("ansible_password"),
+            port=variables.get("ansible_port", 22),
+            network_os="iosxr",
+        ).open()
+        self.cliconf = new_iosxr_cliconf(self.session, variables)
+
+    def close(self):
+        self.session.close()
+
+
+def lldp_neighbors(cliconf):
+    """Returns the (local interface, device id, port id) LLDP neighbors.
+
+    The command is sent as is, so the reply is text whatever parse_output
+    or output_spool_threshold are set to. A device without any neighbor
+    parsed fails the check, since nothing could be lost from it.
+    """
+    output = to_text(cliconf.send_command("show lldp neighbors"), errors="surrogate_or_strict")
+    neighbors = set(
+        (entry["local_interface"], entry["device_id"], entry["port_id"])
+        for entry in load_iosxr_cliconf().parse_lldp_neighbors(output)
+    )
+    if not neighbors:
+        raise RuntimeError("no LLDP neighbors parsed from show lldp neighbors")
+    return neighbors
+
+
+class HostRollout(object):
+    """Progress of one device: pushed, healthy, confirmed or failed."""
+
+    def __init__(self, host, variables):
+        self.host = host
+        self.variables = variables
+        self.target = None
+        self.state = "pending"
+        self.error = None
+        self.committed_at = None
+        self.elapsed = 0.0
+
+    def record(self):
+        return {
+            "host": self.host,
+            "state": self.state,
+            "error": self.error,
+            "elapsed": round(self.elapsed, 3),
+        }
+
+
+def push_and_check(rollout, commands, opener, timer, checks):
+    """Pushes ``commands`` as a commit confirmed and health checks the
+    device; leaves the session open for the confirmation.
+    """
+    start = time.monotonic()
+    try:
+        variables = dict(rollout.variables)
+        variables["ansible_iosxr_commit_confirmed"] = True
+        variables["ansible_iosxr_commit_confirmed_timeout"] = timer
+        rollout.target = opener(rollout.host, variables)
+        cliconf = rollout.target.cliconf
+        before = lldp_neighbors(cliconf)
+
+        cliconf.edit_config(commands, commit=True)
+        rollout.committed_at = time.monotonic()
+        rollout.state = "pushed"
+        # leaving configuration mode keeps the trial commit pending
+        cliconf.abort()
+        if checks:
+            cliconf.run_commands(checks, check_rc=True)
+        lost = before - lldp_neighbors(cliconf)
+        if lost:
+            raise RuntimeError("lost LLDP neighbors %s" % ", ".join(sorted(entry[0] for entry in lost)))
+        rollout.state = "healthy"
+    except Exception as exc:
+        rollout.state = "failed"
+        rollout.error = "%s: %s" % (type(exc).__name__, to_text(exc))
+    finally:
+        rollout.elapsed = time.monotonic() - start
+    return rollout
+
+
+def confirm(rollout):
+    start = time.monotonic()
+    try:
+        cliconf = rollout.target.cliconf
+        cliconf.configure()
+        cliconf.send_command("commit")
+        cliconf.abort()
+        rollout.state = "confirmed"
+    except Exception as exc:
+        rollout.state = "failed"
+        rollout.error = "confirm: %s: %s" % (type(exc).__name__, to_text(exc))
+    finally:
+        rollout.elapsed += time.monotonic() - start
+    return rollout
+
+
+def run_wave(site, hosts, commands, opener, args, report):
+    """Pushes, checks and, when every device is healthy, confirms a wave.
+    Returns True when the whole wave was confirmed.
+    """
+    rollouts = [HostRollout(host, variables) for host, variables in hosts]
+    executor = ThreadPoolExecutor(max_workers=args.concurrency)
+    try:
+        list(executor.map(lambda item: push_and_check(item, commands, opener, args.timer, args.check), rollouts))
+
+        failed = [item for item in rollouts if item.state != "healthy"]
+        committed = [item.committed_at for item in rollouts if item.committed_at is not None]
+        if not failed and committed and time.monotonic() > min(committed) + args.timer - args.confirm_margin:
+            failed = rollouts
+            for item in rollouts:
+                item.state, item.error = "failed", "confirm window of %ss missed" % args.timer
+
+        if not failed:
+            list(executor.map(confirm, rollouts))
+            failed = [item for item in rollouts if item.state != "confirmed"]
+        else:
+            for item in rollouts:
+                if item.state in ("pushed", "healthy"):
+                    # left unconfirmed, the device rolls back at timer expiry
+                    item.state = "rolling-back"
+    finally:
+        for item in rollouts:
+            if item.target is not None:
+                try:
+                    item.target.close()
+                except Exception:
+                    pass
+        executor.shutdown(wait=False)
+
+    for item in rollouts:
+        report(dict(item.record(), site=site))
+    return not failed
+
+
+def run_rollout(waves, commands, opener, args, report):
+    """Runs the waves in order and stops at the first failed one. Returns
+    (confirmed waves, [(site, wall time, slowest device)]).
+    """
+    timings = []
+    for index, (site, hosts) in enumerate(waves):
+        start = time.monotonic()
+        report({"site": site, "wave": index + 1, "hosts": len(hosts), "state": "started"})
+        ok = run_wave(site, hosts, commands, opener, args, report)
+        timings.append((site, time.monotonic() - start))
+        if not ok:
+            for skipped, skipped_hosts in waves[index + 1 :]:
+                report({"site": skipped, "hosts": len(skipped_hosts), "state": "skipped"})
+            return index, timings
+    return len(waves), timings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-i", "--inventory", default=INVENTORY)
+    parser.add_argument("-l", "--limit", help="comma separated hosts, groups or patterns")
+    parser.add_argument("--sites", nargs="+", default=SITES, help="site waves, in order")
+    parser.add_argument("--commands-file", default=CONFIG_COMMANDS, help="playbook holding the iosxr_config task")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="devices pushed at once per wave")
+    parser.add_argument("--timer", type=int, default=300, help="commit confirmed timeout in seconds")
+    parser.add_argument(
+        "--confirm-margin",
+        type=float,
+        default=10.0,
+        help="seconds before the timer expiry after which a wave is no longer confirmed",
+    )
+    parser.add_argument(
+        "--check",
+        action="append",
+        default=[],
+        help="show command that must succeed after the push (repeatable)",
+    )
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    commands = config_task_commands(args.commands_file)
+    if not commands:
+        sys.exit("no cisco.iosxr.iosxr_config commands in %s" % args.commands_file)
+    inventory, groups = load_inventory(args.inventory)
+    waves = plan_waves(inventory, groups, args.sites, args.limit)
+    if not waves:
+        sys.exit("no IOS-XR hosts in the %s waves" % ", ".join(args.sites))
+
+    start = time.monotonic()
+    done, timings = run_rollout(waves, commands, CliTarget, args, lambda event: print(json.dumps(event), flush=True))
+    sys.stderr.write(
+        "%d/%d waves confirmed in %.2fs (%s)\n"
+        % (
+            done,
+            len(waves),
+            time.monotonic() - start,
+            ", ".join("%s %.2fs" % timing for timing in timings),
+        ),
+    )
+    return 0 if done == len(waves) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
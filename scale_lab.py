@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""Generates a synthetic lab of N sites x M nodes for scale benchmarking.
+
+The sites follow the pattern of uninet-lab-v1.yaml: the same mix of kinds
+(XRd, cRPD, CSR) with their images and startup configs, and an
+``ansible-group`` label of <site>_<family> per node. Within a site the
+first --hubs XRd nodes are meshed and every other node is linked to each
+of them; the sites are chained hub to hub. Three files are written to
+--out:
+
+- <name>.clab.yaml, the containerlab topology, with the management
+  addresses of the nodes in a 172.20.0.0/16 network;
+- ansible-inventory.yml, a static inventory in the format of the lab's;
+- running_configs/<host>.cfg, seed running configs built from the lab's
+  backups of the same kind, with the interfaces of every link.
+
+The topology can also be read by clab_inventory.py --topology, and the
+seeds by the XrDevice emulator, see benchmarks/bench_scale.py.
+
+    python scale_lab.py --sites 10 --nodes 50 --out scale-lab
+    python clab_inventory.py --list --topology scale-lab/scale-10x50.clab.yaml
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from clab_inventory import build_inventory, node_longname  # noqa: E402
+from lldp_verify import KIND_NETWORK_OS  # noqa: E402
+from uninet_lab import LAB_DIR, RUNNING_CONFIGS_DIR, TOPOLOGY, load_topology  # noqa: E402
+
+MGMT_SUBNET = "172.20.0.0/16"
+# first host of MGMT_SUBNET handed to a node, .1 is the bridge
+MGMT_OFFSET = 2
+MAX_NODES = (1 << 16) - MGMT_OFFSET - 1
+
+HOSTNAME_RE = re.compile(r"^hostname \S+", re.M)
+XR_PORT_BLOCK_RE = re.compile(r"^interface (?:preconfigure )?GigabitEthernet")
+MGMT_ADDRESS_RE = re.compile(r"^( ipv4 address )\S+ \S+$", re.M)
+# the generated management network has no IPv6 subnet
+MGMT_IPV6_RE = re.compile(r"^ ipv6 address \S+\n", re.M)
+
+try:
+    SafeDumper = yaml.CSafeDumper
+except AttributeError:
+    SafeDumper = yaml.SafeDumper
+
+
+def site_pattern(topology):
+    """Returns the (kind, family, share, fields) of every kind of the lab,
+    most common first: ``family`` is the suffix of its ansible-group label,
+    ``share`` its fraction of the nodes and ``fields`` the image and
+    startup-config of its first node.
+    """
+    counts = {}
+    kinds = {}
+    nodes = (topology.get("topology") or {}).get("nodes") or {}
+    for node in nodes.values():
+        node = node or {}
+        kind = node.get("kind")
+        counts[kind] = counts.get(kind, 0) + 1
+        if kind in kinds:
+            continue
+        group = (node.get("labels") or {}).get("ansible-group") or ""
+        fields = {}
+        for field in ("image", "startup-config"):
+            if node.get(field):
+                fields[field] = node[field]
+        kinds[kind] = (group.rpartition("_")[2] or kind, fields)
+    total = float(sum(counts.values()))
+    return [
+        (kind, kinds[kind][0], counts[kind] / total, kinds[kind][1])
+        for kind in sorted(counts, key=lambda kind: (-counts[kind], kind))
+    ]
+
+
+def site_kinds(pattern, nodes, hubs):
+    """Returns the kind of each of the ``nodes`` of a site, split by the
+    shares of ``pattern`` (largest remainder), with at least ``hubs`` of the
+    most common kind.
+    """
+    quotas = [share * nodes for _kind, _family, share, _fields in pattern]
+    counts = [int(quota) for quota in quotas]
+    for index in sorted(range(len(pattern)), key=lambda index: counts[index] - quotas[index])[: nodes - sum(counts)]:
+        counts[index] += 1
+    while counts[0] < min(hubs, nodes):
+        spare = max(range(1, len(counts)), key=lambda index: counts[index])
+        counts[spare] -= 1
+        counts[0] += 1
+    kinds = []
+    for (kind, _family, _share, _fields), count in zip(pattern, counts):
+        kinds.extend([kind] * count)
+    return kinds
+
+
+def port_name(kind, index):
+    """Returns the topology name of the ``index``-th data port of a node."""
+    if KIND_NETWORK_OS.get(kind) == "iosxr":
+        return "Gi0-0-0-%d" % index
+    return "eth%d" % (index + 1)
+
+
+def mgmt_address(index):
+    host = index + MGMT_OFFSET
+    return "172.20.%d.%d" % (host >> 8, host & 255)
+
+
+def link_addresses(index):
+    """Returns the two addresses of the /31 of the ``index``-th link."""
+    base = index * 2
+    prefix = "10.%d.%d." % (base >> 16 & 255, base >> 8 & 255)
+    return prefix + str(base & 255), prefix + str((base & 255) + 1)
+
+
+def build_topology(name, sites, nodes, pattern, hubs=2):
+    """Returns (topology, ports): ``ports`` maps every node to its
+    (interface, peer node, peer interface, address) tuples.
+    """
+    if sites * nodes > MAX_NODES:
+        raise ValueError("%d nodes do not fit in %s" % (sites * nodes, MGMT_SUBNET))
+    families = dict((kind, family) for kind, family, _share, _fields in pattern)
+    fields = dict((kind, kind_fields) for kind, _family, _share, kind_fields in pattern)
+    topology_nodes = {}
+    links = []
+    ports = {}
+    kinds = {}
+
+    def link(a, b):
+        ends = []
+        for node in (a, b):
+            ends.append((node, port_name(kinds[node], len(ports[node]))))
+            ports[node].append(None)
+        addresses = link_addresses(len(links))
+        for (node, interface), (peer, peer_interface), address in zip(ends, ends[::-1], addresses):
+            ports[node][-1] = (interface, peer, peer_interface, address)
+        links.append({"endpoints": ["%s:%s" % end for end in ends]})
+
+    site_hubs = []
+    for site in range(sites):
+        prefix = "S%03d" % (site + 1)
+        members = []
+        for index, kind in enumerate(site_kinds(pattern, nodes, hubs)):
+            node = "%s-R%d" % (prefix, index + 1)
+            entry = {"kind": kind}
+            entry.update(fields[kind])
+            if entry.get("startup-config"):
+                entry["startup-config"] = os.path.join(LAB_DIR, entry["startup-config"])
+            entry["mgmt-ipv4"] = mgmt_address(len(topology_nodes))
+            entry["labels"] = {"ansible-group": "site%03d_%s" % (site + 1, families[kind])}
+            topology_nodes[node] = entry
+            kinds[node] = kind
+            ports[node] = []
+            members.append(node)
+
+        hub_nodes = members[: min(hubs, len(members))]
+        for index, hub in enumerate(hub_nodes):
+            for other in hub_nodes[index + 1 :]:
+                link(hub, other)
+        for node in members[len(hub_nodes) :]:
+            for hub in hub_nodes:
+                link(hub, node)
+        site_hubs.append(hub_nodes)
+
+    # sites chained from the last hub of one to the first hub of the next
+    for previous, following in zip(site_hubs, site_hubs[1:]):
+        link(previous[-1], following[0])
+
+    topology = {
+        "name": name,
+        "mgmt": {"network": "clab-%s" % name, "ipv4-subnet": MGMT_SUBNET},
+        "topology": {"nodes": topology_nodes, "links": links},
+    }
+    return topology, ports
+
+
+def static_inventory(topology):
+    """Returns the YAML inventory tree of ``topology``: a group per kind
+    with its connection vars and a group per ansible-group label.
+    """
+    inventory = build_inventory(topology)
+    hostvars = inventory["_meta"]["hostvars"]
+    children = {}
+    for group in inventory["all"]["children"]:
+        entry = inventory[group]
+        hosts = dict(
+            (host, {"ansible_host": hostvars[host]["ansible_host"]} if "vars" in entry else None)
+            for host in entry["hosts"]
+        )
+        children[group] = dict(vars=entry["vars"], hosts=hosts) if "vars" in entry else {"hosts": hosts}
+    return {"all": {"vars": inventory["all"]["vars"], "children": children}}
+
+
+def seed_templates(lab=None, directory=RUNNING_CONFIGS_DIR):
+    """Returns {kind: running config} from the backup of the first node of
+    every kind of the lab that has one.
+    """
+    lab = lab or load_topology(TOPOLOGY)
+    templates = {}
+    for node, entry in sorted(((lab.get("topology") or {}).get("nodes") or {}).items()):
+        kind = (entry or {}).get("kind")
+        path = os.path.join(directory, "%s.cfg" % node_longname(lab, node))
+        if kind not in templates and os.path.exists(path):
+            with open(path) as f:
+                templates[kind] = f.read()
+    return templates
+
+
+def xr_seed(template, node, address, ports):
+    """Renames an IOS-XR running config to ``node`` and replaces its data
+    interfaces with those of ``ports``.
+    """
+    text = HOSTNAME_RE.sub("hostname " + node, template, 1)
+    mgmt = text.find("interface MgmtEth")
+    if mgmt >= 0:
+        end = text.find("\n!", mgmt)
+        block = MGMT_ADDRESS_RE.sub(r"\g<1>%s 255.255.0.0" % address, text[mgmt : end + 1], 1)
+        text = text[:mgmt] + MGMT_IPV6_RE.sub("", block) + text[end + 1 :]
+
+    interfaces = []
+    for interface, peer, peer_interface, link_address in ports:
+        interfaces.extend(
+            [
+                "interface GigabitEthernet%s" % interface[2:].replace("-", "/"),
+                " description to %s %s" % (peer, peer_interface),
+                " ipv4 address %s 255.255.255.254" % link_address,
+                " lldp",
+                "  enable",
+                " !",
+                "!",
+            ],
+        )
+    lines = []
+    skipping = False
+    for line in text.split("\n"):
+        if XR_PORT_BLOCK_RE.match(line):
+            if interfaces:
+                lines.extend(interfaces)
+                interfaces = []
+            skipping = True
+            continue
+        if skipping:
+            skipping = line != "!"
+            continue
+        lines.append(line)
+    if interfaces:
+        lines[-1:-1] = interfaces
+    return "\n".join(lines)
+
+
+def junos_seed(template, node, ports):
+    lines = [line for line in template.split("\n") if line]
+    lines.append("set system host-name %s" % node)
+    for interface, peer, peer_interface, link_address in ports:
+        lines.extend(
+            [
+                'set interfaces %s description "to %s %s"' % (interface, peer, peer_interface),
+                "set interfaces %s unit 0 family inet address %s/31" % (interface, link_address),
+                "set protocols lldp interface %s" % interface,
+            ],
+        )
+    return "\n".join(lines)
+
+
+def seed_config(kind, template, node, address, ports):
+    network_os = KIND_NETWORK_OS.get(kind)
+    if network_os == "iosxr":
+        return xr_seed(template, node, address, ports)
+    if network_os == "junos":
+        return junos_seed(template, node, ports)
+    return HOSTNAME_RE.sub("hostname " + node, template, 1)
+
+
+def generate_lab(directory, sites, nodes, name=None, hubs=2, lab=None):
+    """Writes the topology, the inventory and the seed configs of a lab of
+    ``sites`` x ``nodes`` to ``directory`` and returns their paths.
+    """
+    lab = lab or load_topology(TOPOLOGY)
+    name = name or "scale-%dx%d" % (sites, nodes)
+    topology, ports = build_topology(name, sites, nodes, site_pattern(lab), hubs)
+
+    configs = os.path.join(directory, "running_configs")
+    if not os.path.isdir(configs):
+        os.makedirs(configs)
+    paths = {
+        "topology": os.path.join(directory, "%s.clab.yaml" % name),
+        "inventory": os.path.join(directory, "ansible-inventory.yml"),
+        "configs": configs,
+    }
+    with open(paths["topology"], "w") as f:
+        yaml.dump(topology, f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+    with open(paths["inventory"], "w") as f:
+        yaml.dump(static_inventory(topology), f, Dumper=SafeDumper, default_flow_style=False, sort_keys=False)
+
+    templates = seed_templates(lab)
+    for node, entry in topology["topology"]["nodes"].items():
+        template = templates.get(entry["kind"])
+        if template is None:
+            continue
+        text = seed_config(entry["kind"], template, node, entry["mgmt-ipv4"], ports[node])
+        with open(os.path.join(configs, "%s.cfg" % node_longname(topology, node)), "w") as f:
+            f.write(text)
+
+    paths.update(nodes=len(topology["topology"]["nodes"]), links=len(topology["topology"]["links"]))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--nodes", type=int, default=10, help="nodes per site")
+    parser.add_argument("--hubs", type=int, default=2, help="meshed XRd nodes per site the others link to")
+    parser.add_argument("--name", help="lab name, scale-<sites>x<nodes> by default")
+    parser.add_argument("--out", default="scale-lab", help="directory the files are written to")
+    args = parser.parse_args()
+
+    if args.sites < 1 or args.nodes < 1 or args.hubs < 1:
+        parser.error("--sites, --nodes and --hubs must be positive")
+    try:
+        paths = generate_lab(args.out, args.sites, args.nodes, args.name, args.hubs)
+    except ValueError as exc:
+        parser.error(str(exc))
+    print(json.dumps(paths))
+    sys.stderr.write(
+        "%d sites x %d nodes: %d nodes, %d links written to %s\n"
+        % (args.sites, args.nodes, paths["nodes"], paths["links"], args.out),
+    )
+
+
+if __name__ == "__main__":
+    main()
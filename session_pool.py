@@ -0,0 +1,385 @@
+"""Local broker keeping warm, prompt-synchronised CLI sessions to lab nodes.
+
+The daemon listens on a unix socket and holds one CliSession per device.
+A client leases the session of a device for as long as its socket stays
+open, so the SSH login, terminal setup and prompt discovery are paid once
+per device instead of once per playbook run. Sessions are keyed on the
+device and a hash of the credentials, so a client only gets a session
+logged in with its own. Sessions idle for longer than --idle-timeout are
+closed, and a leased session that has been idle for more than
+--health-interval is probed with an empty line and redialled if the probe
+fails.
+
+Every lease starts from a clean session: the options a previous client
+changed are restored, configuration mode is left and the exec prompt is
+checked, redialling when it cannot be reached.
+
+The iosxr Cliconf attaches to the pool when ``ansible_iosxr_session_pool_socket``
+is set, through PooledConnection.
+
+    python session_pool.py serve --socket /tmp/uninet-sessions.sock
+    python session_pool.py status --socket /tmp/uninet-sessions.sock
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import socket
+import socketserver
+import threading
+import time
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.module_utils._text import to_text
+
+from cli_session import CliSession, terminal_regexes
+
+DEFAULT_SOCKET = "/tmp/uninet-sessions.sock"
+
+# session options a client may change (PooledConnection.set_option)
+RESET_OPTIONS = ("terminal_stderr_re",)
+# command leaving configuration mode without committing
+EXIT_COMMANDS = {"iosxr": "abort"}
+CONFIG_PROMPT_RE = re.compile(rb"\)#\s*$")
+EXEC_PROMPT_RE = re.compile(rb"[>#]\s*$")
+
+
+def session_key(params):
+    """Returns the pool key of ``params``: the device and a hash of the
+    credentials, which the status output must not reveal.
+    """
+    credentials = "%s\0%s" % (params.get("username") or "", params.get("password") or "")
+    digest = hashlib.sha256(credentials.encode("utf-8")).hexdigest()[:12]
+    return "%s@%s:%s/%s" % (params.get("username"), params["host"], params.get("port") or 22, digest)
+
+
+class PooledSession(object):
+    def __init__(self, key, params):
+        self.key = key
+        self.params = params
+        self.lock = threading.Lock()
+        self.session = None
+        self.options = {}
+        self.last_used = time.monotonic()
+        self.leases = 0
+
+    def ensure_open(self, health_interval):
+        if self.session is not None and self.session.connected:
+            if time.monotonic() - self.last_used < health_interval:
+                return
+            try:
+                self.session.send("")
+                return
+            except AnsibleConnectionFailure:
+                self.session.close()
+        self.session = CliSession(
+            self.params["host"],
+            self.params.get("username"),
+            self.params.get("password"),
+            port=self.params.get("port") or 22,
+            network_os=self.params.get("network_os") or "iosxr",
+        ).open()
+        self.options = dict((option, self.session.get_option(option)) for option in RESET_OPTIONS)
+
+    def lease(self, health_interval):
+        """Returns the session ready for a new client, redialled once when a
+        reused session cannot be brought back to exec mode.
+        """
+        reused = self.session is not None and self.session.connected
+        self.ensure_open(health_interval)
+        try:
+            self.reset()
+        except AnsibleConnectionFailure:
+            if not reused:
+                raise
+            self.close()
+            self.ensure_open(health_interval)
+            self.reset()
+
+    def reset(self):
+        """Undoes what the previous client may have left behind: restores
+        the options it changed, e.g. the error regexes suspended during a
+        batch, and leaves configuration mode, then checks the exec prompt.
+        The network_cli task start that would do so is skipped by pooled
+        clients.
+        """
+        session = self.session
+        for option, value in self.options.items():
+            session.set_option(option, value)
+        session.send("")
+        if CONFIG_PROMPT_RE.search(session.get_prompt() or b""):
+            network_os = self.params.get("network_os") or "iosxr"
+            session.send(EXIT_COMMANDS.get(network_os, "end"))
+        prompt = session.get_prompt() or b""
+        if CONFIG_PROMPT_RE.search(prompt) or not EXEC_PROMPT_RE.search(prompt):
+            raise AnsibleConnectionFailure(
+                "session %s did not return to exec mode: %s" % (self.key, to_text(prompt)),
+            )
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+        self.session = None
+
+
+class SessionPool(object):
+    def __init__(self, idle_timeout=600, health_interval=30):
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, params):
+        key = session_key(params)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = PooledSession(key, params)
+            return self._sessions[key]
+
+    def evict_idle(self):
+        now = time.monotonic()
+        with self._lock:
+            for key, pooled in list(self._sessions.items()):
+                if now - pooled.last_used > self.idle_timeout and pooled.lock.acquire(False):
+                    try:
+                        pooled.close()
+                        del self._sessions[key]
+                    finally:
+                        pooled.lock.release()
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "session": key,
+                    "connected": bool(pooled.session and pooled.session.connected),
+                    "leased": pooled.lock.locked(),
+                    "leases": pooled.leases,
+                    "idle": round(now - pooled.last_used, 1),
+                }
+                for key, pooled in self._sessions.items()
+            ]
+
+    def close(self):
+        with self._lock:
+            for pooled in self._sessions.values():
+                pooled.close()
+            self._sessions.clear()
+
+
+class SessionRequestHandler(socketserver.StreamRequestHandler):
+    """Serves one client: a lease request, then calls on the leased session."""
+
+    def handle(self):
+        pool = self.server.pool
+        pooled = None
+        try:
+            for line in self.rfile:
+                request = json.loads(line)
+                op = request.get("op")
+                if op == "status":
+                    self.reply(result=pool.status())
+                elif op == "lease" and pooled is None:
+                    pooled = pool.get(request["params"])
+                    pooled.lock.acquire()
+                    pooled.leases += 1
+                    try:
+                        pooled.lease(pool.health_interval)
+                    except Exception as exc:
+                        pooled.lock.release()
+                        pooled = None
+                        self.reply(error=to_text(exc))
+                        continue
+                    self.reply(result=pooled.key)
+                elif op == "call" and pooled is not None:
+                    self.call(pooled, request["method"], request.get("kwargs") or {})
+                else:
+                    self.reply(error="unexpected request %s" % op)
+        finally:
+            if pooled is not None:
+                pooled.last_used = time.monotonic()
+                pooled.lock.release()
+
+    def call(self, pooled, method, kwargs):
+        session = pooled.session
+        try:
+            if method == "get_prompt":
+                result = session.get_prompt()
+            elif method == "set_option":
+                result = session.set_option(kwargs["option"], kwargs["value"])
+            elif method in ("send", "receive", "_update_cli_prompt_context"):
+                result = getattr(session, method)(**kwargs)
+            else:
+                raise ValueError("unsupported session method %s" % method)
+        except (AnsibleConnectionFailure, ValueError) as exc:
+            self.reply(error=to_text(exc))
+            return
+        finally:
+            pooled.last_used = time.monotonic()
+        self.reply(result=to_text(result) if isinstance(result, bytes) else result)
+
+    def reply(self, **response):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class SessionPoolServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool):
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, SessionRequestHandler)
+        os.chmod(path, 0o600)
+        self.pool = pool
+
+
+class PooledConnection(object):
+    """Connection wrapper handing the CLI calls of a cliconf plugin to a
+    session leased from the pool, while everything else (options, messages)
+    is answered by the wrapped network_cli connection, which never dials.
+    """
+
+    def __init__(self, connection, socket_path, network_os="iosxr"):
+        self._wrapped = connection
+        self._socket_path = socket_path
+        self._network_os = network_os
+        self._sock = None
+        self._file = None
+
+    def __getattr__(self, name):
+        return getattr(self._wrapped, name)
+
+    @property
+    def connected(self):
+        return True
+
+    @property
+    def _terminal_stderr_re(self):
+        return terminal_regexes(self._network_os)[1]
+
+    def send(self, command, **kwargs):
+        return self._call("send", command=command, **kwargs)
+
+    def receive(self, **kwargs):
+        return self._call("receive", **kwargs)
+
+    def get_prompt(self):
+        return self._call("get_prompt")
+
+    def set_option(self, option, value):
+        self._wrapped.set_option(option, value)
+        if option == "terminal_stderr_re":
+            self._call("set_option", option=option, value=value)
+
+    def _update_cli_prompt_context(self, config_context=None, exit_command="exit"):
+        self._call(
+            "_update_cli_prompt_context",
+            config_context=config_context,
+            exit_command=exit_command,
+        )
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._file = None
+
+    def _call(self, method, **kwargs):
+        if self._sock is None:
+            self._lease()
+        kwargs = dict((key, _jsonable(value)) for key, value in kwargs.items())
+        return self._request(op="call", method=method, kwargs=kwargs)
+
+    def _lease(self):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._sock.connect(self._socket_path)
+        except (IOError, OSError) as exc:
+            self._sock = None
+            raise AnsibleConnectionFailure(
+                "unable to reach session pool at %s: %s" % (self._socket_path, to_text(exc)),
+            )
+        self._file = self._sock.makefile("rwb")
+        params = {
+            "host": self._wrapped.get_option("host"),
+            "port": self._wrapped.get_option("port"),
+            "username": self._wrapped.get_option("remote_user"),
+            "password": self._wrapped.get_option("password"),
+            "network_os": self._network_os,
+        }
+        key = self._request(op="lease", params=params)
+        self._wrapped.queue_message("vvvv", "leased pooled session %s" % key)
+
+    def _request(self, **request):
+        self._file.write(json.dumps(request).encode("utf-8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            self.close()
+            raise AnsibleConnectionFailure("session pool closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise AnsibleConnectionFailure(response["error"])
+        return response["result"]
+
+
+def _jsonable(value):
+    if isinstance(value, bytes):
+        return to_text(value, errors="surrogate_or_strict")
+    if isinstance(value, list):
+        return [_jsonable(item) for item in value]
+    return value
+
+
+def serve(args):
+    pool = SessionPool(idle_timeout=args.idle_timeout, health_interval=args.health_interval)
+    server = SessionPoolServer(args.socket, pool)
+
+    def evict():
+        while True:
+            time.sleep(min(args.idle_timeout, 10))
+            pool.evict_idle()
+
+    threading.Thread(target=evict, daemon=True).start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        os.unlink(args.socket)
+
+
+def status(args):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(args.socket)
+    stream = sock.makefile("rwb")
+    stream.write(b'{"op": "status"}\n')
+    stream.flush()
+    for entry in json.loads(stream.readline())["result"]:
+        print(json.dumps(entry))
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET)
+    actions = parser.add_subparsers(dest="action", required=True)
+    serve_parser = actions.add_parser("serve", help="run the session broker")
+    serve_parser.add_argument("--idle-timeout", type=float, default=600)
+    serve_parser.add_argument("--health-interval", type=float, default=30)
+    actions.add_parser("status", help="list the pooled sessions")
+    args = parser.parse_args()
+
+    if args.action == "serve":
+        serve(args)
+    else:
+        status(args)
+
+
+if __name__ == "__main__":
+    main()
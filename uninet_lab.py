@@ -0,0 +1,165 @@
+"""Helpers shared by the uninet lab scripts and benchmarks."""
+
+import fnmatch
+import glob
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+import yaml
+
+LAB_DIR = os.path.dirname(os.path.abspath(__file__))
+IOSXR_CLICONF = os.path.join(LAB_DIR, "MODIFIED iosxr.py")
+INVENTORY = os.path.join(LAB_DIR, "MODIFIED ansible-inventory.yml")
+RUNNING_CONFIGS_DIR = os.path.join(LAB_DIR, "running_configs")
+TOPOLOGY = os.path.join(LAB_DIR, "uninet-lab-v1.yaml")
+
+_iosxr_cliconf = None
+
+
+def load_iosxr_cliconf():
+    """Imports the modified iosxr cliconf plugin from this repository.
+
+    The plugin needs the ansible.netcommon and cisco.iosxr collections to be
+    installed, exactly as when Ansible loads it.
+    """
+    global _iosxr_cliconf
+    if _iosxr_cliconf is None:
+        spec = importlib.util.spec_from_file_location("uninet_iosxr_cliconf", IOSXR_CLICONF)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _iosxr_cliconf = module
+    return _iosxr_cliconf
+
+
+def new_iosxr_cliconf(connection, variables=None):
+    """Returns an iosxr Cliconf bound to ``connection``, with its options
+    resolved from the ansible_iosxr_* entries of the host ``variables``.
+    """
+    from ansible import constants as C
+
+    module = load_iosxr_cliconf()
+    name = "cisco.iosxr.iosxr"
+    C.config.initialize_plugin_configuration_definitions(
+        "cliconf",
+        name,
+        yaml.safe_load(module.DOCUMENTATION)["options"],
+    )
+    cliconf = module.Cliconf(connection)
+    cliconf._load_name = name
+    cliconf.set_options(var_options=variables or {})
+    return cliconf
+
+
+def load_topology(path=TOPOLOGY):
+    """Returns the parsed containerlab topology file."""
+    with open(path) as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_inventory(path=INVENTORY):
+    """Parses a YAML inventory, or the output of a Python inventory script,
+    into (hosts, groups).
+
+    ``hosts`` maps each host to its variables, merged like Ansible does:
+    parent groups before child groups, siblings by name, host vars last.
+    ``groups`` maps each group to the hosts it contains, children included.
+    """
+    if path.endswith(".py"):
+        data = script_inventory_tree(path)
+    else:
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+
+    contributions = {}
+    host_vars = {}
+    groups = {}
+
+    def walk(name, group, depth):
+        members = groups.setdefault(name, [])
+        for host, variables in (group.get("hosts") or {}).items():
+            contributions.setdefault(host, []).append((depth, name, group.get("vars") or {}))
+            host_vars.setdefault(host, {}).update(variables or {})
+            if host not in members:
+                members.append(host)
+        for child, child_group in (group.get("children") or {}).items():
+            walk(child, child_group or {}, depth + 1)
+            for host in groups[child]:
+                contributions[host].append((depth, name, group.get("vars") or {}))
+                if host not in members:
+                    members.append(host)
+
+    for name, group in data.items():
+        walk(name, group or {}, 0)
+
+    hosts = {}
+    for host, items in contributions.items():
+        variables = {"inventory_hostname": host}
+        for _depth, _name, group_vars in sorted(items, key=lambda item: item[:2]):
+            variables.update(group_vars)
+        variables.update(host_vars[host])
+        hosts[host] = variables
+    return hosts, groups
+
+
+def script_inventory_tree(path):
+    """Returns the --list output of an inventory script as the group tree
+    of a YAML inventory. Scripts defining ``inventory_list()``, such as
+    clab_inventory.py, are called in-process.
+    """
+    spec = importlib.util.spec_from_file_location("uninet_inventory_script", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if hasattr(module, "inventory_list"):
+        data = module.inventory_list()
+    else:
+        output = subprocess.check_output([sys.executable, path, "--list"])
+        data = json.loads(output)
+
+    hostvars = (data.get("_meta") or {}).get("hostvars") or {}
+
+    def group(name, seen):
+        entry = data.get(name) or {}
+        if isinstance(entry, list):
+            entry = {"hosts": entry}
+        return {
+            "hosts": dict((host, hostvars.get(host) or {}) for host in entry.get("hosts") or []),
+            "vars": entry.get("vars") or {},
+            "children": dict(
+                (child, group(child, seen | set([child])))
+                for child in entry.get("children") or []
+                if child not in seen
+            ),
+        }
+
+    return {"all": group("all", set(["all"]))}
+
+
+def select_hosts(hosts, groups, limit=None):
+    """Returns the hosts matching ``limit``, a comma separated list of host
+    or group names and shell-style patterns, in inventory order.
+    """
+    if not limit:
+        return list(hosts)
+    selected = set()
+    for pattern in limit.split(","):
+        pattern = pattern.strip()
+        for group, members in groups.items():
+            if fnmatch.fnmatch(group, pattern):
+                selected.update(members)
+        selected.update(fnmatch.filter(hosts, pattern))
+    return [host for host in hosts if host in selected]
+
+
+def running_config_files(pattern="*.cfg", path=RUNNING_CONFIGS_DIR):
+    """Returns {hostname: path} for the backed up running configs."""
+    files = {}
+    for filename in sorted(glob.glob(os.path.join(path, pattern))):
+        files[os.path.splitext(os.path.basename(filename))[0]] = filename
+    return files
+
+
+def is_iosxr_config(text):
+    return "!! IOS XR Configuration" in text
@@ -0,0 +1,924 @@
+"""Stateful IOS-XR CLI emulator for exercising the iosxr Cliconf offline.
+
+XrDevice models the prompt dialogue of an XRd node: exec, configure
+terminal/exclusive, admin mode, the target config of the session, commit
+variants (label, comment, confirmed, replace with its confirmation prompt),
+abort, clear, show running-config, show commit changes diff, show
+configuration commit list, show version/inventory, show lldp neighbors and
+show route, with as many BGP routes as asked for.
+It is seeded from a running_configs/*.cfg backup.
+
+EmulatorConnection exposes the device through the network_cli calls the
+Cliconf makes (send, receive, get_prompt, ...) over an emulated terminal
+stream: commands are echoed after the prompt, every command ends with a new
+prompt and replies may be delivered in several reads, so batching and prompt
+handling run through the same code paths as against a real device. Every
+exchange sleeps for the configured per-command latency and is counted.
+
+NetconfServer serves the same device over NETCONF on a local TCP port, with
+a per-session candidate datastore loaded through the Cisco-IOS-XR-cli-cfg
+<cli> container, for the netconf_backend of the Cliconf.
+"""
+
+import re
+import socketserver
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from xml.sax.saxutils import escape
+
+from ansible.errors import AnsibleConnectionFailure
+from ansible.module_utils._text import to_bytes, to_text
+
+from cli_session import terminal_regexes
+from netconf_backend import (
+    BASE_1_1,
+    BASE_NS,
+    CAPABILITIES,
+    CLI_NS,
+    MessageReader,
+    frame_message,
+    hello_message,
+    qualified,
+)
+from output_spool import READ_SIZE, LineSpooler
+
+INVALID_INPUT = "% Invalid input detected at '^' marker."
+REPLACE_QUESTION = (
+    "This commit will replace or remove the entire running configuration. "
+    "This operation can be service affecting.\nDo you wish to proceed? [no]: "
+)
+UNCOMMITTED_QUESTION = (
+    "Uncommitted changes found, commit them before exiting(yes/no/cancel)? [cancel]: "
+)
+NESTED_KEYWORDS = set(["lldp"])
+TOP_LEVEL_KEYWORDS = set(
+    [
+        "hostname",
+        "domain",
+        "interface",
+        "router",
+        "lldp",
+        "cdp",
+        "username",
+        "line",
+        "grpc",
+        "netconf-yang",
+        "ssh",
+        "telnet",
+        "logging",
+        "ntp",
+        "snmp-server",
+        "banner",
+        "vrf",
+        "route-policy",
+        "prefix-set",
+        "community-set",
+        "segment-routing",
+        "mpls",
+        "l2vpn",
+        "call-home",
+        "control-plane",
+    ],
+)
+SUBMODES = [
+    (re.compile(r"^interface "), "config-if"),
+    (re.compile(r"^router static"), "config-static"),
+    (re.compile(r"^lldp$"), "config-lldp"),
+    (re.compile(r"^username "), "config-un"),
+    (re.compile(r"^line "), "config-line"),
+]
+INTERFACE_RE = re.compile(r"^(gigabitethernet|mgmteth)\s*(\S+)$", re.I)
+
+
+def normalize_interface(words):
+    match = INTERFACE_RE.match(" ".join(words))
+    if not match:
+        return " ".join(words)
+    kind = "GigabitEthernet" if match.group(1).lower() == "gigabitethernet" else "MgmtEth"
+    return kind + match.group(2)
+
+
+class ConfigTree(object):
+    """Ordered config hierarchy rendered like `show running-config`."""
+
+    def __init__(self):
+        self.children = {}
+
+    def add(self, path):
+        node = self
+        for line in path:
+            node = node.children.setdefault(line, ConfigTree())
+        return node
+
+    def remove(self, path):
+        node = self
+        for line in path[:-1]:
+            node = node.children.get(line)
+            if node is None:
+                return False
+        return node.children.pop(path[-1], None) is not None
+
+    def lines(self, depth=0):
+        for line, child in self.children.items():
+            yield " " * depth + line
+            if child.children:
+                for sub in child.lines(depth + 1):
+                    yield sub
+                yield " " * depth + "!"
+
+    @classmethod
+    def parse(cls, text):
+        tree = cls()
+        stack = [(-1, tree)]
+        for raw in text.splitlines():
+            line = raw.rstrip()
+            stripped = line.strip()
+            if not stripped or stripped.startswith("!") or stripped == "end":
+                continue
+            indent = len(line) - len(line.lstrip())
+            while stack[-1][0] >= indent:
+                stack.pop()
+            node = stack[-1][1].children.setdefault(stripped, cls())
+            stack.append((indent, node))
+        return tree
+
+
+class XrDevice(object):
+    def __init__(
+        self,
+        hostname,
+        running="",
+        version="24.4.1",
+        supports_inventory=False,
+        rejected=("admin",),
+        lldp_neighbors=None,
+        files=None,
+        routes=0,
+    ):
+        self.version = version
+        self.running = ConfigTree.parse(running)
+        self.running.children.setdefault("hostname %s" % hostname, ConfigTree())
+        self.supports_inventory = supports_inventory
+        self.rejected = set(rejected)
+        self.lldp_neighbors = list(lldp_neighbors or [])
+        self.routes = routes
+        self.files = dict(files or {})
+        self.commits = []
+        self.last_change = time.strftime("%a %b %d %H:%M:%S %Y")
+        self.booted = time.monotonic()
+        self.mode = "exec"
+        self.admin = False
+        self.submode = None
+        self.context = []
+        self.last_path = []
+        self.candidate = []
+        self.question = None
+        self.question_handler = None
+        self.confirm_deadline = None
+
+    @classmethod
+    def from_backup(cls, path, hostname=None, **kwargs):
+        with open(path) as f:
+            text = f.read()
+        match = re.search(r"^hostname (\S+)", text, re.M)
+        hostname = hostname or (match.group(1) if match else "XRd")
+        if hostname and match:
+            text = text.replace(match.group(0), "hostname %s" % hostname)
+        return cls(hostname, text, **kwargs)
+
+    @property
+    def hostname(self):
+        for line in self.running.children:
+            if line.startswith("hostname "):
+                return line.split(" ", 1)[1]
+        return "ios"
+
+    @property
+    def prompt(self):
+        if self.question:
+            return self.question
+        base = "RP/0/RP0/CPU0:%s" % self.hostname
+        if self.mode == "exec":
+            return base + ("(admin)#" if self.admin else "#")
+        mode = self.submode or "config"
+        if self.admin:
+            mode = "admin-" + mode
+        return "%s(%s)#" % (base, mode)
+
+    def execute(self, line):
+        """Runs one input line and returns its output (without prompt)."""
+        self._check_confirmed_commit()
+        if self.question:
+            handler, self.question = self.question_handler, None
+            return handler(line.strip().lower())
+
+        line = line.strip()
+        if not line:
+            return ""
+        for word in line.split():
+            if word in self.rejected:
+                return self._invalid(line, word)
+        if self.mode == "exec":
+            return self._exec(line)
+        return self._config(line)
+
+    def _exec(self, line):
+        words = line.split()
+        if words[0] == "terminal":
+            return ""
+        if line == "admin":
+            self.admin = True
+            return ""
+        if line == "exit" and self.admin:
+            self.admin = False
+            return ""
+        if line in ("configure", "configure terminal", "conf t", "configure exclusive"):
+            self.mode = "exclusive" if line.endswith("exclusive") else "config"
+            self.candidate = []
+            self.context = []
+            self.last_path = []
+            self.submode = None
+            return ""
+        if line == "commit":
+            # confirms a pending `commit confirmed`
+            self.confirm_deadline = None
+            return ""
+        if words[0] == "show":
+            return self._show(line)
+        return self._invalid(line)
+
+    def _show(self, line):
+        command, _sep, pipe = line.partition("|")
+        words = command.split()
+        if words[1:2] == ["running-config"]:
+            return self._show_running(words[2:])
+        if words[1:2] in (["version"], ["ver"]):
+            output = self._show_version()
+        elif words[1:2] == ["inventory"]:
+            if not self.supports_inventory:
+                return self._invalid(line)
+            output = (
+                'NAME: "0/RP0/CPU0", DESCR: "Cisco XRd Control Plane"\n'
+                "PID: XRd-CP-C-01       , VID: V01, SN: %s\n\n"
+                'NAME: "Rack 0", DESCR: "Cisco XRd Control Plane Container"\n'
+                "PID: XRd-CP-C-01       , VID: V01, SN: 5E7AF00000" % self.serial
+            )
+        elif words[1:4] == ["configuration", "commit", "list"]:
+            output = self._show_commit_list(int(words[4]) if len(words) > 4 else 100)
+        elif words[1:3] == ["lldp", "neighbors"]:
+            output = self._show_lldp_neighbors()
+        elif words[1:2] == ["route"]:
+            output = self._show_route()
+        else:
+            return self._invalid(line)
+        return _apply_pipe(output, pipe)
+
+    @property
+    def serial(self):
+        return "5E7AF%05d" % (sum(map(ord, self.hostname)) % 100000)
+
+    def _show_version(self):
+        minutes = int((time.monotonic() - self.booted) // 60)
+        return "\n".join(
+            [
+                "Cisco IOS XR Software, Version %s LNT" % self.version,
+                "Copyright (c) 2013-2024 by Cisco Systems, Inc.",
+                "",
+                "Build Information:",
+                " Built By     : swtools",
+                " Built On     : Sat Dec 14 02:39:20 UTC 2024",
+                " Version      : %s" % self.version,
+                " Label        : %s" % self.version,
+                "",
+                "cisco XRd Control Plane",
+                "cisco XRd-CP-C-01 processor with 32GB of memory",
+                "System uptime is %d minutes" % minutes,
+                "XRd Control Plane Container",
+            ],
+        )
+
+    def _header(self):
+        return [
+            "Building configuration...",
+            "!! IOS XR Configuration %s" % self.version,
+            "!! Last configuration change at %s by admin" % self.last_change,
+        ]
+
+    def _show_running(self, section):
+        lines = self._header()
+        if section:
+            prefix = " ".join(section)
+            tree = ConfigTree()
+            for line, child in self.running.children.items():
+                if line.startswith(prefix):
+                    tree.children[line] = child
+        else:
+            tree = self.running
+        lines.extend(tree.lines())
+        if not section:
+            lines.append("end")
+        return "\n".join(lines)
+
+    def _show_commit_list(self, count):
+        lines = [
+            "SNo. Label/ID              User      Line                Client      Time Stamp",
+            "~~~~ ~~~~~~~~              ~~~~      ~~~~                ~~~~~~      ~~~~~~~~~~",
+        ]
+        for index, commit in enumerate(reversed(self.commits[-count:])):
+            lines.append(
+                "%-4d %-21s admin     vty0:node0_RP0_C    CLI         %s"
+                % (index + 1, commit["label"] or commit["id"], commit["time"]),
+            )
+        return "\n".join(lines) if self.commits else "No commits found"
+
+    def _show_lldp_neighbors(self):
+        lines = [
+            "Capability codes:",
+            "        (R) Router, (B) Bridge, (T) Telephone, (C) DOCSIS Cable Device",
+            "        (W) WLAN Access Point, (P) Repeater, (S) Station, (O) Other",
+            "",
+            "Device ID       Local Intf               Hold-time  Capability      Port ID",
+        ]
+        for neighbor in self.lldp_neighbors:
+            lines.append(
+                "%-15s %-24s %-10s %-15s %s"
+                % (neighbor[0], neighbor[1], 120, "R", neighbor[2]),
+            )
+        lines.extend(["", "Total entries displayed: %d" % len(self.lldp_neighbors)])
+        return "\n".join(lines)
+
+    def _show_route(self):
+        lines = [
+            "Codes: C - connected, S - static, R - RIP, B - BGP, (>) - Diversion path",
+            "       O - OSPF, IA - OSPF inter area, L - local, * - candidate default",
+            "",
+            "Gateway of last resort is 172.20.20.1 to network 0.0.0.0",
+            "",
+            "S*   0.0.0.0/0 [1/0] via 172.20.20.1, 00:10:41, MgmtEth0/RP0/CPU0/0",
+            "C    172.20.20.0/24 is directly connected, 00:10:41, MgmtEth0/RP0/CPU0/0",
+        ]
+        for index in range(self.routes):
+            lines.append(
+                "B    10.%d.%d.%d/32 [20/0] via 192.0.2.%d, 1d02h"
+                % (index >> 16 & 255, index >> 8 & 255, index & 255, 1 + index % 2),
+            )
+            if index % 4 == 0:
+                lines.append("               [20/0] via 192.0.2.3, 1d02h")
+        return "\n".join(lines)
+
+    def _config(self, line):
+        words = line.split()
+        if line == "abort":
+            self._leave_config()
+            return ""
+        if line == "clear":
+            self.candidate = []
+            return ""
+        if line in ("end", "exit") and (line == "end" or not self.submode):
+            if self.candidate:
+                return self._ask(UNCOMMITTED_QUESTION, self._answer_uncommitted)
+            self._leave_config()
+            return ""
+        if line in ("exit", "root", "!"):
+            self.context = [] if line == "root" else self.context[:-1]
+            self.last_path = list(self.context)
+            self.submode = None if not self.context else self.submode
+            return ""
+        if words[0] == "commit":
+            return self._commit(words[1:])
+        if words[0] == "do" and words[1:2] == ["show"]:
+            return self._show(" ".join(words[1:]))
+        if words[0] == "show":
+            if words[1:4] == ["commit", "changes", "diff"]:
+                return self._show_commit_diff()
+            if words[1:2] not in (["running-config"], ["configuration"]):
+                # exec show commands need `do` in configuration mode
+                return self._invalid(line, words[1] if len(words) > 1 else None)
+            return self._show(line)
+        if words[0] == "load":
+            text = self.files.get(words[1]) if len(words) > 1 else None
+            if text is None:
+                return "Couldn't open file %s" % (words[1] if len(words) > 1 else "")
+            for item in text.splitlines():
+                if item.strip() and not item.startswith("!") and item.strip() != "end":
+                    self._config_line(item)
+            return "Loading.\n%d bytes parsed in 1 sec (%d)bytes/sec" % (len(text), len(text))
+        return self._config_line(line)
+
+    def _config_line(self, line):
+        raw = line
+        line = line.strip()
+        negate = line.startswith("no ")
+        body = line[3:] if negate else line
+        words = body.split()
+        if not words:
+            return ""
+
+        if words[0] == "interface" and len(words) > 1:
+            name_words = words[1:3] if len(words) > 2 and "/" in words[2] else words[1:2]
+            name = normalize_interface(name_words)
+            rest = words[1 + len(name_words) :]
+            if words[1] == "preconfigure":
+                name = "preconfigure " + normalize_interface(words[2:4] if len(words) > 3 and "/" in words[3] else words[2:3])
+                rest = []
+            path = ["interface %s" % name]
+            if rest:
+                path.extend(_split_one_liner(rest))
+            elif not negate:
+                self.context = list(path)
+                self.submode = "config-if"
+        elif raw[:1] == " " and self.last_path:
+            # indentation nests the line below the lines above it
+            depth = min(len(raw) - len(raw.lstrip(" ")), len(self.last_path))
+            path = self.last_path[:depth] + [body]
+        elif self.context and (words[0] in NESTED_KEYWORDS or words[0] not in TOP_LEVEL_KEYWORDS):
+            # a command of the current sub-mode is not a global one, even
+            # when the same keyword exists at the top level
+            path = self.context + _split_one_liner(words)
+            if len(words) == 1 and words[0] in NESTED_KEYWORDS and not negate:
+                self.context = list(path)
+        elif words[0] not in TOP_LEVEL_KEYWORDS:
+            return self._invalid(line)
+        else:
+            path = [body]
+            self.context = []
+            self.submode = None
+            for regex, submode in SUBMODES:
+                if regex.match(body) and not negate:
+                    self.context = [body]
+                    self.submode = submode
+                    break
+
+        self.last_path = path
+        self.candidate.append(("-" if negate else "+", path))
+        return ""
+
+    def _commit(self, words):
+        if "confirmed" not in words:
+            # a plain commit also confirms a pending `commit confirmed`
+            self.confirm_deadline = None
+        label = words[words.index("label") + 1] if "label" in words else None
+        if words and words[0] == "replace":
+            return self._ask(REPLACE_QUESTION, lambda answer: self._answer_replace(answer, label))
+        if words and words[0] == "confirmed":
+            timeout = int(words[1]) if len(words) > 1 and words[1].isdigit() else 600
+            self.confirm_deadline = (time.monotonic() + timeout, self._snapshot())
+        self._apply(replace=False, label=label)
+        return ""
+
+    def _answer_replace(self, answer, label):
+        if answer in ("yes", "y"):
+            self._apply(replace=True, label=label)
+        return ""
+
+    def _answer_uncommitted(self, answer):
+        if answer in ("yes", "y"):
+            self._apply(replace=False)
+        if answer in ("yes", "y", "no", "n"):
+            self._leave_config()
+        return ""
+
+    def _apply(self, replace=False, label=None):
+        if not self.candidate:
+            return
+        if replace:
+            self.running = ConfigTree()
+        for op, path in self.candidate:
+            if op == "+":
+                self.running.add(path)
+            else:
+                self.running.remove(path)
+        self.candidate = []
+        self.last_change = time.strftime("%a %b %d %H:%M:%S %Y")
+        self.commits.append(
+            {
+                "id": str(1000000001 + len(self.commits)),
+                "label": label,
+                "time": time.strftime("%a %b %d %H:%M:%S %Y"),
+            },
+        )
+
+    def _snapshot(self):
+        return "\n".join(self.running.lines())
+
+    def _check_confirmed_commit(self):
+        if self.confirm_deadline and time.monotonic() > self.confirm_deadline[0]:
+            # the trial commit was not confirmed in time: roll back
+            self.running = ConfigTree.parse(self.confirm_deadline[1])
+            self.confirm_deadline = None
+
+    def _show_commit_diff(self):
+        lines = self._header()
+        previous = []
+        for op, path in self.candidate:
+            for depth, line in enumerate(path):
+                if depth < len(path) - 1 and previous[: depth + 1] == path[: depth + 1]:
+                    continue
+                lines.append("%s%s%s" % (op if depth == len(path) - 1 else " ", " " * (depth + 2), line))
+            previous = path
+        lines.append("end")
+        return "\n".join(lines)
+
+    def _invalid(self, line, word=None):
+        """Error output with the '^' marker under ``word`` of ``line``, as
+        the CLI prints it below the prompt and the echoed command.
+        """
+        column = len(self.prompt) + (line.index(word) if word else 0)
+        return " " * column + "^\n" + INVALID_INPUT
+
+    def _leave_config(self):
+        self.mode = "exec"
+        self.candidate = []
+        self.context = []
+        self.last_path = []
+        self.submode = None
+
+    def _ask(self, question, handler):
+        self.question = question
+        self.question_handler = handler
+        return ""
+
+
+def _split_one_liner(words):
+    path = []
+    while words and words[0] in NESTED_KEYWORDS and len(words) > 1:
+        path.append(words[0])
+        words = words[1:]
+    path.append(" ".join(words))
+    return path
+
+
+def _apply_pipe(output, pipe):
+    pipe = pipe.strip()
+    match = re.match(r"utility head -n (\d+)$", pipe)
+    if match:
+        return "\n".join(output.splitlines()[: int(match.group(1))])
+    match = re.match(r"(?:include|i) (.+)$", pipe)
+    if match:
+        return "\n".join(line for line in output.splitlines() if match.group(1) in line)
+    return output
+
+
+class EmulatorConnection(object):
+    """network_cli stand-in talking to an XrDevice over an emulated terminal.
+
+    ``latency`` is slept once per exchange, or looked up per command when it
+    is a dict ({command prefix: seconds, None: default}). ``split_replies``
+    returns each reply as soon as the first prompt shows up, to exercise the
+    callers that must keep reading.
+    """
+
+    def __init__(self, device, latency=0.0, split_replies=False, host=None):
+        self.device = device
+        self.latency = latency
+        self.split_replies = split_replies
+        self.messages = []
+        self.round_trips = 0
+        self.prompt_queries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._options = {"host": host or device.hostname, "terminal_stderr_re": None}
+        self._terminal_stdout_re, self._default_stderr_re = terminal_regexes("iosxr")
+        self._terminal_stderr_re = self._default_stderr_re
+        self._pending = []
+        self._matched_prompt = to_bytes(device.prompt)
+
+    @property
+    def connected(self):
+        return True
+
+    def get_option(self, option):
+        return self._options.get(option)
+
+    def set_option(self, option, value):
+        self._options[option] = value
+
+    def queue_message(self, level, message):
+        self.messages.append((level, message))
+
+    def get_prompt(self):
+        self.prompt_queries += 1
+        return self._matched_prompt
+
+    def send(
+        self,
+        command,
+        prompt=None,
+        answer=None,
+        newline=True,
+        sendonly=False,
+        prompt_retry_check=False,
+        check_all=False,
+        strip_prompt=True,
+    ):
+        command = to_text(command)
+        self._write(command)
+        if sendonly:
+            return None
+        response = self.receive(to_bytes(command), prompt, answer, newline, prompt_retry_check, check_all, strip_prompt)
+        return to_text(response, errors="surrogate_then_replace")
+
+    def receive(
+        self,
+        command=None,
+        prompts=None,
+        answer=None,
+        newline=True,
+        prompt_retry_check=False,
+        check_all=False,
+        strip_prompt=True,
+    ):
+        self.round_trips += 1
+        self._sleep(command)
+        self._terminal_stderr_re = self._stderr_regexes()
+        prompts = [re.compile(to_bytes(p), re.I) for p in _as_list(prompts)]
+        answers = [to_text(a) for a in _as_list(answer)]
+        recv = []
+        errored = None
+
+        while True:
+            if not self._pending:
+                question = self.device.question
+                if question and prompts:
+                    for index, regex in enumerate(prompts):
+                        if regex.search(to_bytes(question)):
+                            reply = answers[index] if len(answers) > index else answers[0]
+                            if check_all and len(prompts) > 1:
+                                prompts.pop(index)
+                                answers.pop(index)
+                            else:
+                                prompts = []
+                            self._write(reply)
+                            break
+                    else:
+                        raise AnsibleConnectionFailure("unexpected question: %s" % question)
+                    continue
+                raise AnsibleConnectionFailure("no response pending from %s" % self.device.hostname)
+
+            chunk = self._pending.pop(0)
+            self.bytes_received += len(chunk)
+            recv.append(chunk)
+            data = to_bytes(chunk)
+            if any(regex.search(data) for regex in self._terminal_stderr_re):
+                errored = data
+            if self.device.question and not self._pending:
+                continue
+            if self._pending and not self.split_replies:
+                continue
+            self._matched_prompt = to_bytes(self.device.prompt)
+            if errored:
+                raise AnsibleConnectionFailure(to_text(errored))
+            return self._sanitize(to_bytes("".join(recv)), command, strip_prompt)
+
+    def send_spooled(self, command, output):
+        """Same as CliSession.send_spooled: the reply is written to ``output``
+        in READ_SIZE chunks, as a device would stream it.
+        """
+        command = to_text(command)
+        self._write(command)
+        self.round_trips += 1
+        self._sleep(to_bytes(command))
+        self._terminal_stderr_re = self._stderr_regexes()
+        spooler = LineSpooler(output, to_bytes(command), self._matched_prompt)
+        errored = None
+        while self._pending:
+            chunk = to_bytes(self._pending.pop(0))
+            self.bytes_received += len(chunk)
+            if any(regex.search(chunk) for regex in self._terminal_stderr_re):
+                errored = chunk
+            for offset in range(0, len(chunk), READ_SIZE):
+                spooler.feed(chunk[offset : offset + READ_SIZE])
+            del chunk
+        if self.device.question:
+            raise AnsibleConnectionFailure("unexpected question: %s" % self.device.question)
+        self._matched_prompt = to_bytes(self.device.prompt)
+        if errored:
+            raise AnsibleConnectionFailure(to_text(errored))
+        return spooler.finish(self._matched_prompt)
+
+    def _update_cli_prompt_context(self, config_context=None, exit_command="exit"):
+        if config_context and to_text(self.get_prompt()).strip().endswith(config_context):
+            self.send(exit_command)
+
+    def _write(self, data):
+        self.bytes_sent += len(data) + 1
+        for line in data.split("\r"):
+            output = self.device.execute(line)
+            chunk = line + "\n"
+            if output:
+                chunk += output + "\n"
+            self._pending.append(chunk + self.device.prompt)
+
+    def _sleep(self, command):
+        latency = self.latency
+        if isinstance(latency, dict):
+            text = to_text(command or b"")
+            latency = next(
+                (value for prefix, value in latency.items() if prefix and text.startswith(prefix)),
+                latency.get(None, 0.0),
+            )
+        if latency:
+            time.sleep(latency)
+
+    def _stderr_regexes(self):
+        option = self._options.get("terminal_stderr_re")
+        if not option:
+            return self._default_stderr_re
+        return [re.compile(to_bytes(item["pattern"])) for item in option]
+
+    def _sanitize(self, recv, command=None, strip_prompt=True):
+        prompt = self._matched_prompt.strip()
+        cleaned = []
+        for line in recv.splitlines():
+            if command and line.strip() == command.strip():
+                continue
+            if strip_prompt and prompt in line:
+                continue
+            cleaned.append(line)
+        return b"\n".join(cleaned).strip()
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+class NetconfRpcError(Exception):
+    def __init__(self, tag, message):
+        super(NetconfRpcError, self).__init__(message)
+        self.tag = tag
+        self.message = message
+
+
+class NetconfAgent(object):
+    """Answers the NETCONF operations of one session against an XrDevice:
+    get-config, edit-config (merge or replace of <cli> text into the
+    candidate), commit (optionally confirmed), discard-changes, lock, unlock
+    and close-session.
+    """
+
+    def __init__(self, device, latency=0.0):
+        self.device = device
+        self.latency = latency
+        self.candidate = []
+        self.replace = False
+        self.rpcs = 0
+
+    def handle(self, message):
+        """Returns the <rpc-reply> to an <rpc> message."""
+        self.rpcs += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rpc = ET.fromstring(message)
+        message_id = rpc.get("message-id", "")
+        operation = rpc[0] if len(rpc) else None
+        name = operation.tag.split("}")[-1] if operation is not None else ""
+        handler = getattr(self, "_" + name.replace("-", "_"), None)
+        self.device._check_confirmed_commit()
+        try:
+            if handler is None:
+                raise NetconfRpcError("operation-not-supported", "unsupported operation %s" % name)
+            body = handler(operation) or "<ok/>"
+        except NetconfRpcError as exc:
+            body = (
+                "<rpc-error><error-type>application</error-type><error-tag>%s</error-tag>"
+                "<error-severity>error</error-severity><error-message>%s</error-message></rpc-error>"
+                % (exc.tag, escape(exc.message))
+            )
+        return '<rpc-reply message-id="%s" xmlns="%s">%s</rpc-reply>' % (message_id, BASE_NS, body)
+
+    def _datastore(self, operation):
+        source = operation.find(qualified("source"))
+        if source is None:
+            source = operation.find(qualified("target"))
+        name = source[0].tag.split("}")[-1] if source is not None and len(source) else ""
+        if name not in ("running", "candidate"):
+            raise NetconfRpcError("invalid-value", "unsupported datastore %s" % name)
+        return name
+
+    def _get_config(self, operation):
+        if self._datastore(operation) == "running":
+            text = self.device._snapshot()
+        else:
+            tree = ConfigTree() if self.replace else ConfigTree.parse(self.device._snapshot())
+            for op, path in self.candidate:
+                if op == "+":
+                    tree.add(path)
+                else:
+                    tree.remove(path)
+            text = "\n".join(tree.lines())
+        return '<data><cli xmlns="%s">%s</cli></data>' % (CLI_NS, escape(text))
+
+    def _edit_config(self, operation):
+        if self._datastore(operation) != "candidate":
+            raise NetconfRpcError("operation-not-supported", "only the candidate datastore is writable")
+        cli = operation.find("%s/%s" % (qualified("config"), qualified("cli", CLI_NS)))
+        if cli is None:
+            raise NetconfRpcError("unknown-element", "only <cli> configuration is supported")
+        if operation.findtext(qualified("default-operation")) == "replace":
+            self.replace = True
+            self.candidate = []
+
+        # the lines are parsed as typed into a configuration session of
+        # their own, leaving the CLI session of the device as it was
+        device = self.device
+        saved = (device.mode, device.submode, device.context, device.candidate)
+        device.mode, device.submode, device.context, device.candidate = "config", None, [], []
+        try:
+            for line in (cli.text or "").splitlines():
+                line = line.strip()
+                if not line or line == "end" or (line == "exit" and not device.submode):
+                    continue
+                if line.split()[0] in ("abort", "clear", "commit", "load", "show"):
+                    raise NetconfRpcError("invalid-value", "%s is not a configuration line" % line)
+                if device._config(line):
+                    raise NetconfRpcError("invalid-value", "%s\n%s" % (line, INVALID_INPUT))
+            self.candidate.extend(device.candidate)
+        finally:
+            device.mode, device.submode, device.context, device.candidate = saved
+
+    def _commit(self, operation):
+        device = self.device
+        if operation.find(qualified("confirmed")) is not None:
+            timeout = int(operation.findtext(qualified("confirm-timeout")) or 600)
+            device.confirm_deadline = (time.monotonic() + timeout, device._snapshot())
+        else:
+            device.confirm_deadline = None
+        saved = device.candidate
+        device.candidate = self.candidate
+        try:
+            device._apply(replace=self.replace)
+        finally:
+            device.candidate = saved
+        self.candidate = []
+        self.replace = False
+
+    def _discard_changes(self, operation):
+        self.candidate = []
+        self.replace = False
+
+    def _lock(self, operation):
+        self._datastore(operation)
+
+    def _unlock(self, operation):
+        self._datastore(operation)
+
+    def _close_session(self, operation):
+        self._discard_changes(operation)
+
+
+class NetconfRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        sock = self.request
+        agent = NetconfAgent(server.device, server.latency)
+        capabilities = CAPABILITIES + [CLI_NS]
+        sock.sendall(frame_message(hello_message(capabilities, session_id=id(agent) % 65536), chunked=False))
+        reader = MessageReader(sock.recv)
+        try:
+            hello = ET.fromstring(reader.read(chunked=False))
+            chunked = BASE_1_1 in [(cap.text or "").strip() for cap in hello.iter(qualified("capability"))]
+            while True:
+                message = reader.read(chunked)
+                with server.lock:
+                    reply = agent.handle(message)
+                sock.sendall(frame_message(reply, chunked))
+                if b"close-session" in message:
+                    return
+        except AnsibleConnectionFailure:
+            return
+        finally:
+            server.rpcs += agent.rpcs
+
+
+class NetconfServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Stand-in NETCONF agent of an XrDevice on a local TCP port; port 0
+    picks a free one, see ``port``.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, device, host="127.0.0.1", port=0, latency=0.0):
+        socketserver.TCPServer.__init__(self, (host, port), NetconfRequestHandler)
+        self.device = device
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.rpcs = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()